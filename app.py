@@ -2,33 +2,123 @@
 
 import streamlit as st
 import tempfile
-import os
+import time
 from pathlib import Path
-from app.processors.video_processor import VideoProcessor
-from app.processors.audio_processor import AudioProcessor
-from app.processors.link_processor import LinkDownloader
+from urllib.parse import urlsplit
+from app.processors.separation_engine import set_worker_threads
+from app.processors.stem_cache import StemCache
+from app.processors.job_queue import JobQueue, QUEUED, RUNNING, FAILED
+from app.processors.warmup import warm_up
+from app.processors.pipeline import run_audio_job, run_video_job, run_url_job, run_preset_job
+from app.processors.audio_io import STEM_FORMATS, stem_format_for
+from app.processors.stem_mixer import derive_mix, mix_name, stem_names
+from app.server.file_server import FileServer, save_stream
+from app.processors import metrics
+from app.config import settings
+from app.config.presets import PRESETS, DEFAULT_PRESET, threads_per_worker
 # Initialize session state for tracking processing status
 if 'processing_complete' not in st.session_state:
     st.session_state.processing_complete = False
 if 'current_tab' not in st.session_state:
     st.session_state.current_tab = "URL Processing 🔗"
+if 'jobs' not in st.session_state:
+    st.session_state.jobs = []
+if 'mixes' not in st.session_state:
+    st.session_state.mixes = {}
+
+
+@st.cache_resource
+def load_stem_cache():
+    return StemCache(settings.STEM_CACHE_DIR, settings.STEM_CACHE_MAX_BYTES)
+
+
+def start_job_workers():
+    # Runs on the job queue's own thread, so importing torch and loading the
+    # model never hold up the first page render
+    # Torch threads are per process, so they follow the server's default preset
+    set_worker_threads(settings.SEPARATION_WORKERS, threads_per_worker(DEFAULT_PRESET, settings.SEPARATION_WORKERS))
+    if settings.WARMUP:
+        warm_up([DEFAULT_PRESET])
+
+
+@st.cache_resource
+def load_job_queue():
+    # One bounded worker pool per server process, shared by every session
+    metrics.configure_logging(settings.METRICS_FILE)
+    if settings.FILE_SERVER_ENABLED:
+        # Started up front so /metrics is scrapeable before the first download link
+        load_file_server()
+    return JobQueue(
+        settings.JOBS_DIR, settings.SEPARATION_WORKERS, settings.JOB_RESULT_TTL_SECONDS, on_start=start_job_workers
+    )
+
+
+@st.cache_resource
+def load_file_server():
+    return FileServer(settings.FILE_SERVER_HOST, settings.FILE_SERVER_PORT, settings.FILE_SERVER_PUBLIC_URL)
 
 
 # Utility functions
 def save_uploaded_file(uploaded_file, temp_dir):
-    file_path = Path(temp_dir) / uploaded_file.name
-    with open(file_path, 'wb') as f:
-        f.write(uploaded_file.read())
-    return file_path
-
+    # Copied in chunks so the upload is not duplicated into one big bytes object.
+    # Streamlit itself still holds the whole upload in memory until the rerun ends
+    return save_stream(uploaded_file, Path(temp_dir) / uploaded_file.name)
+
+
+def stage_upload(uploaded_file):
+    """Save an upload where the job that picks it up can take ownership of it"""
+    staging_root = settings.JOBS_DIR / "uploads"
+    staging_root.mkdir(parents=True, exist_ok=True)
+    with metrics.stage("upload") as record:
+        path = save_uploaded_file(uploaded_file, tempfile.mkdtemp(dir=staging_root))
+        record.add_output(path)
+    return path
+
+
+def file_server_url():
+    """Base URL the browser reaches the file server on, or None if it cannot be told.
+
+    SPLITTER_FILE_SERVER_PUBLIC_URL wins; otherwise the host this page was
+    requested from, on the file server's port. The file server only speaks
+    plain HTTP, and browsers block http: downloads from an https: page, so
+    behind TLS there is no URL without SPLITTER_FILE_SERVER_PUBLIC_URL.
+    """
+    if settings.FILE_SERVER_PUBLIC_URL:
+        return settings.FILE_SERVER_PUBLIC_URL
+    try:
+        # No public API for the request headers in this Streamlit version
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+
+        headers = _get_websocket_headers() or {}
+    except Exception:
+        return None
+    # The scheme the browser used, as a TLS-terminating proxy reports it or as the page's origin shows
+    scheme = headers.get("X-Forwarded-Proto") or urlsplit(headers.get("Origin") or "").scheme or "http"
+    if scheme.split(",")[0].strip().lower() != "http":
+        return None
+    host = headers.get("Host")
+    hostname = urlsplit(f"//{host}").hostname if host else None
+    if not hostname:
+        return None
+    if ":" in hostname:
+        hostname = f"[{hostname}]"
+    return f"http://{hostname}:{settings.FILE_SERVER_PORT}"
+
+
+def download_file_button(file_path, label, file_name, mime_type, key=None):
+    base_url = file_server_url() if settings.FILE_SERVER_ENABLED else None
+    if base_url:
+        # Streamed from disk by the file server; nothing is read into this process
+        st.link_button(label, load_file_server().register(file_path, file_name, mime_type, base_url))
+        return
 
-def download_file_button(file_path, label, file_name, mime_type):
     with open(file_path, 'rb') as f:
         if st.download_button(
                 label=label,
                 data=f.read(),
                 file_name=file_name,
-                mime=mime_type
+                mime=mime_type,
+                key=key
         ):
             # Reset the processing state after download
             st.session_state.processing_complete = False
@@ -39,178 +129,103 @@ def reset_processing_state():
     st.session_state.processing_complete = False
 
 
-def process_audio(audio_file):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        input_path = save_uploaded_file(audio_file, temp_dir)
-        output_dir = Path(temp_dir) / "output"
-        output_dir.mkdir(exist_ok=True)
-
-        with st.spinner("Processing audio..."):
-            try:
-                audio_proc = AudioProcessor(input_path, output_dir)
-                if not audio_proc.run_demucs():
-                    raise RuntimeError("Demucs processing failed.")
-
-                vocals_path = audio_proc.get_vocals_path()
-                no_vocals_path = audio_proc.get_no_vocals_path()
-
-                if not vocals_path or not no_vocals_path:
-                    raise FileNotFoundError("Processed files not found.")
-
-                col1, col2 = st.columns(2)
-                with col1:
-                    download_file_button(
-                        vocals_path,
-                        "Download Vocals",
-                        f"vocals_{audio_file.name.rsplit('.', 1)[0]}.wav",
-                        "audio/wav"
-                    )
+def submit_job(kind, job_fn, source, label, **options):
+    # The preset's engine is loaded by the job worker, never on this script thread
+    job_id = load_job_queue().submit(
+        kind, run_preset_job, job_fn, source, st.session_state.preset, load_stem_cache(), label=label,
+        output_format=st.session_state.stem_format, bitrate=st.session_state.stem_bitrate or None,
+        **options
+    )
+    st.session_state.jobs.append(job_id)
+    reset_processing_state()
 
-                st.success("Audio processing completed!")
-                st.session_state.processing_complete = True
 
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                reset_processing_state()
+def process_audio(audio_file):
+    submit_job("audio", run_audio_job, stage_upload(audio_file), audio_file.name)
 
 
 def process_video(video_file):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        input_path = save_uploaded_file(video_file, temp_dir)
-        output_dir = Path(temp_dir) / "output"
-        output_dir.mkdir(exist_ok=True)
-
-        with st.spinner("Processing video..."):
-            try:
-                video_proc = VideoProcessor(input_path, output_dir)
-                audio_path = video_proc.extract_audio()
-                if not audio_path:
-                    raise RuntimeError("Audio extraction from video failed.")
-
-                audio_proc = AudioProcessor(audio_path, output_dir)
-                if not audio_proc.run_demucs():
-                    raise RuntimeError("Demucs processing failed.")
-
-                vocals_path = audio_proc.get_vocals_path()
-                no_vocals_path = audio_proc.get_no_vocals_path()
-                if not vocals_path or not no_vocals_path:
-                    raise FileNotFoundError("Processed audio files not found.")
-
-                final_video_path = video_proc.combine_video_audio(vocals_path)
-
-                col1, col2 = st.columns(2)
-                if final_video_path:
-                    with col1:
-                        download_file_button(
-                            final_video_path,
-                            "Download Processed Video",
-                            f"processed_{video_file.name}",
-                            "video/mp4"
-                        )
-                with col2:
-                    download_file_button(
-                        vocals_path,
-                        "Download Vocals",
-                        f"vocals_{video_file.name.rsplit('.', 1)[0]}.wav",
-                        "audio/wav"
-                    )
-
-                st.success("Video processing completed!")
-                st.session_state.processing_complete = True
-
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                reset_processing_state()
-
-
-def process_url(url):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            output_dir = Path(temp_dir) / "downloaded"
-            output_dir.mkdir(exist_ok=True)
-
-            with st.spinner("Downloading video..."):
-                downloader = LinkDownloader(output_dir)
-                video_path = downloader.download_from_url(url)
-
-                if not video_path:
-                    st.error("Video download failed")
-                    return
-
-                # Add extensive logging and checks
-                #st.write(f"Downloaded video path: {video_path}")
-                #st.write(f"Video file exists: {os.path.exists(video_path)}")
-
+    submit_job("video", run_video_job, stage_upload(video_file), video_file.name)
+
+
+def process_url(url, want_video=True):
+    submit_job("url", run_url_job, url, url, want_video=want_video)
+
+
+def tracked_jobs():
+    jobs = load_job_queue()
+    tracked = (jobs.get(job_id) for job_id in st.session_state.jobs)
+    return [job for job in tracked if job is not None]
+
+
+def render_job(job):
+    if job.status == QUEUED:
+        st.info(f"{job.label}: waiting in queue (position {load_job_queue().position(job.id)})")
+        return
+    if job.status == RUNNING:
+        st.info(f"{job.label}: processing... ({time.time() - job.started_at:.0f}s)")
+        return
+    if job.status == FAILED:
+        st.error(f"{job.label}: an error occurred: {job.error}")
+        return
+
+    def stem_file_name(name, path):
+        if job.kind == "url":
+            return f"{name}{Path(path).suffix}"
+        return f"{name}_{job.label.rsplit('.', 1)[0]}{Path(path).suffix}"
+
+    def stem_button(name, path, label):
+        download_file_button(
+            path, label, stem_file_name(name, path), stem_format_for(path)[1]["mime"], key=f"{job.id}-{name}"
+        )
+
+    video_name = "processed_video.mp4" if job.kind == "url" else f"processed_{job.label}"
+    col1, col2 = st.columns(2)
+    if "video" in job.result:
+        with col1:
+            download_file_button(
+                job.result["video"],
+                "Download Processed Video",
+                video_name,
+                "video/mp4",
+                key=f"{job.id}-video"
+            )
+    with (col2 if "video" in job.result else col1):
+        stem_button("vocals", job.result["vocals"], "Download Vocals")
+
+    # Videos with several audio tracks also carry every other track's stems
+    stems = stem_names(job.result)
+    with st.expander("Other stems and mixes"):
+        for name in job.result:
+            if name not in ("vocals", "video"):
+                stem_button(name, job.result[name], f"Download {name.replace('_', ' ')}")
+        if len(stems) > 2:
+            # Mixes are sums of the stored stems, so they take seconds and never rerun the model
+            chosen = st.multiselect(
+                "Mix stems", stems, default=[name for name in stems if name != "vocals"], key=f"{job.id}-mix"
+            )
+            name = mix_name(chosen, stems) if chosen else None
+            if name and name not in job.result and st.button(f"Prepare {name}", key=f"{job.id}-mix-{name}"):
                 try:
-                    video_file_size = os.path.getsize(video_path)
-                    #
-                    #(f"Video file size: {video_file_size} bytes")
-
-                    if video_file_size == 0:
-                        st.error("Downloaded video file is empty")
-                        return
-                except Exception as size_error:
-                    st.error(f"Error checking file size: {size_error}")
-                    return
-
-            # Rest of the processing remains the same...
-            st.info("Processing video...")
-            process_dir = Path(temp_dir) / "output"
-            process_dir.mkdir(exist_ok=True)
-
-            video_proc = VideoProcessor(video_path, process_dir)
-            audio_path = video_proc.extract_audio()
-
-            if not audio_path:
-                st.error("Audio extraction failed")
-                return
-
-            st.info("Separating vocals...")
-            audio_proc = AudioProcessor(audio_path, process_dir)
-            if not audio_proc.run_demucs():
-                st.error("Demucs processing failed")
-                return
-
-            vocals_path = audio_proc.get_vocals_path()
-            no_vocals_path = audio_proc.get_no_vocals_path()
-
-            if not vocals_path or not no_vocals_path:
-                st.error("Processed audio files not found")
-                return
-
-            st.info("Creating final video...")
-            final_video_path = video_proc.combine_video_audio(vocals_path)
-
-            if not final_video_path:
-                st.error("Final video creation failed")
-                return
-
-            col1, col2 = st.columns(2)
-            if final_video_path:
-                with col1:
-                    download_file_button(
-                        final_video_path,
-                        "Download Processed Video",
-                        "processed_video.mp4",
-                        "video/mp4"
+                    st.session_state.mixes[job.id, name] = derive_mix(
+                        job.result, chosen, Path(job.work_dir) / "mixes", bitrate=st.session_state.stem_bitrate or None
                     )
+                except Exception as e:
+                    st.error(f"Could not mix {name}: {e}")
+            if (job.id, name) in st.session_state.mixes:
+                stem_button(name, st.session_state.mixes[job.id, name], f"Download {name.replace('_', ' ')}")
+    st.success(f"{job.label}: processing completed!")
 
-            if vocals_path:
-                with col2:
-                    download_file_button(
-                        vocals_path,
-                        "Download Vocals",
-                        "vocals.wav",
-                        "audio/wav"
-                    )
-
-            st.success("Video processing completed!")
-            st.session_state.processing_complete = True
 
-        except Exception as e:
-            st.error(f"An error occurred: {str(e)}")
-            import traceback
-            traceback.print_exc()  # This will print the full traceback
+def render_jobs():
+    jobs = tracked_jobs()
+    if not jobs:
+        return
+    st.header("Jobs")
+    for job in reversed(jobs):
+        render_job(job)
+    if not any(job.active for job in jobs):
+        st.session_state.processing_complete = True
 
 
 # Page config
@@ -223,6 +238,30 @@ st.set_page_config(
 # Main App Layout
 st.title("🎵 Audio/Video Music Separator")
 
+# Output options, read when a job is submitted
+with st.sidebar:
+    st.header("Output")
+    st.selectbox(
+        "Quality preset",
+        list(PRESETS),
+        index=list(PRESETS).index(DEFAULT_PRESET),
+        key="preset",
+        format_func=lambda name: PRESETS[name]["label"],
+        help="\n\n".join(f"**{preset['label']}**: {preset['description']}" for preset in PRESETS.values())
+    )
+    st.selectbox(
+        "Stem format",
+        list(STEM_FORMATS),
+        key="stem_format",
+        help="Compressed formats are encoded while separating; AAC, MP3 and Opus vocals "
+             "are copied into processed videos without a second encode."
+    )
+    st.text_input(
+        "Bitrate (lossy formats)",
+        key="stem_bitrate",
+        placeholder=STEM_FORMATS[st.session_state.stem_format]["bitrate"] or "lossless"
+    )
+
 # Tabs for different processing types
 tab1, tab2, tab3 = st.tabs(["URL Processing 🔗", "Audio Processing 🎧", "Video Processing 🎥"])
 
@@ -237,8 +276,9 @@ with tab1:
 
     if not st.session_state.processing_complete:
         url = st.text_input("Enter video URL")
+        vocals_only = st.checkbox("Vocals only (download just the audio, no processed video)")
         if url and st.button("Process URL"):
-            process_url(url)
+            process_url(url, want_video=not vocals_only)
 
 with tab2:
     st.header("Process Your Audio File")
@@ -268,10 +308,14 @@ with tab3:
         if video_file and st.button("Process Video"):
             process_video(video_file)
 
+render_jobs()
+
 # Add a reset button when processing is complete
 if st.session_state.processing_complete:
     if st.button("Process Another File"):
         reset_processing_state()
+        st.session_state.jobs = []
+        st.session_state.mixes = {}
         st.experimental_rerun()
 
 
@@ -286,6 +330,7 @@ with st.sidebar:
     - Upload and process audio files
     - Upload and process video files
     - Extract vocals
+    - Download drums, bass and the other stems, or any mix of them
     - Download processed files
     - Click process another file
     """)
@@ -294,4 +339,9 @@ with st.sidebar:
 st.markdown("""
 ---
 Made with ❤️ using [Streamlit](https://streamlit.io)
-""")
\ No newline at end of file
+""")
+
+# Poll running jobs; their results live in the job queue, not in this rerun
+if any(job.active for job in tracked_jobs()):
+    time.sleep(settings.JOB_POLL_SECONDS)
+    st.experimental_rerun()
@@ -0,0 +1,245 @@
+"""Headless batch processing without Streamlit.
+
+Examples, from the repository root:
+
+    python -m app.cli ~/music -o ~/separated
+    python -m app.cli --manifest inputs.txt -o out --format flac --summary out/summary.json
+
+A manifest is a text file with one path or URL per line (blank lines and
+lines starting with # are ignored) or a JSON list of them. Inputs whose
+outputs already exist are skipped, so an interrupted run can simply be
+started again.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from app.config import settings
+from app.config.presets import PRESETS, DEFAULT_PRESET, DEFAULT_BACKEND, engine_options, threads_per_worker
+from app.processors import metrics
+from app.processors.audio_io import STEM_FORMATS, probe_duration
+from app.processors.link_processor import LinkDownloader
+from app.processors.separation_engine import BACKENDS
+from app.processors.stem_mixer import DEFAULT_SOURCES, mix_name, mix_stems
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".ogg", ".flac", ".m4a", ".aac", ".opus"}
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".avi", ".mov", ".webm"}
+
+logger = logging.getLogger("app.cli")
+
+
+def is_url(source):
+    return source.startswith(("http://", "https://", "file://"))
+
+
+def discover_inputs(paths, manifest=None):
+    """Expand directories and manifests into (source, name) pairs"""
+    sources = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            for file in sorted(path.rglob("*")):
+                if file.suffix.lower() in AUDIO_EXTENSIONS | VIDEO_EXTENSIONS:
+                    sources.append((str(file), str(file.relative_to(path).with_suffix(""))))
+        else:
+            sources.append((str(path), path.stem))
+
+    if manifest:
+        text = Path(manifest).read_text()
+        if text.lstrip().startswith("["):
+            entries = json.loads(text)
+        else:
+            entries = [line.strip() for line in text.splitlines()]
+        for entry in entries:
+            if not entry or entry.startswith("#"):
+                continue
+            if is_url(entry):
+                key = LinkDownloader(tempfile.gettempdir()).media_key(entry)
+                sources.append((entry, "_".join(key)))
+            else:
+                sources.append((entry, Path(entry).stem))
+    return sources
+
+
+def input_kind(source):
+    if is_url(source):
+        return "url"
+    if Path(source).suffix.lower() in VIDEO_EXTENSIONS:
+        return "video"
+    return "audio"
+
+
+def stored_stems():
+    """Stems every separation writes under the current settings"""
+    return list(DEFAULT_SOURCES) if settings.ALL_STEMS else ["vocals", "no_vocals"]
+
+
+def expected_outputs(output_dir, kind, output_format, want_video, mixes=("no_vocals",)):
+    extension = STEM_FORMATS[output_format]["extension"]
+    names = stored_stems() + [mix for mix in mixes if mix not in stored_stems()]
+    outputs = {name: output_dir / f"{name}{extension}" for name in names}
+    if kind == "video" or (kind == "url" and want_video):
+        outputs["video"] = output_dir / "video.mp4"
+    return outputs
+
+
+def _init_worker(workers, threads, preset=DEFAULT_PRESET, downloads=False, backend=DEFAULT_BACKEND):
+    from app.processors.separation_engine import set_worker_threads
+    from app.processors.warmup import warm_up
+
+    logging.basicConfig(level=logging.INFO, format="%(processName)s %(levelname)s %(message)s")
+    metrics.configure_logging(settings.METRICS_FILE)
+    set_worker_threads(workers, threads)
+    if settings.WARMUP:
+        # Every worker starts loading its model as soon as the pool starts, not on its first input
+        warm_up([preset], downloads=downloads, backend=backend)
+
+
+def process_input(source, output_dir, output_format, bitrate, want_video, use_cache, preset=DEFAULT_PRESET,
+                  backend=DEFAULT_BACKEND, mixes=("no_vocals",)):
+    """Run one input through the pipeline in a worker process and move results into output_dir"""
+    from app.processors.pipeline import process_video_file, run_url_job, separate_audio
+    from app.processors.separation_engine import get_engine
+    from app.processors.stem_cache import StemCache
+    from app.processors.stem_mixer import derive_mix
+
+    engine = get_engine(**engine_options(preset, backend))
+    cache = StemCache(settings.STEM_CACHE_DIR, settings.STEM_CACHE_MAX_BYTES) if use_cache else None
+    kind = input_kind(source)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix=".work-") as work_dir:
+        if kind == "url":
+            results = run_url_job(work_dir, source, engine, cache, output_format, bitrate, want_video=want_video)
+        elif kind == "video":
+            results = process_video_file(source, work_dir, engine, cache, output_format, bitrate)
+        else:
+            results = separate_audio(
+                source, Path(work_dir) / "output", engine, cache, output_format=output_format, bitrate=bitrate
+            )
+        for mix in mixes:
+            if mix not in results:
+                # Summed from the stored stems into this run's own work_dir
+                results[mix] = derive_mix(results, mix, Path(work_dir) / "mixes", samplerate=engine.samplerate,
+                                          channels=engine.audio_channels, bitrate=bitrate)
+
+        outputs = expected_outputs(output_dir, kind, output_format, want_video, mixes)
+        for name, target in outputs.items():
+            # Copy rather than move: a cached stem is a hardlink, and editing the output must not change the cache
+            shutil.copyfile(results[name], target.with_name(target.name + ".part"))
+            os.replace(target.with_name(target.name + ".part"), target)
+
+    return {
+        "seconds": time.perf_counter() - start,
+        "outputs": {name: str(path) for name, path in outputs.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Separate vocals from a batch of audio/video files or URLs without the web UI."
+    )
+    parser.add_argument("inputs", nargs="*", help="Files or directories to process")
+    parser.add_argument("--manifest", help="Text or JSON file listing paths and URLs")
+    parser.add_argument("-o", "--output", required=True, help="Directory for results")
+    parser.add_argument("--preset", default=DEFAULT_PRESET, choices=list(PRESETS),
+                        help="Speed/quality preset (default: %(default)s)")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=list(BACKENDS),
+                        help="Inference backend; bf16 and int8 trade a little precision for speed "
+                             "(default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Parallel separations (default: as many as the preset's thread count allows)")
+    parser.add_argument("--format", default="wav", choices=list(STEM_FORMATS), help="Stem output format")
+    parser.add_argument("--bitrate", default=None, help="Bitrate for lossy stem formats, e.g. 192k")
+    parser.add_argument("--mix", action="append", dest="mixes", metavar="STEMS",
+                        help="Also write this mix of the stems, e.g. no_vocals or drums+bass; "
+                             "repeatable (default: no_vocals)")
+    parser.add_argument("--no-video", action="store_true",
+                        help="For URLs, download only the audio and skip the processed video")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or fill the shared stem cache")
+    parser.add_argument("--force", action="store_true", help="Reprocess inputs whose outputs already exist")
+    parser.add_argument("--summary", help="Where to write the JSON summary (default: <output>/summary.json)")
+    args = parser.parse_args(argv)
+
+    try:
+        mixes = [mix_name(mix_stems(mix, stored_stems()), stored_stems()) for mix in args.mixes or ["no_vocals"]]
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    sources = discover_inputs(args.inputs, args.manifest)
+    if not sources:
+        parser.error("no inputs found")
+
+    output_root = Path(args.output)
+    preset_threads = PRESETS[args.preset]["threads"]
+    workers = args.workers or max(1, (os.cpu_count() or 1) // (preset_threads or os.cpu_count() or 1))
+    threads = threads_per_worker(args.preset, workers)
+    want_video = not args.no_video
+    has_urls = any(input_kind(source) == "url" for source, _ in sources)
+    started = time.time()
+    results = []
+
+    pending = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(workers, threads, args.preset, has_urls, args.backend)) as pool:
+        for source, name in sources:
+            output_dir = output_root / name
+            kind = input_kind(source)
+            entry = {"input": source, "kind": kind, "output_dir": str(output_dir)}
+            outputs = expected_outputs(output_dir, kind, args.format, want_video, mixes)
+            if not args.force and all(path.exists() for path in outputs.values()):
+                entry.update(status="skipped", outputs={k: str(v) for k, v in outputs.items()})
+                results.append(entry)
+                continue
+            future = pool.submit(
+                process_input, source, output_dir, args.format, args.bitrate, want_video, not args.no_cache,
+                args.preset, args.backend, mixes
+            )
+            pending[future] = entry
+
+        for index, future in enumerate(as_completed(pending), 1):
+            entry = pending[future]
+            try:
+                entry.update(status="ok", **future.result())
+                duration = None if entry["kind"] == "url" else probe_duration(entry["input"])
+                if duration:
+                    entry["audio_seconds"] = duration
+                    entry["real_time_factor"] = entry["seconds"] / duration
+            except Exception as e:
+                entry.update(status="failed", error=str(e))
+            results.append(entry)
+            logger.info(f"[{index}/{len(pending)}] {entry['status']}: {entry['input']}")
+
+    counts = {status: sum(r["status"] == status for r in results) for status in ("ok", "skipped", "failed")}
+    summary = {
+        "started_at": started,
+        "wall_seconds": time.time() - started,
+        "preset": args.preset,
+        "backend": args.backend,
+        "workers": workers,
+        "threads_per_worker": threads,
+        "format": args.format,
+        "mixes": mixes,
+        "counts": counts,
+        "results": results,
+    }
+    summary_path = Path(args.summary) if args.summary else output_root / "summary.json"
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    summary_path.write_text(json.dumps(summary, indent=2))
+    logger.info(f"{counts['ok']} processed, {counts['skipped']} skipped, {counts['failed']} failed; "
+                f"summary written to {summary_path}")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
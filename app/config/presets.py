@@ -0,0 +1,74 @@
+import os
+
+# Speed/quality trade-offs for separation. model, segment, overlap and shifts
+# are passed to the engine; threads is the torch thread count per separation
+# (None: split the cores evenly between the separation workers).
+#
+# shifts=0 runs the model once on the unshifted input; every extra shift is
+# another full pass on a randomly offset copy, averaged for a small SDR gain.
+# htdemucs_ft is a bag of four fine-tuned models, about 4x the work of htdemucs.
+#
+# mdx_extra_q would load (diffq is pinned in requirements.txt) but is not
+# offered: it is a bag of four quantized hybrid Demucs v3 models, so about the
+# cost of htdemucs_ft per track, from an older generation that the Demucs
+# authors rank below htdemucs. Quantization only shrinks the download.
+PRESETS = {
+    "fast": {
+        "label": "Fast",
+        "description": "One pass with little window overlap. Quickest, slight seams.",
+        "model": "htdemucs",
+        "segment": None,
+        "overlap": 0.1,
+        "shifts": 0,
+        "threads": 2,
+    },
+    "balanced": {
+        "label": "Balanced",
+        "description": "The demucs defaults.",
+        "model": "htdemucs",
+        "segment": None,
+        "overlap": 0.25,
+        "shifts": 1,
+        "threads": 4,
+    },
+    "best": {
+        "label": "Best",
+        "description": "Fine-tuned model bag with two shifts. About 8x slower than balanced.",
+        "model": "htdemucs_ft",
+        "segment": None,
+        "overlap": 0.25,
+        "shifts": 2,
+        "threads": None,
+    },
+}
+
+DEFAULT_PRESET = os.environ.get("SPLITTER_PRESET", "balanced")
+
+# Inference backend for every preset, see separation_engine.BACKENDS
+DEFAULT_BACKEND = os.environ.get("SPLITTER_BACKEND", "float")
+
+
+def get_preset(name=None):
+    name = name or DEFAULT_PRESET
+    if name not in PRESETS:
+        raise ValueError(f"Unknown preset {name!r}, expected one of: {', '.join(PRESETS)}")
+    return PRESETS[name]
+
+
+def engine_options(name=None, backend=None):
+    """Keyword arguments for get_engine() under a preset"""
+    preset = get_preset(name)
+    return {
+        "model_name": preset["model"],
+        "segment": preset["segment"],
+        "overlap": preset["overlap"],
+        "shifts": preset["shifts"],
+        "backend": backend or DEFAULT_BACKEND,
+    }
+
+
+def threads_per_worker(name=None, workers=1):
+    """Torch threads for each of `workers` concurrent separations under a preset"""
+    threads = get_preset(name)["threads"]
+    even_split = max(1, (os.cpu_count() or 1) // max(1, workers))
+    return min(threads, even_split) if threads else even_split
@@ -0,0 +1,102 @@
+import os
+from pathlib import Path
+
+# Root for everything the app keeps between runs (caches, job state)
+DATA_DIR = Path(os.environ.get("SPLITTER_DATA_DIR", Path.home() / ".cache" / "audio_splitter"))
+
+# Content-addressed cache of separated stems shared by all sessions
+STEM_CACHE_DIR = Path(os.environ.get("SPLITTER_STEM_CACHE_DIR", DATA_DIR / "stems"))
+STEM_CACHE_MAX_BYTES = int(os.environ.get("SPLITTER_STEM_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+# URL downloads and their yt-dlp metadata, keyed by extractor and video ID. Jobs
+# download into their own folder and link the finished file in here; least
+# recently used downloads are evicted beyond DOWNLOAD_CACHE_MAX_MB
+DOWNLOAD_CACHE_DIR = Path(os.environ.get("SPLITTER_DOWNLOAD_CACHE_DIR", DATA_DIR / "downloads"))
+DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get("SPLITTER_DOWNLOAD_CACHE_MAX_MB", "4096")) * 1024 * 1024
+# file:// URLs let jobs read any media file on the server's disk; only for local testing
+ALLOW_FILE_URLS = os.environ.get("SPLITTER_ALLOW_FILE_URLS", "0") == "1"
+
+# Inputs longer than this are separated window by window to bound memory
+STREAMING_MIN_SECONDS = float(os.environ.get("SPLITTER_STREAMING_MIN_SECONDS", "600"))
+STREAMING_WINDOW_SECONDS = float(os.environ.get("SPLITTER_STREAMING_WINDOW_SECONDS", "30"))
+STREAMING_OVERLAP_SECONDS = float(os.environ.get("SPLITTER_STREAMING_OVERLAP_SECONDS", "2"))
+
+# Windowed separations save every finished window here, keyed like the stem
+# cache, so a job that is cut off (restart, crash, failed encode) resumes after
+# the last saved window when it is submitted again. A checkpoint is deleted
+# when its job completes. Checkpoints nobody wrote to for CHECKPOINT_STALE_SECONDS
+# are deleted oldest first while all of them exceed CHECKPOINT_MAX_MB.
+CHECKPOINTS = os.environ.get("SPLITTER_CHECKPOINTS", "1") != "0"
+CHECKPOINT_DIR = Path(os.environ.get("SPLITTER_CHECKPOINT_DIR", DATA_DIR / "checkpoints"))
+CHECKPOINT_MAX_BYTES = int(os.environ.get("SPLITTER_CHECKPOINT_MAX_MB", "4096")) * 1024 * 1024
+CHECKPOINT_STALE_SECONDS = float(os.environ.get("SPLITTER_CHECKPOINT_STALE_SECONDS", "900"))
+
+# With SEGMENT_WORKERS > 1, inputs longer than SEGMENT_MIN_SECONDS are cut
+# into segments of about SEGMENT_SECONDS (at video keyframes) and separated on
+# that many worker processes at once, each with its own copy of the model.
+# Segments overlap by STREAMING_OVERLAP_SECONDS and are cross-faded.
+SEGMENT_WORKERS = int(os.environ.get("SPLITTER_SEGMENT_WORKERS", "1"))
+SEGMENT_SECONDS = float(os.environ.get("SPLITTER_SEGMENT_SECONDS", "120"))
+SEGMENT_MIN_SECONDS = float(os.environ.get("SPLITTER_SEGMENT_MIN_SECONDS", "300"))
+
+# Separate every audio track of a video (e.g. several languages), in
+# parallel, and mux all of their vocals back in. Set to 0 to keep only the
+# first track, as before.
+ALL_AUDIO_TRACKS = os.environ.get("SPLITTER_ALL_AUDIO_TRACKS", "1") != "0"
+
+# Keep every source the model separates (vocals, drums, bass, other) instead
+# of only vocals and no_vocals. Other mixes such as no_vocals are summed from
+# the stored stems on demand, so no input has to be separated twice. Set to 0
+# for the two-stem layout of `demucs --two-stems=vocals`.
+ALL_STEMS = os.environ.get("SPLITTER_ALL_STEMS", "1") != "0"
+
+# Near-silent stretches (RMS below the threshold for at least MIN_SECONDS)
+# bypass the model and go straight to the accompaniment stem. Off until
+# `python -m benchmarks.silence_skip` passes with the real model weights.
+SKIP_SILENCE = os.environ.get("SPLITTER_SKIP_SILENCE", "0") == "1"
+SILENCE_THRESHOLD_DB = float(os.environ.get("SPLITTER_SILENCE_THRESHOLD_DB", "-50"))
+SILENCE_MIN_SECONDS = float(os.environ.get("SPLITTER_SILENCE_MIN_SECONDS", "2"))
+
+# Videos get their vocals piped into ffmpeg while separation runs, written as
+# a fragmented MP4 that can be served before it is finished. Set to 0 for the
+# original verbose mux from the finished vocals file.
+FAST_MUX = os.environ.get("SPLITTER_FAST_MUX", "1") != "0"
+
+# Fresh URL downloads are decoded, separated and encoded while yt-dlp is
+# still downloading. Stages pass at most PIPELINE_QUEUE_DEPTH windows of
+# STREAMING_WINDOW_SECONDS to the next one before they wait for it.
+PIPELINED_URLS = os.environ.get("SPLITTER_PIPELINED_URLS", "1") != "0"
+PIPELINE_QUEUE_DEPTH = int(os.environ.get("SPLITTER_PIPELINE_QUEUE_DEPTH", "2"))
+
+# Load the default preset's model, run it once and check ffmpeg/ffprobe in
+# the background at startup, so the first job does not pay for it
+WARMUP = os.environ.get("SPLITTER_WARMUP", "1") != "0"
+
+# Background separation jobs: at most SEPARATION_WORKERS run at once per server
+JOBS_DIR = Path(os.environ.get("SPLITTER_JOBS_DIR", DATA_DIR / "jobs"))
+SEPARATION_WORKERS = int(os.environ.get("SPLITTER_SEPARATION_WORKERS", max(1, (os.cpu_count() or 1) // 4)))
+JOB_RESULT_TTL_SECONDS = float(os.environ.get("SPLITTER_JOB_RESULT_TTL_SECONDS", 6 * 3600))
+JOB_POLL_SECONDS = float(os.environ.get("SPLITTER_JOB_POLL_SECONDS", "2"))
+
+# Results are streamed from disk by a small HTTP server next to Streamlit. Set
+# SPLITTER_FILE_SERVER=0 where only one port is reachable to fall back to
+# st.download_button, which holds the whole file in memory. Download links
+# point at the host the page was requested from, on FILE_SERVER_PORT, unless
+# FILE_SERVER_PUBLIC_URL (e.g. behind a reverse proxy) says otherwise. The file
+# server is plain HTTP, so pages served over HTTPS need FILE_SERVER_PUBLIC_URL.
+FILE_SERVER_ENABLED = os.environ.get("SPLITTER_FILE_SERVER", "1") != "0"
+FILE_SERVER_HOST = os.environ.get("SPLITTER_FILE_SERVER_HOST", "0.0.0.0")
+FILE_SERVER_PORT = int(os.environ.get("SPLITTER_FILE_SERVER_PORT", "8502"))
+FILE_SERVER_PUBLIC_URL = os.environ.get("SPLITTER_FILE_SERVER_PUBLIC_URL")
+
+# Headless HTTP API (python -m app.server.api). It runs its own job workers,
+# so its jobs live in a directory of their own next to the app's
+API_HOST = os.environ.get("SPLITTER_API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("SPLITTER_API_PORT", "8503"))
+API_JOBS_DIR = Path(os.environ.get("SPLITTER_API_JOBS_DIR", DATA_DIR / "api_jobs"))
+API_MAX_UPLOAD_BYTES = int(os.environ.get("SPLITTER_API_MAX_UPLOAD_MB", "4096")) * 1024 * 1024
+
+# Per-stage metrics: JSON log lines always, Prometheus text at /metrics on the
+# file server, and optionally rewritten to this file after every stage
+# ("{pid}" in the name is replaced by the process ID)
+METRICS_FILE = os.environ.get("SPLITTER_METRICS_FILE")
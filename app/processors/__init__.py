@@ -0,0 +1,40 @@
+"""Processing stages. Submodules are imported when one of their names is first used.
+
+`from app.processors import AudioProcessor` costs nothing until then, and
+torch, demucs and yt-dlp are only imported inside the functions that need
+them, so importing any of these modules stays cheap.
+"""
+import importlib
+
+_EXPORTS = {
+    "AudioProcessor": "audio_processor",
+    "VideoProcessor": "video_processor",
+    "StreamingMuxer": "video_processor",
+    "LinkDownloader": "link_processor",
+    "SeparationEngine": "separation_engine",
+    "get_engine": "separation_engine",
+    "set_worker_threads": "separation_engine",
+    "ChunkedSeparator": "chunked_separator",
+    "SegmentedSeparator": "segmented",
+    "SilenceSkipper": "silence",
+    "StemCache": "stem_cache",
+    "ChunkCheckpoint": "checkpoints",
+    "JobQueue": "job_queue",
+    "PipelinedRun": "pipelined",
+    "warm_up": "warmup",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
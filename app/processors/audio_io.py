@@ -0,0 +1,318 @@
+from pathlib import Path
+import json
+import subprocess
+import threading
+import numpy as np
+
+# Stem output formats. Everything except WAV is encoded by ffmpeg while the
+# stems are being produced; `mp4` marks codecs a video can carry unchanged.
+STEM_FORMATS = {
+    "wav": {"extension": ".wav", "codec": "pcm_s16le", "bitrate": None, "mime": "audio/wav", "mp4": False},
+    "flac": {"extension": ".flac", "codec": "flac", "bitrate": None, "mime": "audio/flac", "mp4": False},
+    "mp3": {"extension": ".mp3", "codec": "libmp3lame", "bitrate": "192k", "mime": "audio/mpeg", "mp4": True},
+    "aac": {"extension": ".m4a", "codec": "aac", "bitrate": "192k", "mime": "audio/mp4", "mp4": True},
+    # Opus only runs at 48 kHz, ffmpeg resamples on the way in
+    "opus": {"extension": ".opus", "codec": "libopus", "bitrate": "128k", "mime": "audio/ogg", "mp4": True,
+             "samplerate": 48000},
+}
+
+
+def stem_format_for(path):
+    """Look up the STEM_FORMATS entry matching a file's extension"""
+    suffix = Path(path).suffix.lower()
+    for name, spec in STEM_FORMATS.items():
+        if spec["extension"] == suffix:
+            return name, spec
+    return None, None
+
+
+def probe_duration(path):
+    """Return the container duration in seconds, or None if ffprobe cannot tell"""
+    try:
+        process = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                str(path)
+            ],
+            capture_output=True,
+            text=True
+        )
+    except OSError:
+        return None
+    try:
+        return float(process.stdout.strip())
+    except ValueError:
+        return None
+
+
+def probe_audio_tracks(path):
+    """Describe every audio stream of a file as {"index", "language", "title"}; [] if ffprobe fails"""
+    try:
+        process = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-select_streams", "a",
+                "-show_entries", "stream=index:stream_tags=language,title",
+                "-of", "json",
+                str(path)
+            ],
+            capture_output=True,
+            text=True
+        )
+        streams = json.loads(process.stdout)["streams"]
+    except (OSError, ValueError, KeyError):
+        return []
+    return [
+        {"index": index, "language": stream.get("tags", {}).get("language"),
+         "title": stream.get("tags", {}).get("title")}
+        for index, stream in enumerate(streams)
+    ]
+
+
+class FfmpegAudioReader:
+    """Decode any ffmpeg-readable input to float32 PCM and hand it out in blocks.
+
+    Samples come from ffmpeg's stdout, so only the block being read is ever
+    held in memory regardless of how long the input is.
+    """
+
+    def __init__(self, source, samplerate=44100, channels=2, track=0, start=None):
+        self.source = str(source)
+        self.samplerate = samplerate
+        self.channels = channels
+        # Index among the input's audio streams, and where to start decoding in seconds
+        self.track = track
+        self.start = start
+        self.process = None
+        self.returncode = None
+        self._eof = False
+
+    def command(self):
+        return [
+            "ffmpeg",
+            "-v", "error",
+            *(["-ss", f"{self.start:.6f}"] if self.start else []),
+            "-i", self.source,
+            "-map", f"0:a:{self.track}",
+            "-f", "f32le",
+            "-acodec", "pcm_f32le",
+            "-ar", str(self.samplerate),
+            "-ac", str(self.channels),
+            "pipe:1"
+        ]
+
+    def open(self):
+        self._eof = False
+        self.process = subprocess.Popen(
+            self.command(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self.stderr = StderrTail(self.process.stderr)
+        return self
+
+    def read(self, frames):
+        """Return up to `frames` samples as a (channels, n) array; n == 0 at the end"""
+        frame_bytes = 4 * self.channels
+        wanted = frames * frame_bytes
+        data = bytearray()
+        while len(data) < wanted:
+            chunk = self.process.stdout.read(wanted - len(data))
+            if not chunk:
+                self._eof = True
+                break
+            data += chunk
+        usable = len(data) - len(data) % frame_bytes
+        block = np.frombuffer(data, dtype=np.float32, count=usable // 4)
+        return block.reshape(-1, self.channels).T
+
+    def skip(self, frames, block_frames=1 << 18):
+        """Decode and drop the next `frames` samples; returns how many there were"""
+        skipped = 0
+        while skipped < frames:
+            count = self.read(min(block_frames, frames - skipped)).shape[1]
+            if count == 0:
+                break
+            skipped += count
+        return skipped
+
+    def blocks(self, frames):
+        """Yield (channels, frames) blocks until the input is exhausted"""
+        while True:
+            block = self.read(frames)
+            if block.shape[1] == 0:
+                return
+            yield block
+
+    def read_all(self, block_frames=1 << 18):
+        """Decode everything that is left into a single (channels, samples) array"""
+        blocks = list(self.blocks(block_frames))
+        if not blocks:
+            return np.zeros((self.channels, 0), dtype=np.float32)
+        return np.concatenate(blocks, axis=1)
+
+    def close(self):
+        if self.process is None:
+            return
+        stopped_early = not self._eof and self.process.poll() is None
+        if stopped_early:
+            self.process.stdout.close()
+            self.process.terminate()
+        returncode = self.returncode = self.process.wait()
+        self.process = None
+        if returncode != 0 and not stopped_early:
+            raise RuntimeError(f"FFmpeg decode failed: {self.stderr.text()}")
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.close()
+        except RuntimeError:
+            if exc_type is None:
+                raise
+
+
+class WavStreamWriter:
+    """Append (channels, n) float blocks to a 16-bit WAV file as they are produced"""
+
+    def __init__(self, path, samplerate, channels):
+        import soundfile as sf
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = sf.SoundFile(
+            str(self.path), mode="w", samplerate=samplerate,
+            channels=channels, subtype="PCM_16", format="WAV"
+        )
+
+    def write(self, block):
+        # Whole-file saving rescales on clipping; a stream can only clamp
+        self._file.write(np.clip(block, -1.0, 1.0).T)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+
+class StderrTail:
+    """Drain a subprocess's stderr on a thread and keep only its last `limit` bytes.
+
+    Reading stderr only after the process exits can deadlock once the pipe
+    buffer fills, and reading all of it can hold megabytes of log text.
+    """
+
+    def __init__(self, stream, limit=16 * 1024):
+        self.limit = limit
+        self.total_bytes = 0
+        self._data = bytearray()
+        self._thread = threading.Thread(target=self._drain, args=(stream,), daemon=True)
+        self._thread.start()
+
+    def _drain(self, stream):
+        for chunk in iter(lambda: stream.read1(4096), b""):
+            self.total_bytes += len(chunk)
+            self._data += chunk
+            if len(self._data) > 2 * self.limit:
+                del self._data[:-self.limit]
+        stream.close()
+
+    def text(self):
+        self._thread.join(timeout=5)
+        return bytes(self._data[-self.limit:]).decode(errors="replace").strip()
+
+
+class FfmpegStreamEncoder:
+    """Encode (channels, n) float blocks on the fly by piping them into ffmpeg's stdin.
+
+    `inputs` are extra ffmpeg input arguments placed before the piped audio
+    (e.g. a video to mux the audio into), and `output_options` go right
+    before the audio codec.
+    """
+
+    def __init__(self, path, samplerate, channels, codec, bitrate=None, output_samplerate=None,
+                 inputs=(), output_options=()):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        command = [
+            "ffmpeg",
+            "-v", "error",
+            *inputs,
+            "-f", "f32le",
+            "-ar", str(samplerate),
+            "-ac", str(channels),
+            "-i", "pipe:0",
+            *output_options,
+            "-c:a", codec
+        ]
+        if bitrate:
+            command += ["-b:a", str(bitrate)]
+        if output_samplerate:
+            command += ["-ar", str(output_samplerate)]
+        command += ["-y", str(self.path)]
+        self.returncode = None
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        self.stderr = StderrTail(self.process.stderr)
+
+    def write(self, block):
+        samples = np.ascontiguousarray(np.clip(block, -1.0, 1.0).T, dtype=np.float32)
+        try:
+            self.process.stdin.write(memoryview(samples).cast("B"))
+        except BrokenPipeError:
+            # ffmpeg exited early; its log says why
+            self.abort()
+            raise RuntimeError(f"FFmpeg encode failed: {self.stderr.text()}")
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.returncode = self.process.wait()
+        self.process = None
+        if returncode != 0:
+            raise RuntimeError(f"FFmpeg encode failed: {self.stderr.text()}")
+
+    def abort(self):
+        """Stop ffmpeg without finishing the file, e.g. when separation failed"""
+        if self.process is None:
+            return
+        self.process.kill()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.returncode = self.process.wait()
+        self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_stem_writer(output_dir, name, samplerate, channels, output_format="wav", bitrate=None):
+    """Writer for <output_dir>/<name><ext> in one of STEM_FORMATS"""
+    spec = STEM_FORMATS[output_format]
+    path = Path(output_dir) / f"{name}{spec['extension']}"
+    if output_format == "wav":
+        return WavStreamWriter(path, samplerate, channels)
+    return FfmpegStreamEncoder(
+        path, samplerate, channels, spec["codec"],
+        bitrate=bitrate or spec["bitrate"],
+        output_samplerate=spec.get("samplerate")
+    )
@@ -1,33 +1,159 @@
 from pathlib import Path
 import subprocess
+import time
+from app.processors.separation_engine import DEFAULT_MODEL, get_engine
+from app.processors.chunked_separator import ChunkedSeparator, DEFAULT_WINDOW_SECONDS, DEFAULT_OVERLAP_SECONDS
+from app.processors.segmented import SegmentedSeparator
+from app.processors.audio_io import STEM_FORMATS, probe_duration
+from app.processors.stem_mixer import DEFAULT_SOURCES
+from app.processors.silence import SilenceSkipper, DEFAULT_THRESHOLD_DB, DEFAULT_MIN_SILENCE_SECONDS
+from app.processors import metrics
 
 class AudioProcessor:
-    def __init__(self, input_audio, output_dir):
+    def __init__(self, input_audio, output_dir, engine=None, streaming=False,
+                 window_seconds=DEFAULT_WINDOW_SECONDS, overlap_seconds=DEFAULT_OVERLAP_SECONDS,
+                 output_format="wav", bitrate=None, skip_silence=False,
+                 silence_threshold_db=DEFAULT_THRESHOLD_DB, silence_min_seconds=DEFAULT_MIN_SILENCE_SECONDS,
+                 two_stems="vocals", checkpoint=None, segment_seconds=None, segment_workers=1, keyframes=None,
+                 track=0):
         self.input_audio = Path(input_audio)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.engine = engine
+        # Streaming mode separates fixed-size windows so memory does not grow with input length
+        self.streaming = streaming
+        self.window_seconds = window_seconds
+        self.overlap_seconds = overlap_seconds
+        # Stems are encoded to this STEM_FORMATS entry as they are produced
+        self.output_format = output_format
+        self.bitrate = bitrate
+        # Near-silent stretches longer than silence_min_seconds bypass the model
+        self.skip_silence = skip_silence
+        self.silence_threshold_db = silence_threshold_db
+        self.silence_min_seconds = silence_min_seconds
+        self.skipped_fraction = None
+        # "vocals" keeps vocals and no_vocals like `demucs --two-stems`; None keeps every source
+        self.two_stems = two_stems
+        # Optional ChunkCheckpoint for streaming mode: finished windows survive an interrupted run
+        self.checkpoint = checkpoint
+        # With segment_workers > 1, segments of about segment_seconds (cut at
+        # `keyframes` if given) are separated on that many processes at once
+        self.segment_seconds = segment_seconds
+        self.segment_workers = segment_workers
+        self.keyframes = keyframes
+        # Audio stream of the input to separate, for videos with several
+        self.track = track
+        # Stems land under a folder named after the model, so track which one ran
+        self.model_name = engine.model_name if engine is not None else DEFAULT_MODEL
+        self.sources = engine.sources if engine is not None else list(DEFAULT_SOURCES)
+        self.last_run_seconds = None
 
-    def run_demucs(self):
-        """Process audio using Demucs to separate vocals"""
-        try:
-            # Use default model (htdemucs) without MP3 output to avoid diffq dependency
-            subprocess.run([
-                "demucs",
-                "--two-stems=vocals",
-               # "-n", "mdx_extra_q",
-                "-o", str(self.output_dir),
-                str(self.input_audio)
-            ], check=True)
-            print("Demucs processing completed successfully")
-            return True
-        except subprocess.CalledProcessError as e:
-            print(f"Error during Demucs execution: {e}")
-            return False
+    def run_demucs(self, wav=None, taps=None):
+        """Process audio using the in-process Demucs engine to separate vocals (or every source).
+
+        `wav` may hold the already decoded input to avoid decoding it twice;
+        it is ignored in streaming mode, which decodes window by window.
+        `taps` ({stem: writer}) receive the stems block by block as they are saved.
+        """
+        segmented = self.segment_workers > 1 and self.segment_seconds
+        mode = "segmented" if segmented else "streaming" if self.streaming else "whole"
+        with metrics.stage("separate", mode=mode) as record:
+            record.add_input(self.input_audio)
+            try:
+                engine = self.engine or get_engine()
+                self.model_name = engine.model_name
+                self.sources = engine.sources
+                if wav is not None and not self.streaming and not segmented:
+                    record.audio_seconds = wav.shape[-1] / engine.samplerate
+                else:
+                    record.audio_seconds = probe_duration(self.input_audio)
+                start = time.perf_counter()
+                stem_dir = self.stem_dir
+                skipper = None
+                if self.skip_silence:
+                    skipper = SilenceSkipper(engine, self.silence_threshold_db, self.silence_min_seconds)
+                if segmented:
+                    silence = (self.silence_threshold_db, self.silence_min_seconds) if self.skip_silence else None
+                    separator = SegmentedSeparator(
+                        engine, self.segment_seconds, self.overlap_seconds, self.segment_workers, silence
+                    )
+                    stems = separator.separate_file(
+                        self.input_audio, stem_dir, record.audio_seconds or 0, two_stems=self.two_stems,
+                        output_format=self.output_format, bitrate=self.bitrate, taps=taps, keyframes=self.keyframes,
+                        track=self.track
+                    )
+                    # The skippers ran in the workers
+                    skipper = None
+                elif self.streaming:
+                    separator = ChunkedSeparator(engine, self.window_seconds, self.overlap_seconds, skipper)
+                    stems = separator.separate_file(
+                        self.input_audio, stem_dir, two_stems=self.two_stems,
+                        output_format=self.output_format, bitrate=self.bitrate, taps=taps,
+                        checkpoint=self.checkpoint, track=self.track
+                    )
+                elif skipper is not None:
+                    if wav is None:
+                        wav = engine.load_audio(self.input_audio, self.track)
+                    stems = engine.save_stems(
+                        skipper.separate(wav, two_stems=self.two_stems), stem_dir, self.output_format, self.bitrate,
+                        taps, shared_scale=not self.two_stems
+                    )
+                else:
+                    if wav is None:
+                        wav = engine.load_audio(self.input_audio, self.track)
+                    stems = engine.separate_file(
+                        self.input_audio, stem_dir, two_stems=self.two_stems, wav=wav,
+                        output_format=self.output_format, bitrate=self.bitrate, taps=taps
+                    )
+                record.add_output(*stems.values())
+                self.last_run_seconds = time.perf_counter() - start
+                print(f"Demucs processing completed successfully in {self.last_run_seconds:.2f}s")
+                if skipper is not None:
+                    self.skipped_fraction = skipper.skipped_fraction
+                    record.extra["skipped_fraction"] = round(self.skipped_fraction, 4)
+                    print(f"Skipped {self.skipped_fraction:.1%} of the audio as near-silent")
+                return True
+            except Exception as e:
+                record.fail(e)
+                print(f"Error during Demucs execution: {e}")
+                return False
+
+    def run_demucs_cli(self):
+        """Process audio by spawning the demucs CLI (reloads the model on every call)"""
+        with metrics.stage("separate_cli") as record:
+            record.add_input(self.input_audio)
+            try:
+                self.model_name = DEFAULT_MODEL
+                start = time.perf_counter()
+                # The CLI's default model, htdemucs, like DEFAULT_MODEL
+                subprocess.run([
+                    "demucs",
+                    "--two-stems=vocals",
+                    "-o", str(self.output_dir),
+                    str(self.input_audio)
+                ], check=True)
+                record.exit_status = 0
+                self.last_run_seconds = time.perf_counter() - start
+                print(f"Demucs processing completed successfully in {self.last_run_seconds:.2f}s")
+                return True
+            except subprocess.CalledProcessError as e:
+                record.exit_status = e.returncode
+                record.fail(e)
+                print(f"Error during Demucs execution: {e}")
+                return False
+
+    @property
+    def extension(self):
+        return STEM_FORMATS[self.output_format]["extension"]
+
+    @property
+    def stem_dir(self):
+        # Same layout as the demucs CLI: <output_dir>/<model>/<track>/{vocals,no_vocals}.wav, or one file per source
+        return self.output_dir / self.model_name / self.input_audio.stem
 
     def get_vocals_path(self):
         """Get path to the separated vocals file"""
-        # Path for htdemucs model output
-        vocals_path = self.output_dir / "htdemucs" / Path(self.input_audio.stem) / "vocals.wav"
+        vocals_path = self.stem_dir / f"vocals{self.extension}"
         if vocals_path.exists():
             print(f"Vocals found at: {vocals_path}")
             return str(vocals_path)
@@ -36,14 +162,19 @@ class AudioProcessor:
 
     def get_no_vocals_path(self):
         """Get path to the no-vocals (instrumental) file"""
-        # Path for htdemucs model output
-        no_vocals_path = self.output_dir / "htdemucs" / Path(self.input_audio.stem) / "no_vocals.wav"
+        no_vocals_path = self.stem_dir / f"no_vocals{self.extension}"
         if no_vocals_path.exists():
             print(f"No-vocals track found at: {no_vocals_path}")
             return str(no_vocals_path)
         print("No-vocals file not found")
         return None
 
+    def get_stem_paths(self):
+        """Get {stem: path} for every separated file; empty if separation has not run"""
+        names = [self.two_stems, f"no_{self.two_stems}"] if self.two_stems else self.sources
+        paths = {name: self.stem_dir / f"{name}{self.extension}" for name in names}
+        return {name: str(path) for name, path in paths.items() if path.exists()}
+
     def cleanup(self):
         """Remove temporary audio files"""
         if self.input_audio.exists():
@@ -0,0 +1,166 @@
+from pathlib import Path
+import fcntl
+import json
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+PENDING_PREFIX = "pending:"
+
+
+class ChunkCheckpoint:
+    """Finished chunks of one windowed separation, kept on disk until it completes.
+
+    Lives in <root>/<key>/, where `key` identifies the input and settings
+    (the StemCache key), so a job that is submitted again after a crash or
+    restart finds the chunks of the earlier attempt. Each chunk file holds
+    the chunk's stems plus the unfaded tail the next window is cross-faded
+    with. The manifest lists the chunks and is only rewritten after a chunk
+    file is complete, and both are written with a rename, so a run cut off
+    at any point leaves a consistent prefix behind.
+
+    Only one run owns a checkpoint at a time: load() takes an flock on
+    <root>/<key>.lock, which the kernel drops if the owner dies. A second
+    job on the same input while the first is still running gets nothing
+    from load() and separates without checkpointing; its save() and
+    discard() leave the owner's chunks alone.
+    """
+
+    def __init__(self, root, key):
+        self.dir = Path(root) / key
+        self.lock_path = Path(root) / f"{key}.lock"
+        self.owned = None
+        self._lock = None
+        self._manifest = None
+
+    def _write_atomic(self, name, write):
+        staging = self.dir / f".{name}.{uuid.uuid4().hex}"
+        try:
+            with open(staging, "wb") as f:
+                write(f)
+            os.replace(staging, self.dir / name)
+        finally:
+            staging.unlink(missing_ok=True)
+
+    def load(self, settings):
+        """Yield (chunk, pending) for every saved chunk; starts over when `settings` changed"""
+        settings = json.loads(json.dumps(settings))
+        self._lock = _try_lock(self.lock_path)
+        self.owned = self._lock is not None
+        if not self.owned:
+            print(f"Checkpoint {self.dir.name[:12]} is in use by another run; separating without it")
+            return
+        try:
+            manifest = json.loads((self.dir / MANIFEST_NAME).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            manifest = None
+        if manifest is None or manifest["settings"] != settings:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            manifest = {"settings": settings, "chunks": []}
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._manifest = manifest
+        # Marks the checkpoint as in use for collect()
+        os.utime(self.dir)
+
+        for file_name in manifest["chunks"]:
+            with np.load(self.dir / file_name) as saved:
+                chunk = {name: saved[name] for name in saved.files if not name.startswith(PENDING_PREFIX)}
+                pending = {name[len(PENDING_PREFIX):]: saved[name] for name in saved.files
+                           if name.startswith(PENDING_PREFIX)}
+            yield chunk, pending or None
+
+    def save(self, chunk, pending):
+        """Persist the next chunk and the tail that follows it (None after the last chunk)"""
+        if self.owned is None:
+            raise RuntimeError("load() the checkpoint before saving chunks")
+        if not self.owned:
+            return
+        file_name = f"chunk_{len(self._manifest['chunks']):05d}.npz"
+        arrays = dict(chunk)
+        arrays.update({PENDING_PREFIX + name: wav for name, wav in (pending or {}).items()})
+        self._write_atomic(file_name, lambda f: np.savez(f, **arrays))
+        self._manifest["chunks"].append(file_name)
+        self._manifest["updated_at"] = time.time()
+        manifest = json.dumps(self._manifest).encode()
+        self._write_atomic(MANIFEST_NAME, lambda f: f.write(manifest))
+
+    def discard(self):
+        """Delete the checkpoint, e.g. once the stems are complete; only the owner does"""
+        if self.owned:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            # Unlinked while still locked, so a waiting run cannot end up owning a deleted lock file
+            self.lock_path.unlink(missing_ok=True)
+        self.close()
+
+    def close(self):
+        """Give up ownership and keep the chunks, e.g. when the run failed"""
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+        self.owned = False
+
+
+def _try_lock(path):
+    """Open and flock `path` without waiting; the open file while locked, None if another run holds it"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        f = open(path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        try:
+            if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        # The owner deleted the lock file between our open and flock; lock the new one
+        f.close()
+
+
+def collect(root, max_bytes, stale_seconds):
+    """Delete the oldest checkpoints until the rest fit in max_bytes.
+
+    Checkpoints written to in the last `stale_seconds`, or locked by a run
+    that is still going, are never deleted. Returns the bytes freed.
+    """
+    root = Path(root)
+    if not root.exists():
+        return 0
+    entries = []
+    for entry in root.iterdir():
+        try:
+            if entry.is_dir():
+                size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+                entries.append((max(entry.stat().st_mtime, _manifest_mtime(entry)), size, entry))
+        except FileNotFoundError:
+            continue  # collected concurrently
+
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    cutoff = time.time() - stale_seconds
+    for mtime, size, entry in sorted(entries):
+        if total <= max_bytes or mtime > cutoff:
+            break
+        lock_path = root / f"{entry.name}.lock"
+        lock = _try_lock(lock_path)
+        if lock is None:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        lock_path.unlink(missing_ok=True)
+        lock.close()
+        total -= size
+        freed += size
+        print(f"Checkpoint collected: {entry.name[:12]}")
+    return freed
+
+
+def _manifest_mtime(entry):
+    try:
+        return (entry / MANIFEST_NAME).stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
@@ -0,0 +1,152 @@
+from pathlib import Path
+import numpy as np
+from app.processors.audio_io import FfmpegAudioReader, open_stem_writer
+
+DEFAULT_WINDOW_SECONDS = 30.0
+DEFAULT_OVERLAP_SECONDS = 2.0
+
+
+class ChunkedSeparator:
+    """Separate long inputs window by window so memory depends on the window, not the track.
+
+    The input is decoded in windows of `window_seconds` that share
+    `overlap_seconds` with their neighbour. Each window goes through the
+    engine on its own, overlapping regions are cross-faded with linear
+    weights that sum to one, and finished samples are appended to the stem
+    files straight away.
+
+    Tolerance: each window is normalised with its own statistics and sees
+    less context at its edges than whole-file separation does, so outputs are
+    not bit-identical. With the default 30 s window and 2 s overlap every stem
+    is expected to stay within MAX_DEVIATION_DB (residual energy relative to
+    the whole-file stem) of `SeparationEngine.separate_file`; streamed WAVs
+    are clamped rather than rescaled when they clip.
+    """
+
+    MAX_DEVIATION_DB = -30.0
+
+    def __init__(self, engine, window_seconds=DEFAULT_WINDOW_SECONDS, overlap_seconds=DEFAULT_OVERLAP_SECONDS,
+                 skipper=None):
+        if overlap_seconds * 2 > window_seconds:
+            raise ValueError("overlap_seconds must be at most half of window_seconds")
+        self.engine = engine
+        # Optional SilenceSkipper: near-silent parts of each window bypass the model
+        self.skipper = skipper
+        self.window = int(window_seconds * engine.samplerate)
+        self.overlap = int(overlap_seconds * engine.samplerate)
+        self.fade_in = np.linspace(0.0, 1.0, self.overlap, dtype=np.float32)
+        self.fade_out = 1.0 - self.fade_in
+
+    @property
+    def settings(self):
+        return {"window": self.window, "overlap": self.overlap}
+
+    def _separate_window(self, window, two_stems):
+        if self.skipper is not None:
+            return self.skipper.separate(window, two_stems)
+        sources = self.engine.separate(window)
+        if two_stems:
+            sources = self.engine.two_stems(sources, two_stems)
+        return {name: wav.cpu().numpy() for name, wav in sources.items()}
+
+    def iter_separated(self, blocks, two_stems="vocals", state=None):
+        """Turn a stream of input blocks into a stream of finished {stem: block} chunks.
+
+        `state["pending"]` holds the unfaded output tail the next window is
+        cross-faded with. It is updated before every chunk is yielded, so it can
+        be saved with the chunk. Passing it back with `blocks` starting where
+        the next window starts resumes the stream.
+        """
+        state = {} if state is None else state
+        pending = state.get("pending")       # unfaded output tail still waiting for the next window
+        buffered = np.zeros((self.engine.audio_channels, 0), dtype=np.float32)
+
+        blocks = iter(blocks)
+        finished = False
+        while not finished:
+            # Fill a window: overlap carried from the previous one plus fresh samples
+            while buffered.shape[1] < self.window:
+                block = next(blocks, None)
+                if block is None:
+                    finished = True
+                    break
+                buffered = np.concatenate([buffered, block], axis=1)
+
+            window, buffered = buffered[:, :self.window], buffered[:, self.window:]
+            finished = finished and buffered.shape[1] == 0
+            has_new_audio = window.shape[1] > (self.overlap if pending is not None else 0)
+
+            if not has_new_audio:
+                state["pending"] = None
+                if pending is not None:
+                    yield pending
+                return
+
+            stems = self._separate_window(window, two_stems)
+            length = window.shape[1]
+            start = 0
+            chunk = {}
+            for name, wav in stems.items():
+                if pending is not None:
+                    head = pending[name] * self.fade_out + wav[:, :self.overlap] * self.fade_in
+                    start = self.overlap
+                else:
+                    head = wav[:, :0]
+                end = length if finished else length - self.overlap
+                chunk[name] = np.concatenate([head, wav[:, start:end]], axis=1)
+                stems[name] = wav[:, end:]
+            pending = state["pending"] = None if finished else stems
+            yield chunk
+
+            if finished:
+                return
+            buffered = np.concatenate([window[:, -self.overlap:], buffered], axis=1)
+
+    def separate_file(self, input_path, output_dir, two_stems="vocals", output_format="wav", bitrate=None,
+                      taps=None, checkpoint=None, track=0):
+        """Stream-separate a file (its audio stream `track`) into <output_dir>/<stem><ext> and return the paths.
+
+        Non-WAV formats are encoded as the chunks come out, not in a second pass.
+        `taps` maps stem names to extra writers that get every chunk as well.
+        With a ChunkCheckpoint every chunk is saved as it is finished; chunks
+        saved by an earlier, interrupted run are written out again and
+        separation continues after the last of them.
+        """
+        output_dir = Path(output_dir)
+        block_frames = self.window - self.overlap
+        writers = {}
+
+        def emit(chunk):
+            for name, block in chunk.items():
+                if name not in writers:
+                    writers[name] = open_stem_writer(
+                        output_dir, name, self.engine.samplerate, block.shape[0], output_format, bitrate
+                    )
+                writers[name].write(block)
+                if taps and name in taps:
+                    taps[name].write(block)
+
+        try:
+            with FfmpegAudioReader(input_path, self.engine.samplerate, self.engine.audio_channels, track) as reader:
+                state = {}
+                done = 0
+                if checkpoint is not None:
+                    saved = checkpoint.load(dict(self.settings, two_stems=two_stems))
+                    for chunk, pending in saved:
+                        emit(chunk)
+                        state["pending"] = pending
+                        done += 1
+                    if done:
+                        # Windows start every window - overlap frames, so that is where the next one begins
+                        reader.skip(done * block_frames)
+                        print(f"Resuming separation after {done} saved chunks")
+                # A saved chunk without a tail was the last one; only the encoding was cut short
+                if not done or state["pending"] is not None:
+                    for chunk in self.iter_separated(reader.blocks(block_frames), two_stems, state):
+                        emit(chunk)
+                        if checkpoint is not None:
+                            checkpoint.save(chunk, state["pending"])
+        finally:
+            for writer in writers.values():
+                writer.close()
+        return {name: str(writer.path) for name, writer in writers.items()}
@@ -0,0 +1,154 @@
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from app.processors import metrics
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    label: str
+    work_dir: Path
+    status: str = QUEUED
+    result: dict = field(default_factory=dict)
+    error: str = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+
+class JobQueue:
+    """FIFO of separation jobs drained by a fixed number of worker threads.
+
+    At most `workers` jobs run at once, however many sessions submit. Jobs
+    and their work directories live in the server process, so results
+    survive Streamlit reruns until they expire after `result_ttl` seconds.
+    `on_start` runs once on a background thread before the workers take
+    their first job, e.g. to load models without holding up the page.
+    """
+
+    def __init__(self, root, workers=1, result_ttl=6 * 3600, on_start=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._pending = deque()
+        self._tasks = {}
+        self._cond = threading.Condition()
+        self._ready = threading.Event()
+        self._threads = []
+        if on_start is None:
+            self._ready.set()
+        else:
+            threading.Thread(target=self._start, args=(on_start,), name="separation-warmup", daemon=True).start()
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"separation-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, kind, fn, *args, label=None, **kwargs):
+        """Queue fn(work_dir, *args, **kwargs) and return the job ID straight away"""
+        self._prune()
+        job_id = uuid.uuid4().hex
+        work_dir = self.root / job_id
+        work_dir.mkdir(parents=True)
+        job = Job(id=job_id, kind=kind, label=label or kind, work_dir=work_dir)
+        with self._cond:
+            self._jobs[job_id] = job
+            self._tasks[job_id] = (fn, args, kwargs)
+            self._pending.append(job_id)
+            self._cond.notify()
+        return job_id
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def position(self, job_id):
+        """1-based place in the queue, or None once the job has started"""
+        with self._cond:
+            try:
+                return self._pending.index(job_id) + 1
+            except ValueError:
+                return None
+
+    def _start(self, on_start):
+        try:
+            on_start()
+        except Exception:
+            # Jobs load what they need themselves, just more slowly
+            traceback.print_exc()
+        finally:
+            self._ready.set()
+
+    def _worker(self):
+        self._ready.wait()
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job_id = self._pending.popleft()
+                fn, args, kwargs = self._tasks.pop(job_id)
+                job = self._jobs[job_id]
+                job.status = RUNNING
+                job.started_at = time.time()
+
+            # One record per job covers the app's process_* submissions end to end
+            with metrics.stage("job", kind=job.kind) as record:
+                record.extra["job_id"] = job_id
+                record.extra["queue_wait_s"] = round(job.started_at - job.submitted_at, 4)
+                try:
+                    result = fn(job.work_dir, *args, **kwargs) or {}
+                    record.add_output(*result.values())
+                    self._finish(job, DONE, result=result)
+                except Exception as e:
+                    traceback.print_exc()
+                    record.fail(e)
+                    self._finish(job, FAILED, error=str(e))
+            print(f"Job {job_id} ({job.kind}) {job.status} in {job.finished_at - job.started_at:.2f}s")
+
+    def _finish(self, job, status, result=None, error=None):
+        # Under the lock, so _prune never sees a finished job without finished_at
+        with self._cond:
+            if result is not None:
+                job.result = result
+            job.error = error
+            job.finished_at = time.time()
+            job.status = status
+
+    def _prune(self):
+        """Forget finished jobs older than result_ttl and delete their files"""
+        cutoff = time.time() - self.result_ttl
+        with self._cond:
+            expired = [
+                job for job in self._jobs.values()
+                if not job.active and job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for job in expired:
+                del self._jobs[job.id]
+            known = {job.work_dir for job in self._jobs.values()}
+        for job in expired:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+        # Work directories and staged uploads left behind by an earlier server process
+        for stale in [*self.root.iterdir(), *(self.root / "uploads").glob("*")]:
+            try:
+                if stale.is_dir() and stale.name != "uploads" and stale not in known \
+                        and stale.stat().st_mtime < cutoff:
+                    shutil.rmtree(stale, ignore_errors=True)
+            except FileNotFoundError:
+                continue
@@ -1,17 +1,42 @@
 from pathlib import Path
-import yt_dlp
 import tempfile
-import streamlit as st
-from video_processor import VideoProcessor
-from audio_processor import AudioProcessor
+import hashlib
+import json
+import logging
 import re
 import os
+import uuid
+from urllib.parse import urlsplit
+from app.processors import metrics
+from app.processors.stem_cache import link_or_copy
+
+logger = logging.getLogger(__name__)
+
+URL_SCHEMES = ("http", "https")
+
+
+def check_url(url, allow_file_urls=False):
+    """Raise ValueError for anything but an http(s) URL; file: URLs only with allow_file_urls"""
+    scheme = urlsplit(str(url)).scheme.lower()
+    if scheme in URL_SCHEMES or (allow_file_urls and scheme == "file"):
+        return url
+    raise ValueError(f"Unsupported URL scheme {scheme or 'none'!r}, expected http or https")
 
 
 class LinkDownloader:
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, cache_dir=None, allow_file_urls=False, cache_max_bytes=None):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        # With a cache_dir, downloads and their metadata are kept and reused across jobs.
+        # Files are always downloaded into output_dir and linked into the cache once complete,
+        # and least recently used ones are evicted beyond cache_max_bytes (None: no limit).
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.cache_max_bytes = cache_max_bytes
+        # file: URLs read the server's own disk, so they are for local testing only
+        self.allow_file_urls = allow_file_urls
+        self.last_info = None
+        self.last_error = None
+        self.last_cached = False
 
     def sanitize_filename(self, title):
         """Sanitize filename by removing special characters and limiting length"""
@@ -22,49 +47,201 @@ class LinkDownloader:
             clean_name = clean_name[:50]
         return clean_name
 
-    def download_from_url(self, url):
-        """Download video from URL using yt-dlp"""
+    def media_key(self, url):
+        """Extractor name and video ID read from the URL alone, without any network access.
+
+        URLs only the generic extractor handles (direct media links) have no
+        stable ID, so they are keyed by a hash of the URL instead.
+        """
+        from yt_dlp.extractor import gen_extractor_classes
+
+        for extractor in gen_extractor_classes():
+            if extractor.ie_key() == "Generic" or not extractor.suitable(url):
+                continue
+            video_id = extractor.get_temp_id(url)
+            if video_id:
+                return extractor.ie_key(), str(video_id)
+            break
+        return "url", hashlib.sha256(url.encode()).hexdigest()[:32]
+
+    def _cache_name(self, key):
+        extractor, video_id = key
+        return f"{self.sanitize_filename(extractor)}_{self.sanitize_filename(video_id)}"
+
+    def _record_path(self, key):
+        return self.cache_dir / "records" / f"{self._cache_name(key)}.json"
+
+    def _write_json(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=path.parent, suffix=".tmp", delete=False) as f:
+            json.dump(data, f)
+        os.replace(f.name, path)
+
+    def _read_record(self, key):
         try:
-            # Create a temporary filename template
-            temp_filename = 'downloaded_video.%(ext)s'
-            temp_filepath = str(self.output_dir / temp_filename)
-
-            # Configure yt-dlp options
-            ydl_opts = {
-                'format': 'best',
-                'outtmpl': temp_filepath,
-                'quiet': False,  # Enable output for debugging
-                'no_warnings': False,
-                'extract_audio': False,
-            }
-
-            st.info("Starting video download...")
-            print(f"Download directory: {self.output_dir}")
-            print(f"Download template: {temp_filepath}")
-
-            # Download the video
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Extract info first
-                info = ydl.extract_info(url, download=False)
-                # Get the actual extension
-                ext = info.get('ext', 'mp4')
-
-                # Download the video
-                ydl.download([url])
-
-                # Construct the actual file path
-                actual_filepath = str(self.output_dir / f"downloaded_video.{ext}")
-                print(f"Expected downloaded file: {actual_filepath}")
-
-                # Verify file exists
-                if not os.path.exists(actual_filepath):
-                    print(f"Files in directory: {os.listdir(self.output_dir)}")
-                    raise FileNotFoundError(f"Downloaded file not found at {actual_filepath}")
-
-                print(f"File size: {os.path.getsize(actual_filepath)} bytes")
-                return actual_filepath
-
-        except Exception as e:
-            st.error(f"Error during download: {str(e)}")
-            print(f"Download error details: {str(e)}")
-            return None
\ No newline at end of file
+            return json.loads(self._record_path(key).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def cached_download(self, url, want_video=True, key=None):
+        """Path of an earlier download that satisfies this request, or None"""
+        if self.cache_dir is None:
+            return None
+        record = self._read_record(key or self.media_key(url))
+        if record is None:
+            return None
+        # A full video download also serves an audio-only request
+        for mode in (["video"] if want_video else ["audio", "video"]):
+            path = record["files"].get(mode)
+            if path and os.path.exists(path):
+                self.last_info = record
+                return path
+        return None
+
+    def _restore(self, cached):
+        """Link a cached download into output_dir and mark it recently used; None if it was evicted meanwhile"""
+        target = self.output_dir / Path(cached).name
+        target.unlink(missing_ok=True)
+        try:
+            link_or_copy(cached, target)
+            os.utime(cached)
+        except FileNotFoundError:
+            return None
+        return str(target)
+
+    def _publish(self, key, mode, filepath):
+        """Link a finished download into the cache under its key, replacing any earlier copy"""
+        media_dir = self.cache_dir / "media"
+        media_dir.mkdir(parents=True, exist_ok=True)
+        target = media_dir / f"{self._cache_name(key)}.{mode}{Path(filepath).suffix}"
+        staging = media_dir / f".{uuid.uuid4().hex}.tmp"
+        try:
+            link_or_copy(filepath, staging)
+            os.replace(staging, target)
+        finally:
+            staging.unlink(missing_ok=True)
+        return target
+
+    def evict(self):
+        """Drop least recently used downloads until the cache fits in cache_max_bytes, then their records"""
+        media_dir = self.cache_dir / "media"
+        if self.cache_max_bytes is None or not media_dir.exists():
+            return
+        entries = []
+        for path in media_dir.iterdir():
+            if path.name.startswith("."):
+                continue  # still being published
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # evicted concurrently
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        evicted = False
+        for _, size, path in sorted(entries):
+            if total <= self.cache_max_bytes:
+                break
+            # Jobs hold links of their own, so this never takes a file away from one
+            path.unlink(missing_ok=True)
+            total -= size
+            evicted = True
+            print(f"Download cache evicted: {path.name}")
+        if not evicted:
+            return
+        for record_path in (self.cache_dir / "records").glob("*.json"):
+            try:
+                files = json.loads(record_path.read_text())["files"].values()
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                continue
+            if not any(os.path.exists(path) for path in files):
+                record_path.unlink(missing_ok=True)
+
+    def ingest(self, url, want_video=True, progress_hooks=None):
+        """Resolve metadata and download in one yt-dlp pass.
+
+        Only the audio stream is fetched when `want_video` is False. With a
+        cache_dir, a URL whose extractor and ID are already known is served
+        from disk without touching the network. `progress_hooks` are passed
+        to yt-dlp, which then writes straight to the final file name so
+        others can read the download while it grows. The returned file is
+        always in output_dir, so concurrent jobs on one URL never write
+        the same file and eviction never removes a job's input.
+        """
+        check_url(url, self.allow_file_urls)
+        key = self.media_key(url) if self.cache_dir is not None else None
+        cached = self.cached_download(url, want_video, key)
+        restored = self._restore(cached) if cached else None
+        if restored:
+            print(f"Using cached download: {cached}")
+            self.last_cached = True
+            return restored
+        self.last_cached = False
+
+        mode = "video" if want_video else "audio"
+        outtmpl = str(self.output_dir / f"downloaded_{mode}.%(ext)s")
+
+        ydl_opts = {
+            'format': 'best' if want_video else 'bestaudio/best',
+            'outtmpl': outtmpl,
+            'noplaylist': True,
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'enable_file_urls': self.allow_file_urls,
+        }
+        if progress_hooks:
+            ydl_opts['progress_hooks'] = list(progress_hooks)
+            # No .part file, and an interrupted download left at the final name is not mistaken for a finished one
+            ydl_opts['nopart'] = True
+            ydl_opts['overwrites'] = True
+
+        # yt-dlp takes a while to import, so only URL jobs pay for it
+        import yt_dlp
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # Metadata is resolved once, by the same call that downloads
+            info = ydl.extract_info(url, download=True)
+            if info.get('_type') == 'playlist':
+                info = info['entries'][0]
+            downloads = info.get('requested_downloads') or [{}]
+            filepath = downloads[0].get('filepath') or ydl.prepare_filename(info)
+
+        if not os.path.exists(filepath):
+            print(f"Files in directory: {os.listdir(Path(filepath).parent)}")
+            raise FileNotFoundError(f"Downloaded file not found at {filepath}")
+        print(f"Downloaded {mode} ({os.path.getsize(filepath)} bytes): {filepath}")
+
+        record = {
+            "extractor": info.get('extractor_key'),
+            "id": info.get('id'),
+            "title": info.get('title'),
+            "duration": info.get('duration'),
+            "webpage_url": info.get('webpage_url', url),
+            "files": {},
+        }
+        if self.cache_dir is not None:
+            record = self._read_record(key) or record
+            record["files"][mode] = str(self._publish(key, mode, filepath))
+            self._write_json(self._record_path(key), record)
+            self.evict()
+        self.last_info = record
+        return str(filepath)
+
+    def download_from_url(self, url, want_video=True, progress_hooks=None):
+        """Download video (or only its audio) from URL using yt-dlp"""
+        with metrics.stage("download", mode="video" if want_video else "audio") as record:
+            try:
+                logger.info("Starting video download..." if want_video else "Starting audio download...")
+                print(f"Download directory: {self.output_dir}")
+                path = self.ingest(url, want_video=want_video, progress_hooks=progress_hooks)
+                record.add_output(path)
+                record.audio_seconds = (self.last_info or {}).get("duration")
+                record.extra["cached"] = self.last_cached
+                return path
+
+            except Exception as e:
+                self.last_error = f"Error during download: {str(e)}"
+                logger.error(self.last_error)
+                record.fail(self.last_error)
+                return None
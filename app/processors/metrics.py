@@ -0,0 +1,245 @@
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+# JSON lines, one per finished stage; see configure_logging()
+logger = logging.getLogger("app.metrics")
+
+DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+class StageRecord:
+    """What one run of a stage measured; filled in by the code inside `stage()`"""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.status = "ok"
+        self.error = None
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.audio_seconds = None
+        self.exit_status = None
+        self.extra = {}
+        self.duration = None
+        self.peak_rss_bytes = None
+
+    def add_input(self, *paths):
+        self.input_bytes += sum(file_size(path) for path in paths)
+
+    def add_output(self, *paths):
+        self.output_bytes += sum(file_size(path) for path in paths)
+
+    def fail(self, error):
+        """Mark the stage failed for processors that report errors by return value"""
+        self.status = "error"
+        self.error = str(error) if error else None
+
+    def as_dict(self):
+        data = {
+            "event": "stage",
+            "stage": self.name,
+            **self.labels,
+            "status": self.status,
+            "duration_s": round(self.duration, 4),
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "audio_seconds": self.audio_seconds,
+            "exit_status": self.exit_status,
+            "peak_rss_bytes": self.peak_rss_bytes,
+        }
+        if self.duration and self.audio_seconds:
+            data["real_time_factor"] = round(self.duration / self.audio_seconds, 4)
+        if self.error:
+            data["error"] = self.error[-500:]
+        data.update(self.extra)
+        return data
+
+
+class Registry:
+    """Process-wide totals per stage, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}          # (stage, labels, status) -> count
+        self._durations = {}     # (stage, labels) -> [bucket counts..., sum, count]
+        self._totals = {}        # (metric, stage, labels) -> value
+        self._exits = {}         # (stage, labels, exit status) -> count
+        self._peaks = {}         # (stage, labels) -> bytes
+        self._in_progress = {}   # (stage, labels) -> running now
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted(labels.items()))
+
+    def started(self, name, labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._in_progress[key] = self._in_progress.get(key, 0) + 1
+
+    def observe(self, record):
+        key = (record.name, self._labels(record.labels))
+        with self._lock:
+            self._in_progress[key] -= 1
+            run_key = key + (record.status,)
+            self._runs[run_key] = self._runs.get(run_key, 0) + 1
+
+            histogram = self._durations.setdefault(key, [0] * len(DURATION_BUCKETS) + [0.0, 0])
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if record.duration <= bound:
+                    histogram[index] += 1
+            histogram[-2] += record.duration
+            histogram[-1] += 1
+
+            for metric, value in (
+                ("input_bytes", record.input_bytes),
+                ("output_bytes", record.output_bytes),
+                ("audio_seconds", record.audio_seconds or 0),
+            ):
+                total_key = (metric,) + key
+                self._totals[total_key] = self._totals.get(total_key, 0) + value
+
+            if record.exit_status is not None:
+                exit_key = key + (record.exit_status,)
+                self._exits[exit_key] = self._exits.get(exit_key, 0) + 1
+            self._peaks[key] = record.peak_rss_bytes
+
+    def render(self):
+        """Current values as Prometheus exposition text"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP splitter_{name} {help_text}")
+            lines.append(f"# TYPE splitter_{name} {kind}")
+
+        def sample(name, labels, value):
+            text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f"splitter_{name}{{{text}}} {value}" if text else f"splitter_{name} {value}")
+
+        with self._lock:
+            family("stage_runs_total", "counter", "Finished pipeline stages by outcome.")
+            for (name, labels, status), count in sorted(self._runs.items()):
+                sample("stage_runs_total", (("stage", name),) + labels + (("status", status),), count)
+
+            family("stage_in_progress", "gauge", "Pipeline stages running right now.")
+            for (name, labels), count in sorted(self._in_progress.items()):
+                sample("stage_in_progress", (("stage", name),) + labels, count)
+
+            family("stage_duration_seconds", "histogram", "Wall time of pipeline stages.")
+            for (name, labels), histogram in sorted(self._durations.items()):
+                base = (("stage", name),) + labels
+                for bound, count in zip(DURATION_BUCKETS, histogram):
+                    sample("stage_duration_seconds_bucket", base + (("le", f"{bound:g}"),), count)
+                sample("stage_duration_seconds_bucket", base + (("le", "+Inf"),), histogram[-1])
+                sample("stage_duration_seconds_sum", base, f"{histogram[-2]:.6f}")
+                sample("stage_duration_seconds_count", base, histogram[-1])
+
+            for metric, help_text in (
+                ("input_bytes", "Bytes read by pipeline stages."),
+                ("output_bytes", "Bytes written by pipeline stages."),
+                ("audio_seconds", "Seconds of audio handled by pipeline stages."),
+            ):
+                family(f"stage_{metric}_total", "counter", help_text)
+                for (kind, name, labels), value in sorted(self._totals.items()):
+                    if kind == metric:
+                        sample(f"stage_{metric}_total", (("stage", name),) + labels, _number(value))
+
+            family("stage_subprocess_exits_total", "counter", "Exit statuses of ffmpeg/demucs subprocesses.")
+            for (name, labels, code), count in sorted(self._exits.items()):
+                sample("stage_subprocess_exits_total", (("stage", name),) + labels + (("code", code),), count)
+
+            family("stage_peak_rss_bytes", "gauge", "Process peak RSS when the stage last finished.")
+            for (name, labels), peak in sorted(self._peaks.items()):
+                sample("stage_peak_rss_bytes", (("stage", name),) + labels, peak)
+
+        return "\n".join(lines) + "\n"
+
+
+def _number(value):
+    return str(value) if isinstance(value, int) else f"{value:.6f}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+registry = Registry()
+_metrics_file = None
+
+
+def configure_logging(metrics_file=None):
+    """Print stage records as bare JSON lines and optionally mirror metrics to a file.
+
+    The file is rewritten after every stage, e.g. for node_exporter's textfile
+    collector. "{pid}" in its name is replaced so worker processes do not
+    overwrite each other.
+    """
+    global _metrics_file
+    if not any(getattr(handler, "_stage_json", False) for handler in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler._stage_json = True
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    if metrics_file:
+        _metrics_file = Path(str(metrics_file).replace("{pid}", str(os.getpid())))
+
+
+def write_prometheus(path):
+    """Atomically replace `path` with the current metrics"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, suffix=".tmp", delete=False) as f:
+        f.write(registry.render())
+    os.replace(f.name, path)
+
+
+@contextmanager
+def stage(name, **labels):
+    """Time a pipeline stage and record it in the registry and the JSON log.
+
+    Yields a StageRecord for the body to fill in (bytes, audio duration,
+    subprocess exit status). An exception marks the stage failed and is
+    re-raised; code that reports errors by return value calls fail().
+    Peak RSS is the process high-water mark, so it bounds the stage from
+    above rather than isolating it.
+    """
+    record = StageRecord(name, labels)
+    registry.started(name, labels)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        record.duration = time.perf_counter() - start
+        record.peak_rss_bytes = _peak_rss_bytes()
+        registry.observe(record)
+        logger.log(logging.ERROR if record.status == "error" else logging.INFO, json.dumps(record.as_dict()))
+        if _metrics_file is not None:
+            try:
+                write_prometheus(_metrics_file)
+            except OSError as e:
+                logging.getLogger(__name__).warning(f"Could not write metrics file: {e}")
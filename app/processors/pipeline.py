@@ -0,0 +1,296 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import os
+import shutil
+from app.processors.audio_processor import AudioProcessor
+from app.processors.video_processor import VideoProcessor, probe_keyframes
+from app.processors.link_processor import LinkDownloader, check_url
+from app.processors.pipelined import run_pipelined
+from app.processors.checkpoints import ChunkCheckpoint, collect as collect_checkpoints
+from app.processors.stem_cache import StemCache
+from app.processors.audio_io import probe_audio_tracks, probe_duration
+from app.processors.stem_mixer import track_key
+from app.config import settings
+from app.config.presets import engine_options
+
+
+def use_streaming(input_path):
+    """Long inputs are separated window by window so they fit in memory"""
+    duration = probe_duration(input_path)
+    return duration is None or duration > settings.STREAMING_MIN_SECONDS
+
+
+def use_segments(input_path):
+    """Long inputs are separated as segments on several processes when SEGMENT_WORKERS allows it"""
+    if settings.SEGMENT_WORKERS < 2:
+        return False
+    duration = probe_duration(input_path)
+    return duration is not None and duration >= settings.SEGMENT_MIN_SECONDS
+
+
+def two_stems_setting():
+    """`two_stems` argument for the separators: None keeps every source"""
+    return None if settings.ALL_STEMS else "vocals"
+
+
+def stem_cache_settings(engine, output_format="wav", bitrate=None, streaming=False, segmented=False):
+    """Everything besides the input PCM that changes the stems, for StemCache keys"""
+    cache_settings = dict(engine.settings, output_format=output_format, bitrate=bitrate)
+    if settings.ALL_STEMS:
+        # Two-stem entries stay valid under their old keys
+        cache_settings["stems"] = "all"
+    if settings.SKIP_SILENCE:
+        cache_settings["skip_silence"] = [settings.SILENCE_THRESHOLD_DB, settings.SILENCE_MIN_SECONDS]
+    if streaming:
+        cache_settings["streaming"] = [settings.STREAMING_WINDOW_SECONDS, settings.STREAMING_OVERLAP_SECONDS]
+    if segmented:
+        cache_settings["segments"] = [settings.SEGMENT_SECONDS, settings.STREAMING_OVERLAP_SECONDS]
+    return cache_settings
+
+
+def separate_audio(input_path, output_dir, engine, cache=None, streaming=None, wav=None,
+                   output_format="wav", bitrate=None, taps=None, segmented=None, keyframes=None, track=0):
+    """Separate an audio file and return {stem: path}.
+
+    The stems are vocals and no_vocals, or with settings.ALL_STEMS every
+    source of the model; stem_mixer.derive_mix builds other mixes from
+    those. With a StemCache, the decoded PCM is hashed first and a hit is linked
+    into output_dir without running AudioProcessor at all; results always live
+    under output_dir, never in the shared cache. Windowed
+    (streaming) runs keep a ChunkCheckpoint under that key with
+    settings.CHECKPOINTS, so they resume where an interrupted attempt stopped.
+    Segmented runs (see use_segments) split the input at `keyframes`, if
+    given, and separate the segments on a process pool. `track` picks the
+    audio stream of inputs with several. `wav` may carry that stream already
+    decoded in memory, e.g. from a video.
+    `taps` ({stem: writer}) see the stems as they are produced; a cache hit
+    never writes to them.
+    """
+    if segmented is None:
+        segmented = wav is None and not streaming and use_segments(input_path)
+    if segmented:
+        streaming = False
+    elif streaming is None:
+        streaming = wav is None and use_streaming(input_path)
+
+    key = None
+    cache_settings = stem_cache_settings(engine, output_format, bitrate, streaming, segmented)
+    if (streaming or segmented) and (cache is not None or (streaming and settings.CHECKPOINTS)):
+        key = StemCache.make_file_key(
+            input_path, engine.model_name, cache_settings, engine.samplerate, engine.audio_channels, track
+        )
+    elif cache is not None:
+        if wav is None:
+            wav = engine.load_audio(input_path, track)
+        key = cache.make_key(wav, engine.model_name, cache_settings)
+    if cache is not None:
+        # Linked into the job's own folder, where AudioProcessor would have put them
+        cached = cache.restore(key, Path(output_dir) / engine.model_name / Path(input_path).stem)
+        if cached:
+            return cached
+
+    checkpoint = None
+    if streaming and settings.CHECKPOINTS:
+        # Same key as the cache: a job submitted again picks up the chunks of an interrupted attempt
+        collect_checkpoints(
+            settings.CHECKPOINT_DIR, settings.CHECKPOINT_MAX_BYTES, settings.CHECKPOINT_STALE_SECONDS
+        )
+        checkpoint = ChunkCheckpoint(settings.CHECKPOINT_DIR, key)
+
+    audio_proc = AudioProcessor(
+        input_path, output_dir, engine=engine, streaming=streaming,
+        window_seconds=settings.STREAMING_WINDOW_SECONDS,
+        overlap_seconds=settings.STREAMING_OVERLAP_SECONDS,
+        output_format=output_format,
+        bitrate=bitrate,
+        skip_silence=settings.SKIP_SILENCE,
+        silence_threshold_db=settings.SILENCE_THRESHOLD_DB,
+        silence_min_seconds=settings.SILENCE_MIN_SECONDS,
+        two_stems=two_stems_setting(),
+        checkpoint=checkpoint,
+        segment_seconds=settings.SEGMENT_SECONDS if segmented else None,
+        segment_workers=settings.SEGMENT_WORKERS,
+        keyframes=keyframes,
+        track=track
+    )
+    try:
+        if not audio_proc.run_demucs(wav=wav, taps=taps):
+            raise RuntimeError("Demucs processing failed.")
+
+        stems = audio_proc.get_stem_paths()
+        if "vocals" not in stems or len(stems) < 2:
+            raise FileNotFoundError("Processed audio files not found.")
+
+        if cache is not None:
+            cache.store(key, stems)
+        if checkpoint is not None:
+            checkpoint.discard()
+    finally:
+        if checkpoint is not None:
+            # Keeps the chunks of a failed run for the next attempt, but lets it take them over
+            checkpoint.close()
+    return stems
+
+
+
+def _adopt_input(input_path, work_dir):
+    """Move a staged upload into the job's work directory so it is cleaned up with it"""
+    target = Path(work_dir) / "input" / Path(input_path).name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(input_path), target)
+    shutil.rmtree(Path(input_path).parent, ignore_errors=True)
+    return target
+
+
+def run_audio_job(work_dir, input_path, engine, cache=None, output_format="wav", bitrate=None):
+    """Job body for an uploaded audio file"""
+    input_path = _adopt_input(input_path, work_dir)
+    return separate_audio(
+        input_path, Path(work_dir) / "output", engine, cache, output_format=output_format, bitrate=bitrate
+    )
+
+
+def process_video_file(video_path, work_dir, engine, cache=None, output_format="wav", bitrate=None, streaming=None):
+    """Separate a video's soundtrack and mux the vocals back in; returns the result paths.
+
+    `streaming` forces windowed (True) or whole (False) separation instead
+    of choosing by length.
+    """
+    video_proc = VideoProcessor(video_path, Path(work_dir) / "output")
+    tracks = probe_audio_tracks(video_path) if settings.ALL_AUDIO_TRACKS else []
+    if len(tracks) > 1:
+        return _process_video_tracks(video_proc, len(tracks), engine, cache, output_format, bitrate, streaming)
+
+    # The soundtrack goes from ffmpeg's stdout straight into the engine, either
+    # whole, window by window or segment by segment for long videos; no
+    # extracted WAV is written
+    segmented = streaming is None and use_segments(video_path)
+    keyframes = probe_keyframes(video_path) if segmented else None
+    if streaming is None:
+        streaming = not segmented and use_streaming(video_path)
+    wav = None
+    if not streaming and not segmented:
+        wav = video_proc.decode_audio(engine.samplerate, engine.audio_channels)
+        if wav is None:
+            raise RuntimeError(video_proc.last_error or "Audio extraction from video failed.")
+
+    # With FAST_MUX, WAV/FLAC vocals are piped into the final video while
+    # they are separated; the muxer only starts on the first block, so a
+    # cache hit falls back to muxing the cached file
+    muxer = None
+    if settings.FAST_MUX:
+        muxer = video_proc.open_muxer(engine.samplerate, output_format)
+    try:
+        stems = separate_audio(
+            video_path, video_proc.output_dir, engine, cache, streaming=streaming, wav=wav,
+            output_format=output_format, bitrate=bitrate, taps={"vocals": muxer} if muxer else None,
+            segmented=segmented, keyframes=keyframes
+        )
+    except BaseException:
+        if muxer is not None:
+            muxer.abort()
+        raise
+
+    if muxer is not None and muxer.started:
+        final_video_path = muxer.close()
+    else:
+        # AAC/MP3/Opus vocals are stream-copied into the video instead of encoded again
+        final_video_path = video_proc.combine_video_audio(stems["vocals"], fast=settings.FAST_MUX)
+    if not final_video_path:
+        raise RuntimeError(video_proc.last_error or "Final video creation failed.")
+    return dict(stems, video=final_video_path)
+
+
+def _process_video_tracks(video_proc, count, engine, cache=None, output_format="wav", bitrate=None, streaming=None):
+    """Separate all audio tracks of a video at the same time and mux every track's vocals back in.
+
+    Each track is read straight from the video by its stream index, into its
+    own output folder. The first track's stems keep their usual names; the
+    others are suffixed with their track index (see stem_mixer.track_key).
+    A job worker has one separation's worth of threads and memory
+    (SEPARATION_WORKERS bounds the jobs), so whole or windowed tracks are
+    separated one after another; segmented tracks are submitted together,
+    since the SEGMENT_WORKERS process pool bounds them.
+    """
+    video_path = video_proc.input_video
+    segmented = streaming is None and use_segments(video_path)
+    keyframes = probe_keyframes(video_path) if segmented else None
+    if streaming is None:
+        streaming = not segmented and use_streaming(video_path)
+
+    def separate_track(track):
+        wav = None
+        if not streaming and not segmented:
+            wav = video_proc.decode_audio(engine.samplerate, engine.audio_channels, track)
+            if wav is None:
+                raise RuntimeError(video_proc.last_error or "Audio extraction from video failed.")
+        return separate_audio(
+            video_path, video_proc.output_dir / f"track{track}", engine, cache, streaming=streaming, wav=wav,
+            output_format=output_format, bitrate=bitrate, segmented=segmented, keyframes=keyframes, track=track
+        )
+
+    with ThreadPoolExecutor(max_workers=count if segmented else 1, thread_name_prefix="audio-track") as pool:
+        track_stems = list(pool.map(separate_track, range(count)))
+
+    final_video_path = video_proc.combine_video_audio(
+        [stems["vocals"] for stems in track_stems], fast=settings.FAST_MUX
+    )
+    if not final_video_path:
+        raise RuntimeError(video_proc.last_error or "Final video creation failed.")
+    results = {
+        track_key(name, track): path for track, stems in enumerate(track_stems) for name, path in stems.items()
+    }
+    return dict(results, video=final_video_path)
+
+
+def run_video_job(work_dir, input_path, engine, cache=None, output_format="wav", bitrate=None):
+    """Job body for an uploaded video file"""
+    input_path = _adopt_input(input_path, work_dir)
+    return process_video_file(input_path, work_dir, engine, cache, output_format, bitrate)
+
+
+def run_preset_job(work_dir, job_fn, source, preset, cache=None, **options):
+    """Job body that loads the preset's engine on the worker, then runs one of the job functions here.
+
+    The first job with a preset pays for loading (or downloading) its
+    models, instead of whoever submitted it.
+    """
+    from app.processors.separation_engine import get_engine
+
+    engine = get_engine(**engine_options(preset))
+    return job_fn(work_dir, source, engine, cache, **options)
+
+
+def run_url_job(work_dir, url, engine, cache=None, output_format="wav", bitrate=None, want_video=True):
+    """Job body for a URL: download, then process like an uploaded video.
+
+    With want_video=False only the audio stream is downloaded and separated.
+    URLs that are not in the download cache yet go through run_pipelined,
+    which starts separating while the download is still running. Cached
+    downloads are then separated window by window as well, whatever their
+    length, so they look up the StemCache key the pipelined run stored.
+    Only http(s) URLs are accepted, and file: URLs with
+    settings.ALLOW_FILE_URLS.
+    """
+    check_url(url, settings.ALLOW_FILE_URLS)
+    downloader = LinkDownloader(Path(work_dir) / "downloaded", cache_dir=settings.DOWNLOAD_CACHE_DIR,
+                                allow_file_urls=settings.ALLOW_FILE_URLS,
+                                cache_max_bytes=settings.DOWNLOAD_CACHE_MAX_BYTES)
+    if settings.PIPELINED_URLS and not downloader.cached_download(url, want_video):
+        cache_settings = stem_cache_settings(engine, output_format, bitrate, streaming=True)
+        return run_pipelined(url, work_dir, engine, cache, cache_settings, output_format, bitrate, want_video,
+                             two_stems_setting())
+
+    streaming = True if settings.PIPELINED_URLS else None
+    media_path = downloader.download_from_url(url, want_video=want_video)
+    if not media_path:
+        raise RuntimeError(downloader.last_error or "Download failed")
+    if os.path.getsize(media_path) == 0:
+        raise RuntimeError("Downloaded file is empty")
+
+    if not want_video:
+        return separate_audio(
+            media_path, Path(work_dir) / "output", engine, cache, streaming=streaming,
+            output_format=output_format, bitrate=bitrate
+        )
+    return process_video_file(media_path, work_dir, engine, cache, output_format, bitrate, streaming)
@@ -0,0 +1,407 @@
+from pathlib import Path
+import logging
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+import numpy as np
+from app.processors.audio_io import STEM_FORMATS, FfmpegAudioReader, StderrTail, open_stem_writer
+from app.processors.chunked_separator import ChunkedSeparator
+from app.processors.link_processor import LinkDownloader
+from app.processors.silence import SilenceSkipper
+from app.processors.stem_cache import PcmHasher
+from app.processors.video_processor import VideoProcessor
+from app.processors import metrics
+
+logger = logging.getLogger(__name__)
+
+FEED_CHUNK_BYTES = 1 << 20
+# Decoded audio goes to the separator in small blocks, so its first window
+# is complete as soon as that much of the download has arrived
+DECODE_BLOCK_SECONDS = 1.0
+_END = object()
+
+
+class PipelineAborted(Exception):
+    """Raised in a stage when another stage has failed; only the first error is reported"""
+
+
+class GrowingFileReader(FfmpegAudioReader):
+    """FfmpegAudioReader for a file that is still being written, e.g. by yt-dlp.
+
+    A feeder thread copies the file into ffmpeg's stdin as it grows and
+    closes stdin once `finished` is set and the last bytes are copied, so
+    decoding keeps pace with the download. ffmpeg cannot seek in a pipe:
+    an MP4 whose index sits at the end fails here without producing any
+    audio and has to be decoded from the finished file instead.
+    """
+
+    def __init__(self, path, finished, samplerate=44100, channels=2, poll_seconds=0.05):
+        super().__init__("pipe:0", samplerate, channels)
+        self.path = Path(path)
+        self.finished = finished
+        self.poll_seconds = poll_seconds
+        self.fed_bytes = 0
+        self._stop = threading.Event()
+        self._feeder = None
+
+    def open(self):
+        self._eof = False
+        self._stop.clear()
+        self.process = subprocess.Popen(
+            self.command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self.stderr = StderrTail(self.process.stderr)
+        self._feeder = threading.Thread(target=self._feed, args=(self.process.stdin,), daemon=True)
+        self._feeder.start()
+        return self
+
+    def _feed(self, stdin):
+        try:
+            while not self.path.exists():
+                if self._stop.is_set() or self.finished.is_set():
+                    return
+                time.sleep(self.poll_seconds)
+            with open(self.path, "rb") as f:
+                while not self._stop.is_set():
+                    # Checked before reading, so bytes written just before `finished` are not lost
+                    done = self.finished.is_set()
+                    chunk = f.read(FEED_CHUNK_BYTES)
+                    if chunk:
+                        stdin.write(chunk)
+                        self.fed_bytes += len(chunk)
+                    elif done:
+                        return
+                    else:
+                        time.sleep(self.poll_seconds)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg stopped reading: it failed or the reader was closed early
+            pass
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def close(self):
+        self._stop.set()
+        try:
+            super().close()
+        finally:
+            if self._feeder is not None:
+                self._feeder.join()
+                self._feeder = None
+
+
+class PipelinedRun:
+    """Download, decode, separate and encode a URL as overlapping stages.
+
+    yt-dlp writes the download to disk while a GrowingFileReader decodes
+    it, a ChunkedSeparator turns the decoded windows into stem chunks, and
+    the calling thread encodes those into the stem files and, for videos,
+    a StreamingMuxer. Stages hand over through queues that hold at most
+    `queue_depth` windows of audio, so a slow separator stalls decoding
+    instead of buffering the track; the download lands on disk and is never
+    held back.
+
+    The video stream can only be muxed once the download is complete.
+    Vocals separated before then are spooled to a temporary file in
+    `work_dir` and replayed into the muxer when it starts, so memory does
+    not grow with a slow download.
+
+    `timings` holds seconds from the start to each milestone, and `waits`
+    how long each stage spent blocked on a full (backpressure) or empty
+    queue.
+    """
+
+    def __init__(self, url, work_dir, engine, cache=None, cache_settings=None, output_format="wav", bitrate=None,
+                 want_video=True, download_cache_dir=None, window_seconds=30.0, overlap_seconds=2.0,
+                 skipper=None, queue_depth=2, two_stems="vocals", allow_file_urls=False,
+                 download_cache_max_bytes=None):
+        self.url = url
+        self.work_dir = Path(work_dir)
+        self.engine = engine
+        self.cache = cache
+        self.cache_settings = cache_settings
+        self.output_format = output_format
+        self.bitrate = bitrate
+        self.want_video = want_video
+        # None keeps every source instead of vocals and no_vocals
+        self.two_stems = two_stems
+        self.downloader = LinkDownloader(self.work_dir / "downloaded", cache_dir=download_cache_dir,
+                                         allow_file_urls=allow_file_urls, cache_max_bytes=download_cache_max_bytes)
+        self.separator = ChunkedSeparator(engine, window_seconds, overlap_seconds, skipper)
+        self.hasher = PcmHasher(engine.model_name, cache_settings) if cache is not None else None
+
+        self.media_path = None
+        self.error = None
+        self.timings = {}
+        self.waits = {"decode": 0.0, "separate": 0.0, "encode": 0.0}
+        self.decoded_frames = 0
+        self.block_frames = int(DECODE_BLOCK_SECONDS * engine.samplerate)
+        self._decoded = queue.Queue(maxsize=queue_depth * -(-self.separator.window // self.block_frames))
+        self._separated = queue.Queue(maxsize=queue_depth)
+        self._path_known = threading.Event()
+        self._downloaded = threading.Event()
+        self._abort = threading.Event()
+        self._start = None
+
+    # Plumbing shared by the stages
+
+    def _mark(self, name):
+        self.timings.setdefault(name, round(time.perf_counter() - self._start, 4))
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self._abort.set()
+
+    def _check(self):
+        if self._abort.is_set():
+            raise PipelineAborted()
+
+    def _put(self, q, item, stage):
+        start = time.perf_counter()
+        while True:
+            self._check()
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.waits[stage] += time.perf_counter() - start
+
+    def _get(self, q, stage):
+        start = time.perf_counter()
+        while True:
+            self._check()
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        self.waits[stage] += time.perf_counter() - start
+        return item
+
+    def _drain(self, q, stage):
+        while True:
+            item = self._get(q, stage)
+            if item is _END:
+                return
+            yield item
+
+    # Stages
+
+    def _download(self):
+        def hook(status):
+            # Raising from a progress hook is how yt-dlp downloads are cancelled
+            if self._abort.is_set():
+                raise PipelineAborted()
+            if self.media_path is None and status.get("filename"):
+                self.media_path = status["filename"]
+                self._path_known.set()
+
+        try:
+            path = self.downloader.download_from_url(self.url, self.want_video, progress_hooks=[hook])
+            if not path:
+                raise RuntimeError(self.downloader.last_error or "Download failed")
+            if os.path.getsize(path) == 0:
+                raise RuntimeError("Downloaded file is empty")
+            self.media_path = path
+            self._mark("downloaded")
+        except BaseException as e:
+            self._fail(e)
+            # A cut-off download must not be picked up as finished later
+            if self.media_path and not self.downloader.last_cached:
+                Path(self.media_path).unlink(missing_ok=True)
+        finally:
+            self._downloaded.set()
+            self._path_known.set()
+
+    def _pump(self, reader, frames):
+        with reader:
+            for block in reader.blocks(frames):
+                if self.hasher is not None:
+                    self.hasher.update(block)
+                self.decoded_frames += block.shape[1]
+                self._mark("first_decoded")
+                self._put(self._decoded, block, "decode")
+
+    def _decode(self):
+        try:
+            self._path_known.wait()
+            self._check()
+            samplerate, channels = self.engine.samplerate, self.engine.audio_channels
+            frames = self.block_frames
+            try:
+                self._pump(GrowingFileReader(self.media_path, self._downloaded, samplerate, channels), frames)
+            except RuntimeError as e:
+                if self.decoded_frames:
+                    raise
+                logger.info(f"Cannot decode the download while it grows, waiting for it to finish: {e}")
+            if not self.decoded_frames:
+                self._downloaded.wait()
+                self._check()
+                self._pump(FfmpegAudioReader(self.media_path, samplerate, channels), frames)
+            self._put(self._decoded, _END, "decode")
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _separate(self):
+        try:
+            blocks = self._drain(self._decoded, "separate")
+            for chunk in self.separator.iter_separated(blocks, two_stems=self.two_stems):
+                self._put(self._separated, chunk, "separate")
+            self._put(self._separated, _END, "separate")
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _encode(self):
+        """Write stem chunks to their files and the vocals to the muxer; runs on the calling thread.
+
+        Vocals in a format MP4 can carry are not piped: the finished file is
+        stream-copied into the video, so they are encoded only once.
+        """
+        writers = {}
+        video_proc = muxer = None
+        # Vocals separated while the download is still running, as raw float32 frames
+        spool = None
+        channels = None
+        pipe_video = self.want_video and not STEM_FORMATS[self.output_format]["mp4"]
+        try:
+            for chunk in self._drain(self._separated, "encode"):
+                self._mark("first_chunk")
+                stem_dir = self.work_dir / "output" / self.engine.model_name / Path(self.media_path).stem
+                for name, block in chunk.items():
+                    if name not in writers:
+                        writers[name] = open_stem_writer(
+                            stem_dir, name, self.engine.samplerate, block.shape[0], self.output_format, self.bitrate
+                        )
+                    writers[name].write(block)
+                if not pipe_video:
+                    continue
+                if muxer is None and self._downloaded.is_set():
+                    video_proc, muxer = self._open_muxer(spool, channels)
+                    spool = None
+                if muxer is not None:
+                    muxer.write(chunk["vocals"])
+                else:
+                    if spool is None:
+                        spool = tempfile.TemporaryFile(dir=self.work_dir)
+                    channels = chunk["vocals"].shape[0]
+                    spool.write(np.ascontiguousarray(chunk["vocals"].T, dtype=np.float32).tobytes())
+            self._mark("separated")
+
+            for writer in writers.values():
+                writer.close()
+            paths = {name: str(writer.path) for name, writer in writers.items()}
+            if "vocals" not in paths:
+                raise RuntimeError("No audio was decoded from the download")
+            if not self.want_video:
+                return paths
+
+            # Separation finished first: the rest of the vocals wait for the video
+            self._downloaded.wait()
+            self._check()
+            if not pipe_video:
+                video_proc = VideoProcessor(self.media_path, self.work_dir / "output")
+                final_video = video_proc.combine_video_audio(paths["vocals"])
+            else:
+                if muxer is None:
+                    video_proc, muxer = self._open_muxer(spool, channels)
+                    spool = None
+                final_video = muxer.close()
+            if not final_video:
+                raise RuntimeError(video_proc.last_error or "Final video creation failed.")
+            paths["video"] = final_video
+            return paths
+        except BaseException:
+            for writer in writers.values():
+                writer.close()
+            if muxer is not None:
+                muxer.abort()
+            raise
+        finally:
+            if spool is not None:
+                spool.close()
+
+    def _open_muxer(self, spool, channels):
+        """Start muxing the finished download and replay the spooled vocals into it, a block at a time"""
+        video_proc = VideoProcessor(self.media_path, self.work_dir / "output")
+        muxer = video_proc.open_muxer(self.engine.samplerate, self.output_format)
+        if spool is not None:
+            with spool:
+                spool.seek(0)
+                frame_bytes = channels * np.dtype(np.float32).itemsize
+                while True:
+                    data = spool.read(self.block_frames * frame_bytes)
+                    if not data:
+                        break
+                    muxer.write(np.frombuffer(data, dtype=np.float32).reshape(-1, channels).T)
+        return video_proc, muxer
+
+    def run(self):
+        """Run all stages and return {stem: path} for every stem, plus "video" if wanted"""
+        with metrics.stage("pipelined", mode="video" if self.want_video else "audio") as record:
+            self._start = time.perf_counter()
+            threads = [
+                threading.Thread(target=target, name=f"pipelined-{name}", daemon=True)
+                for name, target in (("download", self._download), ("decode", self._decode),
+                                     ("separate", self._separate))
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                results = self._encode()
+            except PipelineAborted:
+                results = None
+            except BaseException as e:
+                self._fail(e)
+                results = None
+            for thread in threads:
+                thread.join()
+            self._mark("done")
+
+            record.audio_seconds = self.decoded_frames / self.engine.samplerate
+            record.extra.update({f"{name}_s": value for name, value in self.timings.items()})
+            record.extra.update({f"{name}_wait_s": round(value, 4) for name, value in self.waits.items()})
+            if self.error is not None:
+                raise self.error
+            record.add_input(self.media_path)
+            record.add_output(*results.values())
+
+        if self.cache is not None:
+            # The key covers the same decoded PCM as StemCache.make_file_key on the finished download
+            self.cache.store(self.hasher.hexdigest(),
+                             {name: path for name, path in results.items() if name != "video"})
+        return results
+
+
+def run_pipelined(url, work_dir, engine, cache=None, cache_settings=None, output_format="wav", bitrate=None,
+                  want_video=True, two_stems="vocals"):
+    """PipelinedRun under the app settings; returns the result paths like run_url_job"""
+    from app.config import settings
+
+    skipper = None
+    if settings.SKIP_SILENCE:
+        skipper = SilenceSkipper(engine, settings.SILENCE_THRESHOLD_DB, settings.SILENCE_MIN_SECONDS)
+    run = PipelinedRun(
+        url, work_dir, engine, cache=cache, cache_settings=cache_settings,
+        output_format=output_format, bitrate=bitrate, want_video=want_video,
+        download_cache_dir=settings.DOWNLOAD_CACHE_DIR,
+        download_cache_max_bytes=settings.DOWNLOAD_CACHE_MAX_BYTES,
+        window_seconds=settings.STREAMING_WINDOW_SECONDS,
+        overlap_seconds=settings.STREAMING_OVERLAP_SECONDS,
+        skipper=skipper, queue_depth=settings.PIPELINE_QUEUE_DEPTH, two_stems=two_stems,
+        allow_file_urls=settings.ALLOW_FILE_URLS
+    )
+    return run.run()
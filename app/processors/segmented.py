@@ -0,0 +1,231 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import numpy as np
+from app.processors.audio_io import FfmpegAudioReader, open_stem_writer
+
+DEFAULT_SEGMENT_SECONDS = 120.0
+DEFAULT_OVERLAP_SECONDS = 2.0
+# Decoded before every segment and dropped: lossy decoders need a few
+# thousand samples after a seek before they match a decode from the start
+PREROLL_SECONDS = 0.5
+WRITE_BLOCK_FRAMES = 1 << 18
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """Process pool shared by every segmented separation, so workers keep their models between jobs"""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # Spawned, not forked: the parent runs torch and server threads
+            pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(workers,)
+            )
+            _pools[workers] = pool
+    return pool
+
+
+def discard_pool(workers, pool):
+    """Forget a pool whose worker died, so the next job starts a fresh one"""
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _init_worker(workers):
+    from app.processors.separation_engine import set_worker_threads
+
+    set_worker_threads(workers)
+
+
+def _read_frames(reader, frames):
+    """Read exactly `frames` samples, fewer only at the end of the input"""
+    blocks = []
+    while frames > 0:
+        block = reader.read(min(frames, WRITE_BLOCK_FRAMES))
+        if block.shape[1] == 0:
+            break
+        blocks.append(block)
+        frames -= block.shape[1]
+    if not blocks:
+        return np.zeros((reader.channels, 0), dtype=np.float32)
+    return np.concatenate(blocks, axis=1)
+
+
+def separate_segment(engine_options, input_path, track, start, end, preroll, two_stems, silence, output_dir):
+    """Worker body: separate frames [start, end) of an input (end None: to the end) into .npy stems.
+
+    Decoding starts `preroll` frames early through an input seek, so the
+    samples kept match a decode of the whole file. `silence` is None or the
+    (threshold_db, min_seconds) of a SilenceSkipper.
+    """
+    from app.processors.separation_engine import get_engine
+    from app.processors.silence import SilenceSkipper
+
+    engine = get_engine(**engine_options)
+    seek = max(0, start - preroll)
+    reader = FfmpegAudioReader(input_path, engine.samplerate, engine.audio_channels, track,
+                               start=seek / engine.samplerate)
+    with reader:
+        reader.skip(start - seek)
+        wav = reader.read_all() if end is None else _read_frames(reader, end - start)
+
+    if silence is not None:
+        stems = SilenceSkipper(engine, *silence).separate(wav, two_stems)
+    else:
+        sources = engine.separate(wav)
+        if two_stems:
+            sources = engine.two_stems(sources, two_stems)
+        stems = {name: source.cpu().numpy() for name, source in sources.items()}
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for name, stem in stems.items():
+        paths[name] = str(output_dir / f"{name}.npy")
+        np.save(paths[name], np.asarray(stem, dtype=np.float32))
+    return paths
+
+
+class SegmentedSeparator:
+    """Separate a long input as segments on a pool of worker processes.
+
+    The input is cut into segments of about `segment_seconds`, at video
+    keyframes when there are any. Each worker process decodes its segment
+    plus `overlap_seconds` before it with an input seek and separates it
+    with its own copy of the model, so the segments run on `workers` cores
+    at once. Neighbouring segments are cross-faded over the overlap exactly
+    like ChunkedSeparator windows, so the same MAX_DEVIATION_DB tolerance
+    against whole-file separation applies. The stems come back as float
+    .npy files and are stitched in order straight into the stem writers,
+    lossless up to the output format.
+
+    Only separation is spread over the pool: the video is muxed once from
+    the stitched vocals, because encoding AAC per segment and concatenating
+    the pieces clicks at every boundary (each piece brings its own encoder
+    priming).
+    """
+
+    def __init__(self, engine, segment_seconds=DEFAULT_SEGMENT_SECONDS, overlap_seconds=DEFAULT_OVERLAP_SECONDS,
+                 workers=2, silence=None):
+        if overlap_seconds * 2 > segment_seconds:
+            raise ValueError("overlap_seconds must be at most half of segment_seconds")
+        self.engine = engine
+        self.workers = workers
+        self.silence = silence
+        # Seeks and boundaries sit on a 10 ms grid, which ffmpeg's microsecond
+        # timestamps hit exactly; elsewhere the decode after a seek is resampled
+        self.grid = engine.samplerate // 100
+        self.segment_seconds = segment_seconds
+        self.overlap = self._to_grid(overlap_seconds)
+        self.preroll = self._to_grid(PREROLL_SECONDS)
+        self.fade_in = np.linspace(0.0, 1.0, self.overlap, dtype=np.float32)
+        self.fade_out = 1.0 - self.fade_in
+
+    @property
+    def settings(self):
+        return {"segment": self.segment_seconds, "overlap": self.overlap}
+
+    def _to_grid(self, seconds):
+        return int(round(seconds * 100)) * self.grid
+
+    def plan(self, duration, keyframes=None):
+        """Segment start frames: every segment_seconds, moved to the next keyframe if there are any.
+
+        A remainder shorter than half a segment is added to the last segment.
+        """
+        keyframes = sorted(keyframes or [])
+        starts = [0]
+        position = 0.0
+        while True:
+            target = position + self.segment_seconds
+            later = [time for time in keyframes if time >= target]
+            if keyframes:
+                if not later:
+                    break
+                target = later[0]
+            if duration - target < self.segment_seconds / 2:
+                break
+            starts.append(self._to_grid(target))
+            position = target
+        return starts
+
+    def separate_file(self, input_path, output_dir, duration, two_stems="vocals", output_format="wav", bitrate=None,
+                      taps=None, keyframes=None, track=0):
+        """Separate `input_path` on the pool into <output_dir>/<stem><ext> and return the paths.
+
+        `taps` maps stem names to extra writers that get every block, in order.
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        starts = self.plan(duration, keyframes)
+        ends = starts[1:] + [None]
+        work_dir = Path(tempfile.mkdtemp(dir=output_dir, prefix=".segments-"))
+        tasks = [
+            (self.engine.options, str(input_path), track, max(0, start - self.overlap) if index else 0, end,
+             self.preroll, two_stems, self.silence, str(work_dir / f"{index:05d}"))
+            for index, (start, end) in enumerate(zip(starts, ends))
+        ]
+        pool = get_pool(self.workers)
+        try:
+            futures = [pool.submit(separate_segment, *task) for task in tasks]
+        except BrokenProcessPool:
+            # Broken during an earlier job
+            discard_pool(self.workers, pool)
+            pool = get_pool(self.workers)
+            futures = [pool.submit(separate_segment, *task) for task in tasks]
+        print(f"Separating {len(starts)} segments on {self.workers} processes")
+
+        writers = {}
+        pending = None
+        try:
+            for index, future in enumerate(futures):
+                stems = {name: np.load(path, mmap_mode="r") for name, path in future.result().items()}
+                last = index == len(futures) - 1
+                tails = {}
+                for name, wav in stems.items():
+                    if name not in writers:
+                        writers[name] = open_stem_writer(
+                            output_dir, name, self.engine.samplerate, wav.shape[0], output_format, bitrate
+                        )
+                    start = 0
+                    if pending is not None:
+                        head = pending[name] * self.fade_out + wav[:, :self.overlap] * self.fade_in
+                        self._write(writers[name], taps, name, head)
+                        start = self.overlap
+                    end = wav.shape[1] if last else wav.shape[1] - self.overlap
+                    for block_start in range(start, end, WRITE_BLOCK_FRAMES):
+                        block = np.asarray(wav[:, block_start:min(end, block_start + WRITE_BLOCK_FRAMES)])
+                        self._write(writers[name], taps, name, block)
+                    tails[name] = np.array(wav[:, end:])
+                pending = tails
+                del stems
+                shutil.rmtree(work_dir / f"{index:05d}", ignore_errors=True)
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for memory; later jobs get a new pool
+            discard_pool(self.workers, pool)
+            raise
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            for writer in writers.values():
+                writer.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return {name: str(writer.path) for name, writer in writers.items()}
+
+    @staticmethod
+    def _write(writer, taps, name, block):
+        writer.write(block)
+        if taps and name in taps:
+            taps[name].write(block)
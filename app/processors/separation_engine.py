@@ -0,0 +1,218 @@
+from pathlib import Path
+import os
+import threading
+import time
+
+DEFAULT_MODEL = "htdemucs"
+SAVE_BLOCK_FRAMES = 1 << 18
+
+# How the model runs. "float" is plain Demucs. "bf16" runs convolutions and
+# matmuls under CPU autocast in bfloat16, which pays off on CPUs with native
+# bf16 support (AVX512-BF16/AMX) and is slower elsewhere. "int8" stores the
+# weights of Linear/LSTM layers as int8 and quantizes their inputs on the fly;
+# in HTDemucs that only covers the cross-domain transformer. Both are CPU only.
+# benchmarks/backend_quality.py checks SDR and throughput.
+BACKENDS = ("float", "bf16", "int8")
+
+
+def quantize_int8(model):
+    """Dynamically quantize a model's Linear and LSTM layers to int8, in place"""
+    import warnings
+    import torch
+
+    with warnings.catch_warnings():
+        # Eager-mode quantization warns about its future deprecation on every call
+        warnings.simplefilter("ignore")
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8, inplace=True
+        )
+
+
+class SeparationEngine:
+    """Demucs model loaded once and applied directly to audio tensors"""
+
+    # Accelerated backends may lose at most this much SDR against the float model
+    MAX_SDR_LOSS_DB = 0.5
+
+    def __init__(self, model_name=DEFAULT_MODEL, device="cpu", shifts=1, overlap=0.25, segment=None, jobs=0,
+                 backend="float"):
+        import torch
+        from demucs.pretrained import get_model
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of: {', '.join(BACKENDS)}")
+        if backend != "float" and device != "cpu":
+            raise ValueError(f"The {backend} backend only runs on the CPU")
+        self.model_name = model_name
+        self.device = device
+        self.shifts = shifts
+        self.overlap = overlap
+        self.segment = segment
+        self.jobs = jobs
+        self.backend = backend
+
+        start = time.perf_counter()
+        self.model = get_model(model_name)
+        self.model.to(torch.device(device))
+        self.model.eval()
+        if backend == "int8":
+            quantize_int8(self.model)
+        self.load_seconds = time.perf_counter() - start
+        print(f"Loaded Demucs model '{model_name}' ({backend}) in {self.load_seconds:.2f}s")
+
+    @property
+    def samplerate(self):
+        return self.model.samplerate
+
+    @property
+    def audio_channels(self):
+        return self.model.audio_channels
+
+    @property
+    def sources(self):
+        return list(self.model.sources)
+
+    @property
+    def settings(self):
+        """Everything besides the input that changes the separated output"""
+        settings = {"shifts": self.shifts, "overlap": self.overlap, "segment": self.segment}
+        if self.backend != "float":
+            # Left out for float so stems cached before backends existed still match
+            settings["backend"] = self.backend
+        return settings
+
+    @property
+    def options(self):
+        """Keyword arguments for get_engine that load the same model in another process"""
+        return {"model_name": self.model_name, "device": self.device, "shifts": self.shifts,
+                "overlap": self.overlap, "segment": self.segment, "jobs": self.jobs, "backend": self.backend}
+
+    @property
+    def chunk_grid(self):
+        """(segment, stride) in samples: apply_model runs the model on segments starting every stride"""
+        model = self.model.models[0] if hasattr(self.model, "models") else self.model
+        segment = int(self.samplerate * float(self.segment or model.segment))
+        return segment, int((1 - self.overlap) * segment)
+
+    def load_audio(self, path, track=0):
+        """Decode an audio file (its audio stream `track`) into a (channels, samples) float tensor at the model rate"""
+        from demucs.audio import AudioFile, convert_audio
+
+        path = Path(path)
+        try:
+            return AudioFile(path).read(
+                streams=track,
+                samplerate=self.samplerate,
+                channels=self.audio_channels
+            )
+        except FileNotFoundError:
+            # ffmpeg is missing, fall back to torchaudio for formats it can read itself
+            import torchaudio
+
+            wav, sr = torchaudio.load(str(path))
+            return convert_audio(wav, sr, self.samplerate, self.audio_channels)
+
+    def separate(self, wav):
+        """Separate a (channels, samples) tensor or array into a dict of source name -> tensor"""
+        import contextlib
+        import numpy as np
+        import torch
+        from demucs.apply import apply_model
+
+        if not torch.is_tensor(wav):
+            wav = torch.from_numpy(np.ascontiguousarray(wav, dtype=np.float32))
+
+        # Same normalisation the demucs CLI applies before running the model
+        ref = wav.mean(0)
+        mean = ref.mean()
+        std = ref.std() + 1e-8
+        wav = (wav - mean) / std
+
+        autocast = contextlib.nullcontext()
+        if self.backend == "bf16":
+            autocast = torch.autocast("cpu", dtype=torch.bfloat16)
+        with torch.no_grad(), autocast:
+            sources = apply_model(
+                self.model,
+                wav[None],
+                shifts=self.shifts,
+                split=True,
+                overlap=self.overlap,
+                progress=False,
+                device=self.device,
+                num_workers=self.jobs,
+                segment=self.segment
+            )[0]
+
+        sources = sources.float() * std + mean
+        return dict(zip(self.model.sources, sources))
+
+    def two_stems(self, sources, stem="vocals"):
+        """Collapse separated sources into `stem` and `no_<stem>` like `--two-stems`"""
+        selected = sources[stem]
+        rest = sum(wav for name, wav in sources.items() if name != stem)
+        return {stem: selected, f"no_{stem}": rest}
+
+    def save_stems(self, stems, output_dir, output_format="wav", bitrate=None, taps=None, shared_scale=False):
+        """Encode each stem straight from memory into output_dir and return their paths.
+
+        `taps` maps stem names to extra writers (e.g. a StreamingMuxer) that
+        get the same blocks as the stem file. With `shared_scale` every stem
+        is scaled down by the same factor when one would clip, so the saved
+        stems still add up to mixes of the source.
+        """
+        import numpy as np
+        from app.processors.audio_io import open_stem_writer
+
+        stems = {name: wav.cpu().numpy() if hasattr(wav, "cpu") else wav for name, wav in stems.items()}
+        # Same as demucs' clip="rescale": only scale down stems that would clip
+        peaks = {name: float(np.abs(wav).max()) if wav.size else 0.0 for name, wav in stems.items()}
+        if shared_scale:
+            peaks = dict.fromkeys(peaks, max(peaks.values(), default=0.0))
+
+        paths = {}
+        for name, wav in stems.items():
+            wav = wav / max(1.01 * peaks[name], 1.0)
+            with open_stem_writer(output_dir, name, self.samplerate, wav.shape[0], output_format, bitrate) as writer:
+                tap = (taps or {}).get(name)
+                for start in range(0, wav.shape[1], SAVE_BLOCK_FRAMES):
+                    block = wav[:, start:start + SAVE_BLOCK_FRAMES]
+                    writer.write(block)
+                    if tap is not None:
+                        tap.write(block)
+            paths[name] = str(writer.path)
+        return paths
+
+    def separate_file(self, input_path, output_dir, two_stems="vocals", wav=None, output_format="wav", bitrate=None,
+                      taps=None):
+        """Load, separate and save a file the same way `demucs --two-stems` does; every source without two_stems"""
+        if wav is None:
+            wav = self.load_audio(input_path)
+        sources = self.separate(wav)
+        if two_stems:
+            sources = self.two_stems(sources, two_stems)
+        return self.save_stems(sources, output_dir, output_format, bitrate, taps, shared_scale=not two_stems)
+
+
+def set_worker_threads(workers, threads=None):
+    """Split the machine's cores between concurrent separation workers, or use `threads` each"""
+    import torch
+
+    threads = threads or max(1, (os.cpu_count() or 1) // max(1, workers))
+    torch.set_num_threads(threads)
+    return threads
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model_name=DEFAULT_MODEL, **options):
+    """Return the process-wide engine for a model, loading it on first use"""
+    key = (model_name, tuple(sorted(options.items())))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = SeparationEngine(model_name, **options)
+            _engines[key] = engine
+    return engine
@@ -0,0 +1,155 @@
+import numpy as np
+
+DEFAULT_THRESHOLD_DB = -50.0
+DEFAULT_MIN_SILENCE_SECONDS = 2.0
+DEFAULT_PADDING_SECONDS = 0.5
+FRAME_SECONDS = 0.05
+
+
+def frame_levels_db(wav, samplerate, frame_seconds=FRAME_SECONDS):
+    """RMS level of the mono mix in dBFS for consecutive frames of `frame_seconds`"""
+    frame = max(1, int(frame_seconds * samplerate))
+    mono = np.asarray(wav, dtype=np.float32).mean(axis=0)
+    if mono.size == 0:
+        return np.zeros(0, dtype=np.float32), frame
+    starts = np.arange(0, mono.size, frame)
+    energy = np.add.reduceat(mono.astype(np.float64) ** 2, starts)
+    counts = np.diff(np.append(starts, mono.size))
+    return 10 * np.log10(energy / counts + 1e-20), frame
+
+
+def _runs(mask):
+    """(starts, ends) of the runs of True in a boolean array, ends exclusive"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges[::2], edges[1::2]
+
+
+def _fill(length, starts, ends):
+    """Boolean array of `length` that is True inside every [start, end) range"""
+    marks = np.zeros(length + 1, dtype=np.int32)
+    np.add.at(marks, starts, 1)
+    np.add.at(marks, ends, -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def find_active_regions(wav, samplerate, threshold_db=DEFAULT_THRESHOLD_DB,
+                        min_silence_seconds=DEFAULT_MIN_SILENCE_SECONDS,
+                        padding_seconds=DEFAULT_PADDING_SECONDS):
+    """Sample ranges [(start, end), ...] that need the model; everything else is near-silent.
+
+    Frames above `threshold_db` are active and grow by `padding_seconds` on
+    each side so the model still sees onsets and decays. Quiet gaps shorter
+    than `min_silence_seconds` stay active: skipping them would save little
+    and cut the model's context.
+    """
+    levels, frame = frame_levels_db(wav, samplerate)
+    n_frames = levels.size
+    if n_frames == 0:
+        return []
+
+    pad = int(np.ceil(padding_seconds * samplerate / frame))
+    starts, ends = _runs(levels > threshold_db)
+    active = _fill(n_frames, np.maximum(starts - pad, 0), np.minimum(ends + pad, n_frames))
+
+    min_frames = int(np.ceil(min_silence_seconds * samplerate / frame))
+    gap_starts, gap_ends = _runs(~active)
+    short = (gap_ends - gap_starts) < min_frames
+    active |= _fill(n_frames, gap_starts[short], gap_ends[short])
+
+    total = np.asarray(wav).shape[-1]
+    starts, ends = _runs(active)
+    return [(int(start) * frame, min(int(end) * frame, total)) for start, end in zip(starts, ends)]
+
+
+def align_regions(regions, length, segment, stride):
+    """Widen regions onto the model's segment grid and merge the ones that touch.
+
+    apply_model cuts its input into `segment`-long pieces every `stride`
+    samples and cross-fades where they overlap. A region that starts on that
+    grid, one cross-fade early, and ends where the last segment covering it
+    ends, is fed to the model exactly as it would be inside the whole file,
+    so its active part comes out the same.
+    """
+    aligned = []
+    for start, end in regions:
+        start = max(0, (start - (segment - stride)) // stride * stride)
+        end = min(length, (end - 1) // stride * stride + segment)
+        if aligned and start <= aligned[-1][1]:
+            aligned[-1] = (aligned[-1][0], max(aligned[-1][1], end))
+        else:
+            aligned.append((start, end))
+    return aligned
+
+
+class SilenceSkipper:
+    """Send only the audible parts of a mix through the engine.
+
+    Near-silent stretches are copied straight into the accompaniment stem
+    (`no_<stem>` with two stems, "other" otherwise) and every other stem is
+    zero there. Active regions are run through the model on the same
+    segment grid as whole-file separation (see align_regions), so with
+    shifts=0 they match it to float precision. The only difference left is
+    in the skipped parts, which are quieter than `threshold_db`;
+    benchmarks/silence_skip.py holds it under MAX_DEVIATION_DB. With
+    shifts > 0 the random shifts move the grid, and the result differs from
+    whole-file separation as much as two whole-file runs differ from each
+    other.
+    """
+
+    MAX_DEVIATION_DB = -40.0
+
+    def __init__(self, engine, threshold_db=DEFAULT_THRESHOLD_DB,
+                 min_silence_seconds=DEFAULT_MIN_SILENCE_SECONDS, padding_seconds=DEFAULT_PADDING_SECONDS):
+        self.engine = engine
+        self.threshold_db = threshold_db
+        self.min_silence_seconds = min_silence_seconds
+        self.padding_seconds = padding_seconds
+        self.frames_seen = 0
+        self.frames_skipped = 0
+
+    @property
+    def settings(self):
+        return {
+            "threshold_db": self.threshold_db,
+            "min_silence_seconds": self.min_silence_seconds,
+            "padding_seconds": self.padding_seconds,
+        }
+
+    @property
+    def skipped_fraction(self):
+        return self.frames_skipped / self.frames_seen if self.frames_seen else 0.0
+
+    def silent_stem(self, two_stems):
+        if two_stems:
+            return f"no_{two_stems}"
+        sources = self.engine.sources
+        return "other" if "other" in sources else sources[-1]
+
+    def separate(self, wav, two_stems="vocals"):
+        """Separate a (channels, samples) array into {stem: array} like engine.separate + two_stems"""
+        wav = np.asarray(wav, dtype=np.float32)
+        length = wav.shape[1]
+        regions = find_active_regions(
+            wav, self.engine.samplerate, self.threshold_db, self.min_silence_seconds, self.padding_seconds
+        )
+        names = [two_stems, f"no_{two_stems}"] if two_stems else self.engine.sources
+        stems = {name: np.zeros_like(wav) for name in names}
+
+        active = _fill(length, np.array([start for start, _ in regions], dtype=np.int64),
+                       np.array([end for _, end in regions], dtype=np.int64))
+        stems[self.silent_stem(two_stems)][:, ~active] = wav[:, ~active]
+
+        modelled = 0
+        for start, end in align_regions(regions, length, *self.engine.chunk_grid):
+            sources = self.engine.separate(wav[:, start:end])
+            if two_stems:
+                sources = self.engine.two_stems(sources, two_stems)
+            # Only the active samples are kept; the alignment margins are near-silent
+            keep = active[start:end]
+            for name, source in sources.items():
+                stems[name][:, start:end][:, keep] = source.cpu().numpy()[:, keep]
+            modelled += end - start
+
+        self.frames_seen += length
+        self.frames_skipped += length - modelled
+        return stems
@@ -0,0 +1,169 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+MANIFEST_NAME = "manifest.json"
+HASH_BLOCK_FRAMES = 1 << 20
+
+
+def link_or_copy(source, target):
+    """Hardlink a file, or copy it where that is not possible (e.g. another filesystem)"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class PcmHasher:
+    """Incremental hash of float32 PCM plus the model name and settings.
+
+    Samples are hashed interleaved, so a whole decoded track and the same
+    track fed block by block produce the same key.
+    """
+
+    def __init__(self, model_name, settings):
+        self._digest = hashlib.sha256()
+        self._digest.update(json.dumps({"model": model_name, "settings": settings}, sort_keys=True).encode())
+
+    def update(self, block):
+        import numpy as np
+
+        if hasattr(block, "numpy"):
+            block = block.detach().cpu().numpy()
+        samples = np.ascontiguousarray(np.asarray(block, dtype=np.float32).T)
+        self._digest.update(memoryview(samples).cast("B"))
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+class StemCache:
+    """Persistent, content-addressed store of separated stems with LRU eviction.
+
+    Entries live in <root>/<key>/ and are published with a single directory
+    rename, so readers in other sessions either see a complete entry or none.
+    Recency is tracked with the entry directory's mtime. Results are never
+    served from an entry: `restore` links its stems into the job's own
+    directory, so evicting the entry later does not take them away.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.tmp_dir = self.root / ".tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(wav, model_name, settings):
+        """Hash a decoded (channels, samples) track with the model name and its settings"""
+        hasher = PcmHasher(model_name, settings)
+        for start in range(0, wav.shape[-1], HASH_BLOCK_FRAMES):
+            hasher.update(wav[:, start:start + HASH_BLOCK_FRAMES])
+        return hasher.hexdigest()
+
+    @staticmethod
+    def make_file_key(path, model_name, settings, samplerate, channels, track=0):
+        """Same key as make_key, computed by streaming the decode instead of holding it"""
+        from app.processors.audio_io import FfmpegAudioReader
+
+        hasher = PcmHasher(model_name, settings)
+        with FfmpegAudioReader(path, samplerate, channels, track) as reader:
+            for block in reader.blocks(HASH_BLOCK_FRAMES):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def _entry_dir(self, key):
+        return self.root / key
+
+    def _read_entry(self, key):
+        entry = self._entry_dir(key)
+        try:
+            manifest = json.loads((entry / MANIFEST_NAME).read_text())
+            os.utime(entry)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        paths = {name: entry / file_name for name, file_name in manifest["stems"].items()}
+        if not all(path.exists() for path in paths.values()):
+            return None
+        return {name: str(path) for name, path in paths.items()}
+
+    def lookup(self, key):
+        """Return {stem name: path} for a cached entry, or None on a miss"""
+        paths = self._read_entry(key)
+        if paths:
+            print(f"Stem cache hit: {key[:12]}")
+        return paths
+
+    def restore(self, key, output_dir):
+        """On a hit, link the entry's stems into output_dir and return {stem name: path} there; None on a miss"""
+        paths = self.lookup(key)
+        if not paths:
+            return None
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        restored = {}
+        for name, path in paths.items():
+            target = output_dir / Path(path).name
+            target.unlink(missing_ok=True)
+            try:
+                link_or_copy(path, target)
+            except FileNotFoundError:
+                # Evicted since the lookup
+                return None
+            restored[name] = str(target)
+        return restored
+
+    def store(self, key, stems):
+        """Copy {stem name: path} into the cache atomically; the files at `stems` stay the job's results"""
+        staging = self.tmp_dir / f"{key}.{uuid.uuid4().hex}"
+        staging.mkdir(parents=True)
+        try:
+            manifest = {"stems": {}}
+            for name, path in stems.items():
+                file_name = Path(path).name
+                link_or_copy(path, staging / file_name)
+                manifest["stems"][name] = file_name
+            # The manifest is written last; an entry without one is never served
+            (staging / MANIFEST_NAME).write_text(json.dumps(manifest))
+
+            try:
+                os.rename(staging, self._entry_dir(key))
+            except OSError:
+                # Another session published the same key first, keep theirs
+                pass
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict()
+
+    def _entry_size(self, entry):
+        return sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for entry in self.root.iterdir():
+            if entry == self.tmp_dir or not entry.is_dir():
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, self._entry_size(entry), entry))
+            except FileNotFoundError:
+                continue  # evicted concurrently
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Rename before deleting so no reader ever sees a half-removed entry
+            trash = self.tmp_dir / f"evicted.{uuid.uuid4().hex}"
+            try:
+                os.rename(entry, trash)
+            except OSError:
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            total -= size
+            print(f"Stem cache evicted: {entry.name[:12]}")
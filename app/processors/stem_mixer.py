@@ -0,0 +1,107 @@
+from pathlib import Path
+import os
+import re
+import uuid
+import numpy as np
+from app.processors.audio_io import FfmpegAudioReader, open_stem_writer, stem_format_for
+
+# Sources of the four-stem Demucs models, in the order they come out
+DEFAULT_SOURCES = ("drums", "bass", "other", "vocals")
+MIX_BLOCK_FRAMES = 1 << 18
+
+
+def track_key(name, track):
+    """Result key of a stem from a video's extra audio track: vocals_track1 is the second track's vocals"""
+    return name if track == 0 else f"{name}_track{track}"
+
+
+def stem_names(results):
+    """Stems of the first audio track in a job result, the ones mixes are made from"""
+    return [name for name in results if name != "video" and not re.search(r"_track\d+$", name)]
+
+
+def mix_stems(spec, sources=DEFAULT_SOURCES):
+    """Stems making up a mix spec: "no_vocals" is everything but vocals, "drums+bass" those two"""
+    if spec.startswith("no_"):
+        excluded = spec[len("no_"):]
+        if excluded not in sources:
+            raise ValueError(f"Unknown stem {excluded!r} in mix {spec!r}, expected one of: {', '.join(sources)}")
+        return [name for name in sources if name != excluded]
+    names = spec.split("+")
+    unknown = [name for name in names if name not in sources]
+    if unknown or not spec:
+        raise ValueError(f"Unknown stem in mix {spec!r}, expected one of: {', '.join(sources)}")
+    return [name for name in sources if name in names]
+
+
+def mix_name(stems, sources=DEFAULT_SOURCES):
+    """Canonical name of a mix, the inverse of mix_stems"""
+    stems = [name for name in sources if name in stems]
+    missing = [name for name in sources if name not in stems]
+    if len(missing) == 1 and len(stems) > 1:
+        return f"no_{missing[0]}"
+    return "+".join(stems)
+
+
+def derive_mix(stem_paths, stems, output_dir, samplerate=44100, channels=2, bitrate=None):
+    """Sum the stored `stems` into one file in output_dir and return its path.
+
+    Every stem is decoded block by block and the blocks are added in one
+    vectorized sum, so a mix costs a decode and an encode, not another pass
+    through the model. The mix is written in the stems' format to
+    `output_dir`, the job's own directory, under its mix_name and published
+    with a rename; an existing file is reused, so asking for the same mix
+    twice is free. Samples beyond full scale are clamped.
+    """
+    # Job results may carry a "video" and other audio tracks' stems next to the stems
+    sources = stem_names(stem_paths)
+    stems = mix_stems(stems, sources) if isinstance(stems, str) else list(stems)
+    missing = [name for name in stems if name not in stem_paths]
+    if missing or not stems:
+        raise ValueError(f"Cannot mix {stems}: stored stems are {', '.join(sources)}")
+
+    first = Path(stem_paths[stems[0]])
+    output_dir = Path(output_dir)
+    output_format, spec = stem_format_for(first)
+    if output_format is None:
+        raise ValueError(f"Unknown stem format: {first.name}")
+    name = mix_name(stems, sources)
+    path = output_dir / f"{name}{spec['extension']}"
+    if path.exists():
+        return str(path)
+    if len(stems) == 1:
+        return str(first)
+
+    # Written under a temporary name so concurrent callers never see half a file
+    output_dir.mkdir(parents=True, exist_ok=True)
+    staging = f".{name}.{uuid.uuid4().hex}"
+    readers = [FfmpegAudioReader(stem_paths[stem], samplerate, channels) for stem in stems]
+    writer = open_stem_writer(output_dir, staging, samplerate, channels, output_format, bitrate)
+    try:
+        try:
+            for reader in readers:
+                reader.open()
+            while True:
+                blocks = [reader.read(MIX_BLOCK_FRAMES) for reader in readers]
+                length = max(block.shape[1] for block in blocks)
+                if length == 0:
+                    break
+                # Lossy decoders may end a few samples apart; the short stems count as silence there
+                stacked = np.zeros((len(blocks), channels, length), dtype=np.float32)
+                for index, block in enumerate(blocks):
+                    stacked[index, :, :block.shape[1]] = block
+                writer.write(stacked.sum(axis=0))
+        finally:
+            for reader in readers:
+                reader.close()
+        writer.close()
+        os.replace(writer.path, path)
+    except BaseException:
+        if hasattr(writer, "abort"):
+            writer.abort()
+        else:
+            writer.close()
+        Path(writer.path).unlink(missing_ok=True)
+        raise
+    print(f"Mixed {' + '.join(stems)} into {path.name}")
+    return str(path)
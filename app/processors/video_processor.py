@@ -1,7 +1,42 @@
 from pathlib import Path
 import subprocess
 import os
-import streamlit as st
+import time
+import logging
+from app.processors.audio_io import (
+    STEM_FORMATS, FfmpegAudioReader, FfmpegStreamEncoder, StderrTail, stem_format_for
+)
+from app.processors import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def probe_keyframes(path):
+    """Timestamps in seconds of the first video stream's keyframes, read from packet flags without decoding"""
+    try:
+        process = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "packet=pts_time,flags",
+                "-of", "csv=p=0",
+                str(path)
+            ],
+            capture_output=True,
+            text=True
+        )
+    except OSError:
+        return []
+    keyframes = []
+    for line in process.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if flags.startswith("K"):
+            try:
+                keyframes.append(float(pts_time))
+            except ValueError:
+                continue
+    return sorted(keyframes)
+
 
 class VideoProcessor:
     def __init__(self, input_video, output_dir):
@@ -10,20 +45,37 @@ class VideoProcessor:
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.temp_audio = self.output_dir / "extracted_audio.wav"
         self.final_video = self.output_dir / "final_video.mp4"
+        self.last_error = None
+        self.last_log = None
+
+    def report_error(self, message):
+        """Log a failure and keep it for the caller (UI, job or CLI) to surface"""
+        logger.error(message)
+        self.last_error = message
 
     def extract_audio(self):
         """Extract audio from video file"""
+        with metrics.stage("extract_audio") as record:
+            record.add_input(self.input_video)
+            result = self._extract_audio(record)
+            if result:
+                record.add_output(result)
+            else:
+                record.fail(self.last_error)
+            return result
+
+    def _extract_audio(self, record):
         try:
             # First, verify the input video file exists and is readable
             if not self.input_video.exists():
-                st.error(f"Input video file not found: {self.input_video}")
+                self.report_error(f"Input video file not found: {self.input_video}")
                 return None
 
             # Print file size and check if it's not empty
             file_size = os.path.getsize(self.input_video)
             #st.info(f"Input video file size: {file_size} bytes")
             if file_size == 0:
-                st.error("Input video file is empty")
+                self.report_error("Input video file is empty")
                 return None
 
             # Ensure output directory exists
@@ -44,96 +96,232 @@ class VideoProcessor:
 
             # Run FFmpeg command and capture output
             try:
-                # Use subprocess.run with timeout to prevent hanging
+                # No timeout: long videos legitimately take minutes to transcode
                 process = subprocess.run(
                     command,
                     capture_output=True,
-                    text=True,
-                    timeout=60  # 60 seconds timeout
+                    text=True
                 )
+                record.exit_status = process.returncode
 
                 # Check for any errors
                 if process.returncode != 0:
-                    st.error(f"FFmpeg error: {process.stderr}")
-                    st.error(f"FFmpeg command: {' '.join(command)}")
+                    logger.error(f"FFmpeg command: {' '.join(command)}")
+                    self.report_error(f"FFmpeg error: {process.stderr}")
                     return None
 
-            except subprocess.TimeoutExpired:
-                st.error("Audio extraction timed out")
-                return None
             except Exception as e:
-                st.error(f"Unexpected error during FFmpeg execution: {str(e)}")
+                self.report_error(f"Unexpected error during FFmpeg execution: {str(e)}")
                 return None
 
             # Verify the output audio file exists and is not empty
             if not self.temp_audio.exists():
-                st.error("Audio extraction failed: Output file is missing")
+                self.report_error("Audio extraction failed: Output file is missing")
                 return None
 
             file_size = os.path.getsize(self.temp_audio)
             if file_size == 0:
-                st.error("Audio extraction failed: Output file is empty")
+                self.report_error("Audio extraction failed: Output file is empty")
                 return None
 
             #st.success(f"Audio extracted successfully to {self.temp_audio}")
             return str(self.temp_audio)
 
         except Exception as e:
-            st.error(f"Unexpected error during audio extraction: {str(e)}")
+            self.report_error(f"Unexpected error during audio extraction: {str(e)}")
             return None
 
-    def combine_video_audio(self, vocals_path):
-        """Combine original video with vocals only"""
+    def decode_audio(self, samplerate=44100, channels=2, track=0):
+        """Decode the soundtrack (audio stream `track`) straight into a (channels, samples) float32 array"""
+        if not self.input_video.exists():
+            self.report_error(f"Input video file not found: {self.input_video}")
+            return None
+
+        with metrics.stage("decode") as record:
+            record.add_input(self.input_video)
+            reader = self.audio_reader(samplerate, channels, track)
+            try:
+                with reader:
+                    wav = reader.read_all()
+            except RuntimeError as e:
+                self.report_error(str(e))
+                wav = None
+            record.exit_status = reader.returncode
+
+            if wav is not None and wav.shape[1] == 0:
+                self.report_error("Audio extraction failed: no audio decoded")
+                wav = None
+            if wav is None:
+                record.fail(self.last_error)
+                return None
+            record.audio_seconds = wav.shape[1] / samplerate
+            record.output_bytes = wav.nbytes
+            return wav
+
+    def audio_reader(self, samplerate=44100, channels=2, track=0):
+        """Reader that pipes the soundtrack out of ffmpeg in PCM blocks, for chunked separation"""
+        return FfmpegAudioReader(self.input_video, samplerate, channels, track)
+
+    def combine_video_audio(self, vocals_path, fast=True):
+        """Combine original video with vocals only.
+
+        `vocals_path` may be a list with the vocals of every audio track, in
+        the original's order; each track keeps its language and title.
+        The fast mode logs at error level into a bounded buffer and writes a
+        faststart MP4, so players can start before the download finishes.
+        fast=False runs the original verbose command.
+        """
+        vocals_paths = [vocals_path] if isinstance(vocals_path, (str, Path)) else list(vocals_path)
+        with metrics.stage("combine", mode="fast" if fast else "verbose") as record:
+            record.add_input(self.input_video, *vocals_paths)
+            result = self._combine_video_audio(vocals_paths, record, fast)
+            if result:
+                record.add_output(result)
+            else:
+                record.fail(self.last_error)
+            return result
+
+    def _combine_video_audio(self, vocals_paths, record, fast):
         try:
             # Verify input files exist
             if not self.input_video.exists():
-                st.error(f"Original video not found: {self.input_video}")
-                return None
-            if not Path(vocals_path).exists():
-                st.error(f"Vocals audio not found: {vocals_path}")
+                self.report_error(f"Original video not found: {self.input_video}")
                 return None
+            for path in vocals_paths:
+                if not Path(path).exists():
+                    self.report_error(f"Vocals audio not found: {path}")
+                    return None
+
+            inputs, audio_options = [], []
+            for index, path in enumerate(vocals_paths):
+                inputs += ["-i", str(path)]
+                # Vocals already encoded to a codec MP4 can carry are copied as-is,
+                # anything else (WAV/FLAC) is encoded to AAC here
+                _, vocals_format = stem_format_for(path)
+                if vocals_format and vocals_format["mp4"]:
+                    audio_options += [f"-c:a:{index}", "copy"]
+                else:
+                    audio_options += [f"-c:a:{index}", "aac", f"-b:a:{index}", "192k"]
+                audio_options += ["-map", f"{index + 1}:a:0"]
+                if len(vocals_paths) > 1:
+                    audio_options += [f"-map_metadata:s:a:{index}", f"0:s:a:{index}"]
 
             # Construct FFmpeg command
             command = [
                 "ffmpeg",
-                "-v", "verbose",  # Enable verbose logging
+                "-v", "error" if fast else "verbose",
                 "-i", str(self.input_video),
-                "-i", vocals_path,
+                *inputs,
                 "-c:v", "copy",  # Copy video stream without re-encoding
-                "-c:a", "aac",   # Use AAC codec for audio
-                "-b:a", "192k",  # Set audio bitrate
                 "-map", "0:v:0",
-                "-map", "1:a:0",
+                *audio_options,
+                # Index at the front so the file plays while it downloads
+                *(["-movflags", "+faststart"] if fast else []),
                 "-y",  # Overwrite output file if it exists
                 str(self.final_video)
             ]
 
-            # Run FFmpeg command and capture output
-            process = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-                check=False
-            )
-
-            # Print FFmpeg output for debugging
-            print("FFmpeg stdout:", process.stdout)
-            print("FFmpeg stderr:", process.stderr)
+            if fast:
+                process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                log = StderrTail(process.stderr)
+                returncode = process.wait()
+                self.last_log = log.text()
+            else:
+                # Run FFmpeg command and capture output
+                process = subprocess.run(
+                    command,
+                    capture_output=True,
+                    text=True,
+                    check=False
+                )
+                returncode = process.returncode
+                self.last_log = process.stdout + process.stderr
+            record.exit_status = returncode
 
-            # Check if the command was successful
-            if process.returncode != 0:
-                st.error(f"FFmpeg error during video combination: {process.stderr}")
+            # Check if the command was successful; only the end of ffmpeg's log says why it failed
+            if returncode != 0:
+                self.report_error(f"FFmpeg error during video combination: {self.last_log[-2000:]}")
                 return None
 
             # Verify the output video file exists and is not empty
             if not self.final_video.exists() or os.path.getsize(self.final_video) == 0:
-                st.error("Video combination failed: Output file is missing or empty")
+                self.report_error("Video combination failed: Output file is missing or empty")
                 return None
 
             print(f"Video combined successfully: {self.final_video}")
             return str(self.final_video)
 
         except Exception as e:
-            st.error(f"Error during video combination: {str(e)}")
-            print(f"Exception details: {str(e)}")
-            return None
\ No newline at end of file
+            self.report_error(f"Error during video combination: {str(e)}")
+            return None
+
+    def open_muxer(self, samplerate, output_format="wav"):
+        """StreamingMuxer that builds final_video from vocals blocks while they are separated.
+
+        None for stem formats MP4 can carry: their finished file is
+        stream-copied by combine_video_audio, so the vocals are encoded once.
+        """
+        if STEM_FORMATS[output_format]["mp4"]:
+            return None
+        return StreamingMuxer(self, samplerate)
+
+
+class StreamingMuxer:
+    """Mux vocals into the video as they come out of separation instead of from a finished file.
+
+    Blocks written here go through ffmpeg's stdin next to the original video
+    into a fragmented MP4, which is playable while it is still growing. The
+    ffmpeg process starts on the first block, so a separation served from the
+    stem cache never starts one; `started` tells the caller to fall back to
+    combine_video_audio then. The vocals are encoded to AAC here, so this is
+    only for uncompressed stems (see VideoProcessor.open_muxer).
+    """
+
+    # Fragment at every video keyframe; the moov box comes first and stays empty
+    MOVFLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+
+    def __init__(self, video_proc, samplerate):
+        self.video_proc = video_proc
+        self.samplerate = samplerate
+        self.codec, self.bitrate = "aac", "192k"
+        self.encoder = None
+        self.opened_at = None
+
+    @property
+    def started(self):
+        return self.encoder is not None
+
+    def write(self, block):
+        if self.encoder is None:
+            self.opened_at = time.perf_counter()
+            self.encoder = FfmpegStreamEncoder(
+                self.video_proc.final_video, self.samplerate, block.shape[0], self.codec, self.bitrate,
+                inputs=["-i", str(self.video_proc.input_video)],
+                output_options=["-map", "0:v:0", "-map", "1:a:0", "-c:v", "copy", "-movflags", self.MOVFLAGS]
+            )
+        self.encoder.write(block)
+
+    def close(self):
+        """Finish the video once the last block is written; returns its path or None"""
+        video_proc = self.video_proc
+        with metrics.stage("combine", mode="pipe") as record:
+            record.add_input(video_proc.input_video)
+            record.extra["overlapped_s"] = round(time.perf_counter() - self.opened_at, 4)
+            try:
+                self.encoder.close()
+            except RuntimeError as e:
+                video_proc.report_error(f"FFmpeg error during video combination: {e}")
+            record.exit_status = self.encoder.returncode
+            if video_proc.last_error is None and not os.path.getsize(video_proc.final_video):
+                video_proc.report_error("Video combination failed: Output file is missing or empty")
+            if video_proc.last_error is not None:
+                record.fail(video_proc.last_error)
+                return None
+            record.add_output(video_proc.final_video)
+        print(f"Video combined successfully: {video_proc.final_video}")
+        return str(video_proc.final_video)
+
+    def abort(self):
+        if self.encoder is not None:
+            self.encoder.abort()
+            Path(self.video_proc.final_video).unlink(missing_ok=True)
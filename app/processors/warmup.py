@@ -0,0 +1,56 @@
+import logging
+import subprocess
+import time
+from app.config.presets import DEFAULT_PRESET, engine_options
+
+logger = logging.getLogger(__name__)
+
+WARMUP_SECONDS = 1.0
+
+
+def probe_tools():
+    """Run ffmpeg and ffprobe once; a missing binary shows up at startup instead of in the first job"""
+    versions = {}
+    for tool in ("ffmpeg", "ffprobe"):
+        try:
+            process = subprocess.run([tool, "-version"], capture_output=True, text=True)
+        except OSError as e:
+            logger.error(f"{tool} is not available: {e}")
+            continue
+        versions[tool] = process.stdout.split("\n", 1)[0]
+    return versions
+
+
+def warm_up(presets=(DEFAULT_PRESET,), separate=True, downloads=True, backend=None):
+    """Load everything the first job would otherwise wait for and return the seconds each step took.
+
+    Loads the model of each preset and, with `separate`, runs it once on a
+    second of silence so torch has its kernels and buffers ready. With
+    `downloads`, yt-dlp and its extractor list are imported too. Meant for
+    worker processes and the app's job workers before the first request.
+    """
+    from app.processors.separation_engine import get_engine
+
+    timings = {}
+    start = time.perf_counter()
+    probe_tools()
+    timings["tools"] = time.perf_counter() - start
+
+    for preset in presets:
+        start = time.perf_counter()
+        engine = get_engine(**engine_options(preset, backend))
+        if separate:
+            import numpy as np
+
+            engine.separate(np.zeros((engine.audio_channels, int(WARMUP_SECONDS * engine.samplerate)), np.float32))
+        timings[f"model:{preset}"] = time.perf_counter() - start
+
+    if downloads:
+        start = time.perf_counter()
+        from yt_dlp.extractor import gen_extractor_classes
+
+        gen_extractor_classes()
+        timings["yt_dlp"] = time.perf_counter() - start
+
+    print("Warm-up done: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
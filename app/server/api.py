@@ -0,0 +1,372 @@
+"""Headless HTTP API for separation jobs, next to the Streamlit app.
+
+Run from the repository root:
+
+    python -m app.server.api --port 8503
+
+Endpoints:
+
+    POST /jobs?filename=song.mp3[&kind=audio|video][&format=wav][&bitrate=192k][&preset=balanced]
+        The request body is the file, sent with Content-Length or chunked
+        transfer encoding (curl -T song.mp3 -X POST ...). It is copied to
+        disk as it arrives.
+    POST /jobs  with a JSON body {"url": "...", "video": true, "format": ..., "bitrate": ..., "preset": ...}
+        Downloads and processes a URL.
+    GET  /jobs/<id>
+        Status as JSON; once the job is done, "files" maps every result to its URL.
+    GET  /jobs/<id>/files/<name>
+        Streams a stem, a mix of stems (e.g. no_vocals, drums+bass, summed on
+        first request) or the processed video from disk, with Range support.
+
+Both POSTs answer 202 with the job ID. Jobs run on the same JobQueue and job
+functions as the app's (VideoProcessor, AudioProcessor, LinkDownloader).
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+import argparse
+import json
+import shutil
+import tempfile
+import threading
+
+from app.config import settings
+from app.config.presets import PRESETS, DEFAULT_PRESET, threads_per_worker
+from app.processors import metrics
+from app.processors.audio_io import STEM_FORMATS, stem_format_for
+from app.processors.job_queue import JobQueue, DONE
+from app.processors.link_processor import URL_SCHEMES
+from app.processors.pipeline import run_audio_job, run_video_job, run_url_job, run_preset_job
+from app.processors.stem_mixer import derive_mix, mix_name, mix_stems, stem_names
+from app.server.file_server import CHUNK_SIZE, safe_file_name, save_stream, send_file
+
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".avi", ".mov", ".webm"}
+JOB_FUNCTIONS = {"audio": run_audio_job, "video": run_video_job, "url": run_url_job}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _BoundedBody:
+    """File-like view of a request body with a Content-Length"""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.left = length
+
+    def read(self, size=-1):
+        size = self.left if size < 0 else min(size, self.left)
+        data = self.rfile.read(size) if size else b""
+        if size and not data:
+            raise RequestError(400, "Request body ended early")
+        self.left -= len(data)
+        return data
+
+
+class _ChunkedBody:
+    """File-like view of a request body sent with Transfer-Encoding: chunked"""
+
+    def __init__(self, rfile):
+        self.rfile = rfile
+        self.left = 0
+        self.done = False
+
+    def _next_chunk(self):
+        line = self.rfile.readline(1024)
+        try:
+            self.left = int(line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise RequestError(400, "Malformed chunked body")
+        if self.left == 0:
+            # Skip trailers up to the blank line that ends the body
+            while self.rfile.readline(1024).strip():
+                pass
+            self.done = True
+
+    def read(self, size=-1):
+        parts = []
+        wanted = size
+        while not self.done and wanted != 0:
+            if self.left == 0:
+                self._next_chunk()
+                continue
+            count = self.left if wanted < 0 else min(self.left, wanted)
+            data = self.rfile.read(count)
+            if not data:
+                raise RequestError(400, "Request body ended early")
+            parts.append(data)
+            self.left -= len(data)
+            if wanted > 0:
+                wanted -= len(data)
+            if self.left == 0:
+                self.rfile.readline(1024)  # CRLF after the chunk data
+        return b"".join(parts)
+
+
+class _LimitedBody:
+    """Fails the upload once more than max_bytes have been read"""
+
+    def __init__(self, body, max_bytes):
+        self.body = body
+        self.max_bytes = max_bytes
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = self.body.read(size)
+        self.read_bytes += len(data)
+        if self.read_bytes > self.max_bytes:
+            raise RequestError(413, f"Uploads are limited to {self.max_bytes / (1024 * 1024):g} MB")
+        return data
+
+
+def result_file_name(job, name, path):
+    """Download name for a result, as the app names them"""
+    if name == "video":
+        return "processed_video.mp4" if job.kind == "url" else f"processed_{job.label}"
+    if job.kind == "url":
+        return f"{name}{Path(path).suffix}"
+    return f"{name}_{job.label.rsplit('.', 1)[0]}{Path(path).suffix}"
+
+
+class ApiServer:
+    """HTTP front end for a JobQueue: uploads and URLs in, job status and result files out.
+
+    Uploads are copied to `queue.root/uploads` chunk by chunk and handed to
+    the job, which takes ownership of them like the app's staged uploads.
+    Results are answered with file_server.send_file, so they leave straight
+    from disk with Range support and never pass through this process's memory.
+    `port=0` picks a free port, e.g. for an in-process client.
+    """
+
+    def __init__(self, queue, cache=None, host="0.0.0.0", port=8503, max_upload_bytes=None):
+        self.queue = queue
+        self.cache = cache
+        self.max_upload_bytes = max_upload_bytes
+        self.uploads_dir = queue.root / "uploads"
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                server._dispatch(self, server._post)
+
+            def do_GET(self):
+                server._dispatch(self, server._get)
+
+            do_HEAD = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://localhost:{self.httpd.server_port}"
+        self._thread = None
+
+    def start(self):
+        """Serve on a background thread and return self"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="api-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _dispatch(self, handler, method):
+        try:
+            method(handler)
+        except RequestError as e:
+            # The rest of a rejected upload is not read, so the connection cannot be reused
+            handler.close_connection = True
+            self._send_json(handler, {"error": str(e)}, e.status)
+
+    @staticmethod
+    def _send_json(handler, body, status=200, headers=None):
+        data = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        if handler.command != "HEAD":
+            handler.wfile.write(data)
+
+    def _post(self, handler):
+        url = urlsplit(handler.path)
+        if url.path.rstrip("/") != "/jobs":
+            raise RequestError(404, "Not found")
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        if handler.headers.get("Content-Type", "").split(";")[0].strip() == "application/json":
+            try:
+                options = json.loads(self._body(handler).read(1024 * 1024) or b"{}")
+            except ValueError:
+                raise RequestError(400, "Invalid JSON body")
+            if not isinstance(options, dict) or not options.get("url"):
+                raise RequestError(400, 'JSON body needs a "url"')
+            if urlsplit(str(options["url"])).scheme.lower() not in URL_SCHEMES:
+                raise RequestError(400, "Only http and https URLs are supported")
+            kind, source, label = "url", options["url"], options["url"]
+            extra = {"want_video": bool(options.get("video", True))}
+        else:
+            options = query
+            # parse_qs has already percent-decoded the value
+            label = safe_file_name(Path(query.get("filename", "")).name)
+            if label in ("", ".", ".."):
+                raise RequestError(400, "Pass the upload's file name as ?filename=")
+            kind = query.get("kind") or ("video" if Path(label).suffix.lower() in VIDEO_EXTENSIONS else "audio")
+            if kind not in ("audio", "video"):
+                raise RequestError(400, "kind must be audio or video")
+            source, extra = None, {}
+
+        preset = options.get("preset") or DEFAULT_PRESET
+        output_format = options.get("format") or "wav"
+        if preset not in PRESETS:
+            raise RequestError(400, f"Unknown preset, expected one of: {', '.join(PRESETS)}")
+        if output_format not in STEM_FORMATS:
+            raise RequestError(400, f"Unknown format, expected one of: {', '.join(STEM_FORMATS)}")
+        if source is None:
+            source = self._stage_upload(handler, label)
+
+        job_id = self.queue.submit(
+            kind, run_preset_job, JOB_FUNCTIONS[kind], source, preset, self.cache, label=label,
+            output_format=output_format, bitrate=options.get("bitrate") or None, **extra
+        )
+        self._send_json(handler, {"id": job_id, "status": self.queue.get(job_id).status, "url": f"/jobs/{job_id}"},
+                        202, {"Location": f"/jobs/{job_id}"})
+
+    def _body(self, handler):
+        if "chunked" in handler.headers.get("Transfer-Encoding", "").lower():
+            body = _ChunkedBody(handler.rfile)
+        else:
+            length = handler.headers.get("Content-Length")
+            if length is None:
+                raise RequestError(411, "Send Content-Length or a chunked body")
+            try:
+                length = int(length)
+            except ValueError:
+                length = -1
+            if length < 0:
+                raise RequestError(400, "Invalid Content-Length")
+            if self.max_upload_bytes is not None and length > self.max_upload_bytes:
+                # Refused before a byte of it is read
+                raise RequestError(413, f"Uploads are limited to {self.max_upload_bytes / (1024 * 1024):g} MB")
+            body = _BoundedBody(handler.rfile, length)
+        if self.max_upload_bytes is not None:
+            body = _LimitedBody(body, self.max_upload_bytes)
+        return body
+
+    def _stage_upload(self, handler, file_name):
+        """Copy the request body into a staging directory the job takes over"""
+        body = self._body(handler)
+        self.uploads_dir.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=self.uploads_dir))
+        try:
+            with metrics.stage("upload") as record:
+                path = save_stream(body, staging / file_name, CHUNK_SIZE)
+                record.add_output(path)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if path.stat().st_size == 0:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise RequestError(400, "Empty upload")
+        return path
+
+    def _get(self, handler):
+        parts = [unquote(part) for part in urlsplit(handler.path).path.strip("/").split("/")]
+        if len(parts) < 2 or parts[0] != "jobs" or len(parts) not in (2, 4) or \
+                (len(parts) == 4 and parts[2] != "files"):
+            raise RequestError(404, "Not found")
+        job = self.queue.get(parts[1])
+        if job is None:
+            raise RequestError(404, "Unknown job")
+
+        if len(parts) == 2:
+            status = {
+                "id": job.id,
+                "kind": job.kind,
+                "label": job.label,
+                "status": job.status,
+                "position": self.queue.position(job.id),
+                "error": job.error,
+                "submitted_at": job.submitted_at,
+                "started_at": job.started_at,
+                "finished_at": job.finished_at,
+            }
+            if job.status == DONE:
+                status["files"] = {name: f"/jobs/{job.id}/files/{name}" for name in job.result}
+            self._send_json(handler, status)
+            return
+
+        if job.status != DONE:
+            raise RequestError(409, f"Job is {job.status}")
+        name = parts[3]
+        path = job.result.get(name)
+        if path is None:
+            path = self._mix(job, name)
+        if name == "video":
+            content_type = "video/mp4"
+        else:
+            content_type = (stem_format_for(path)[1] or {}).get("mime", "application/octet-stream")
+        send_file(handler, path, content_type, result_file_name(job, name, path))
+
+    @staticmethod
+    def _mix(job, name):
+        """Sum a mix of the job's stems on first request; derive_mix reuses it after that"""
+        stems = stem_names(job.result)
+        try:
+            chosen = mix_stems(name, stems)
+        except ValueError:
+            raise RequestError(404, f"No result named {name!r}")
+        if len(chosen) < 2:
+            raise RequestError(404, f"No result named {name!r}")
+        if mix_name(chosen, stems) != name:
+            raise RequestError(404, f"Ask for this mix as {mix_name(chosen, stems)!r}")
+        return derive_mix(job.result, chosen, Path(job.work_dir) / "mixes")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve separation jobs over HTTP without the web UI.")
+    parser.add_argument("--host", default=settings.API_HOST)
+    parser.add_argument("--port", type=int, default=settings.API_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SEPARATION_WORKERS, help="Concurrent jobs")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or fill the shared stem cache")
+    args = parser.parse_args(argv)
+
+    def start_job_workers():
+        from app.processors.separation_engine import set_worker_threads
+        from app.processors.warmup import warm_up
+
+        set_worker_threads(args.workers, threads_per_worker(DEFAULT_PRESET, args.workers))
+        if settings.WARMUP:
+            warm_up([DEFAULT_PRESET])
+
+    metrics.configure_logging(settings.METRICS_FILE)
+    cache = None
+    if not args.no_cache:
+        from app.processors.stem_cache import StemCache
+        cache = StemCache(settings.STEM_CACHE_DIR, settings.STEM_CACHE_MAX_BYTES)
+    queue = JobQueue(settings.API_JOBS_DIR, args.workers, settings.JOB_RESULT_TTL_SECONDS,
+                     on_start=start_job_workers)
+    server = ApiServer(queue, cache, args.host, args.port, settings.API_MAX_UPLOAD_BYTES)
+    print(f"Serving the API on {args.host}:{server.httpd.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
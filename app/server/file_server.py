@@ -0,0 +1,186 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import os
+import re
+import shutil
+import threading
+import unicodedata
+import urllib.parse
+import uuid
+from app.processors import metrics
+
+CHUNK_SIZE = 1024 * 1024
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+_UNSAFE_NAME = re.compile(r'[\x00-\x1f\x7f"\\]')
+
+
+def save_stream(source, path, chunk_size=CHUNK_SIZE):
+    """Copy a file-like object to disk chunk by chunk instead of reading it whole"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(source, f, chunk_size)
+    return path
+
+
+def parse_range(header, size):
+    """Turn a single `Range: bytes=...` header into (start, end) inclusive, or None if unsatisfiable"""
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        # Suffix range: the final N bytes
+        start = max(0, size - int(last))
+        end = size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def safe_file_name(name):
+    """Drop control characters, quotes and backslashes, which have no business in a download name"""
+    return _UNSAFE_NAME.sub("", name).strip()
+
+
+def content_disposition(name):
+    """Build an attachment header for any file name.
+
+    Control characters and quotes are dropped so a name cannot break out of
+    the header; `filename` gets an ASCII stand-in for clients that ignore
+    `filename*`, which carries the real name percent-encoded as UTF-8.
+    """
+    name = safe_file_name(name) or "download"
+    fallback = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    fallback = re.sub(r"\s+", " ", fallback).strip()
+    if not fallback or fallback.startswith("."):
+        # Nothing but the extension survived, e.g. a name in another script
+        fallback = "download" + fallback
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{urllib.parse.quote(name)}"
+
+
+def send_file(handler, path, content_type, download_name=None):
+    """Answer GET/HEAD for a file on disk, honouring Range, without loading it into memory.
+
+    The body goes out with socket.sendfile, so the kernel copies file pages
+    to the socket and the process only ever holds headers.
+    """
+    path = Path(path)
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        handler.send_error(404, "File not found")
+        return
+
+    start, end = 0, size - 1
+    status = 200
+    range_header = handler.headers.get("Range")
+    if range_header and size:
+        requested = parse_range(range_header, size)
+        if requested is None:
+            handler.send_response(416)
+            handler.send_header("Content-Range", f"bytes */{size}")
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        start, end = requested
+        status = 206
+
+    length = end - start + 1 if size else 0
+    handler.send_response(status)
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(length))
+    handler.send_header("Accept-Ranges", "bytes")
+    if status == 206:
+        handler.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+    if download_name:
+        handler.send_header("Content-Disposition", content_disposition(download_name))
+    handler.end_headers()
+
+    if handler.command == "HEAD" or not length:
+        return
+    handler.wfile.flush()
+    with open(path, "rb") as f:
+        handler.connection.sendfile(f, offset=start, count=length)
+
+
+class FileServer:
+    """Background HTTP server that streams registered result files to the browser.
+
+    Streamlit's download_button needs the whole file as bytes in the server
+    process; links to this server let large results leave straight from disk.
+    Files are only reachable through the random token returned by register().
+    Per-stage metrics are served in the Prometheus text format at /metrics.
+    """
+
+    def __init__(self, host="0.0.0.0", port=8502, public_url=None):
+        self._files = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] == "/metrics":
+                    body = metrics.registry.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    if self.command != "HEAD":
+                        self.wfile.write(body)
+                    return
+                token = self.path.split("?", 1)[0].rsplit("/", 1)[-1]
+                with server._lock:
+                    entry = server._files.get(token)
+                if entry is None or not self.path.startswith("/files/"):
+                    self.send_error(404, "File not found")
+                    return
+                send_file(self, *entry)
+
+            do_HEAD = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.public_url = (public_url or f"http://localhost:{self.httpd.server_port}").rstrip("/")
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="file-server", daemon=True)
+        self._thread.start()
+
+    def register(self, path, download_name, content_type, base_url=None):
+        """Expose a file and return the URL it can be downloaded from.
+
+        `base_url` is how the browser reaches this server, public_url if not
+        given. Registering the same file again (e.g. on every rerun) reuses
+        its URL.
+        """
+        entry = (str(path), content_type, download_name)
+        with self._lock:
+            token = self._tokens.get(entry)
+            if token is None:
+                self._forget_missing()
+                token = uuid.uuid4().hex
+                self._files[token] = entry
+                self._tokens[entry] = token
+        return f"{(base_url or self.public_url).rstrip('/')}/files/{token}"
+
+    def _forget_missing(self):
+        """Drop registrations whose files have been deleted, e.g. expired jobs"""
+        for token, entry in list(self._files.items()):
+            if not os.path.exists(entry[0]):
+                del self._files[token]
+                del self._tokens[entry]
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
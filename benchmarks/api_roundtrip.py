@@ -0,0 +1,112 @@
+"""Round trip through the HTTP API with an in-process server and a stdlib client.
+
+Starts ApiServer on a free port with its own JobQueue, uploads a clip
+with chunked transfer encoding, polls the job and downloads every result,
+the no_vocals mix and a byte range of the vocals. Each download must match
+the file on disk byte for byte, or the script exits non-zero. It prints
+the upload and download rates and how much the process's peak RSS grew
+while the results were served. Run from the repository root:
+
+    python -m benchmarks.api_roundtrip --seconds 60
+"""
+import argparse
+import http.client
+import json
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.processors.job_queue import JobQueue, DONE, FAILED
+from app.server.api import ApiServer
+from benchmarks.chunked_accuracy import make_fixture
+
+
+def request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection("localhost", server.httpd.server_port, timeout=600)
+    try:
+        connection.request(method, path, body=body, headers=headers or {}, encode_chunked=body is not None)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def file_blocks(path, size=256 * 1024):
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(size)
+            if not block:
+                return
+            yield block
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60)
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        clip = make_fixture(temp_dir / "clip.wav", args.seconds)
+        server = ApiServer(JobQueue(temp_dir / "jobs"), host="localhost", port=0).start()
+        try:
+            start = time.perf_counter()
+            status, headers, body = request(server, "POST", "/jobs?filename=clip.wav", file_blocks(clip),
+                                            {"Transfer-Encoding": "chunked"})
+            upload_seconds = time.perf_counter() - start
+            if status != 202:
+                print(f"upload failed: {status} {body.decode()}")
+                sys.exit(1)
+            job_url = headers["Location"]
+            print(f"upload: {clip.stat().st_size / 1e6:.1f} MB in {upload_seconds:.2f}s, job {job_url}")
+
+            while True:
+                job = json.loads(request(server, "GET", job_url)[2])
+                if job["status"] in (DONE, FAILED):
+                    break
+                time.sleep(0.5)
+            if job["status"] == FAILED:
+                print(f"job failed: {job['error']}")
+                sys.exit(1)
+            print(f"job done in {job['finished_at'] - job['submitted_at']:.2f}s")
+
+            results = server.queue.get(job["id"]).result
+            rss_before = peak_rss_mb()
+            served = 0
+            start = time.perf_counter()
+            for name, url in list(job["files"].items()) + [("no_vocals", f"{job_url}/files/no_vocals")]:
+                status, headers, body = request(server, "GET", url)
+                # Mixes are written next to the stems
+                expected = Path(results[name]) if name in results else \
+                    Path(results["vocals"]).with_name(name + Path(results["vocals"]).suffix)
+                ok = status == 200 and body == expected.read_bytes()
+                failed |= not ok
+                served += len(body)
+                print(f"{name:>10}: {len(body) / 1e6:6.1f} MB {headers.get('Content-Type')} {'ok' if ok else 'FAIL'}")
+            download_seconds = time.perf_counter() - start
+
+            vocals = Path(results["vocals"]).read_bytes()
+            first, last = len(vocals) // 3, len(vocals) // 3 + 65535
+            status, headers, body = request(server, "GET", job["files"]["vocals"],
+                                            headers={"Range": f"bytes={first}-{last}"})
+            ok = status == 206 and body == vocals[first:last + 1] and \
+                headers.get("Content-Range") == f"bytes {first}-{last}/{len(vocals)}"
+            failed |= not ok
+            print(f"     range: {status} {headers.get('Content-Range')} {'ok' if ok else 'FAIL'}")
+            print(f"download: {served / 1e6:.1f} MB in {download_seconds:.2f}s, "
+                  f"peak RSS grew by {peak_rss_mb() - rss_before:.1f} MB")
+        finally:
+            server.shutdown()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
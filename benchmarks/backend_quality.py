@@ -0,0 +1,119 @@
+"""SDR and throughput of each inference backend against the float model.
+
+Each fixture is mixed from separately synthesized "vocals" and
+"accompaniment" tracks, so the true stems are known. Every backend
+separates the same mixes with the same random shifts, and the script
+reports per stem:
+
+    sdr       SDR of the backend's stem against the true stem, in dB
+    loss      float SDR minus backend SDR (positive: the backend is worse)
+    vs_float  SDR of the backend's stem against the float model's stem
+
+plus the real-time factor and the speedup over float. Exits non-zero when
+a backend loses more than SeparationEngine.MAX_SDR_LOSS_DB on any stem.
+The Demucs weights have to be in the local torch hub cache. Run from the
+repository root:
+
+    python -m benchmarks.backend_quality --preset balanced --seconds 30
+"""
+import argparse
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.config.presets import PRESETS, DEFAULT_PRESET, engine_options
+from app.processors.audio_io import FfmpegAudioReader
+from app.processors.separation_engine import BACKENDS, SeparationEngine
+from benchmarks.chunked_accuracy import deviation_db
+
+# (vocals, accompaniment) as ffmpeg lavfi sources; {d} is the duration
+FIXTURES = {
+    "tone_over_noise": (
+        "sine=frequency=330:beep_factor=4:duration={d}",
+        "anoisesrc=color=pink:amplitude=0.1:duration={d}",
+    ),
+    "vibrato_over_pulses": (
+        "aevalsrc=0.3*sin(2*PI*(220*t+20*sin(2*PI*5*t)/(2*PI*5))):duration={d}",
+        "aevalsrc=0.6*exp(-20*mod(t\\,0.5))*sin(2*PI*60*t)+0.02*random(0):duration={d}",
+    ),
+}
+
+
+def render(source, seconds, path):
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", source.format(d=seconds),
+        "-ac", "2", "-ar", "44100", "-y", str(path)
+    ], check=True)
+    with FfmpegAudioReader(path) as reader:
+        return reader.read_all()
+
+
+def sdr_db(reference, estimate):
+    return -deviation_db(reference.T, estimate.T)
+
+
+def separate(engine, mix, repeats):
+    """Best-of-`repeats` time and the stems; shifts are seeded so every backend gets the same ones"""
+    timings = []
+    for _ in range(repeats):
+        random.seed(0)
+        start = time.perf_counter()
+        stems = engine.two_stems(engine.separate(mix), "vocals")
+        timings.append(time.perf_counter() - start)
+    return min(timings), {name: wav.cpu().numpy() for name, wav in stems.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preset", default=DEFAULT_PRESET, choices=list(PRESETS))
+    parser.add_argument("--seconds", type=float, default=30, help="Length of each fixture")
+    parser.add_argument("--repeats", type=int, default=2, help="Timed runs per backend and fixture")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    args = parser.parse_args()
+    backends = ["float"] + [backend for backend in args.backends if backend != "float"]
+
+    fixtures = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, (vocals, accompaniment) in FIXTURES.items():
+            truth = {
+                "vocals": render(vocals, args.seconds, Path(temp_dir) / f"{name}_vocals.wav"),
+                "no_vocals": render(accompaniment, args.seconds, Path(temp_dir) / f"{name}_rest.wav"),
+            }
+            length = min(wav.shape[1] for wav in truth.values())
+            truth = {stem: wav[:, :length] for stem, wav in truth.items()}
+            fixtures[name] = (truth["vocals"] + truth["no_vocals"], truth)
+
+    results = {}
+    for backend in backends:
+        engine = SeparationEngine(device="cpu", **engine_options(args.preset, backend))
+        # One untimed pass so lazy initialisation is not billed to the first fixture
+        separate(engine, next(iter(fixtures.values()))[0][:, :engine.samplerate], 1)
+        for name, (mix, truth) in fixtures.items():
+            seconds, stems = separate(engine, mix, args.repeats)
+            results[backend, name] = (seconds, stems)
+
+    failed = False
+    print(f"preset {args.preset}, {args.seconds:.0f}s fixtures")
+    print(f"{'backend':>8} {'fixture':>20} {'stem':>10} {'sdr':>7} {'loss':>6} {'vs_float':>8} {'rtf':>6} {'speedup':>7}")
+    for backend in backends:
+        for name, (mix, truth) in fixtures.items():
+            seconds, stems = results[backend, name]
+            float_seconds, float_stems = results["float", name]
+            rtf = seconds / args.seconds
+            for stem, reference in truth.items():
+                sdr = sdr_db(reference, stems[stem])
+                loss = sdr_db(reference, float_stems[stem]) - sdr
+                agreement = sdr_db(float_stems[stem], stems[stem]) if backend != "float" else float("inf")
+                ok = loss <= SeparationEngine.MAX_SDR_LOSS_DB
+                failed |= not ok
+                print(f"{backend:>8} {name:>20} {stem:>10} {sdr:7.2f} {loss:6.2f} {agreement:8.1f} "
+                      f"{rtf:6.3f} {float_seconds / seconds:6.2f}x {'' if ok else 'FAIL'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
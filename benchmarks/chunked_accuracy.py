@@ -0,0 +1,69 @@
+"""Check that streamed (windowed) separation matches whole-file separation.
+
+Exits non-zero when any stem deviates by more than
+ChunkedSeparator.MAX_DEVIATION_DB. Run from the repository root:
+
+    python -m benchmarks.chunked_accuracy --seconds 120 --window 20 --overlap 2
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from app.processors.chunked_separator import ChunkedSeparator
+from app.processors.separation_engine import get_engine
+
+
+def make_fixture(path, seconds):
+    """Synthesize a clip with a voice-like tone over a noise bed, offline with ffmpeg"""
+    subprocess.run([
+        "ffmpeg", "-v", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=330:beep_factor=4:duration={seconds}",
+        "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.1:duration={seconds}",
+        "-filter_complex", "amix=inputs=2",
+        "-ac", "2", "-ar", "44100", "-y", str(path)
+    ], check=True)
+    return path
+
+
+def deviation_db(reference, estimate):
+    """Energy of (estimate - reference) relative to the reference, in dB"""
+    length = min(len(reference), len(estimate))
+    reference, estimate = reference[:length], estimate[:length]
+    error = np.sum((estimate - reference) ** 2)
+    return 10 * np.log10((error + 1e-12) / (np.sum(reference ** 2) + 1e-12))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=120)
+    parser.add_argument("--window", type=float, default=20)
+    parser.add_argument("--overlap", type=float, default=2)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        clip = make_fixture(temp_dir / "clip.wav", args.seconds)
+        whole = engine.separate_file(clip, temp_dir / "whole")
+        streamed = ChunkedSeparator(engine, args.window, args.overlap).separate_file(clip, temp_dir / "streamed")
+
+        failed = False
+        for name in whole:
+            reference, _ = sf.read(whole[name], dtype="float32")
+            estimate, _ = sf.read(streamed[name], dtype="float32")
+            deviation = deviation_db(reference, estimate)
+            ok = deviation <= ChunkedSeparator.MAX_DEVIATION_DB
+            failed |= not ok
+            print(f"{name:>10}: {deviation:7.1f} dB (limit {ChunkedSeparator.MAX_DEVIATION_DB} dB) "
+                  f"{'ok' if ok else 'FAIL'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
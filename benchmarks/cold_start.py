@@ -0,0 +1,139 @@
+"""Cold-start and rerun cost of the Streamlit app, optionally next to an older commit.
+
+Every measurement runs in a fresh process with the tree as working
+directory, using Streamlit's AppTest to execute app.py the way the server
+does:
+
+    import_s   importing the app's processing modules, without Streamlit
+    cold_s     first run of app.py: imports plus the first render
+    rerun_s    median of the later runs, i.e. what every widget interaction costs
+    heavy      which of torch, demucs and yt_dlp are imported after the import
+               and after the first run (the job workers' startup thread may be
+               importing torch in the background by then)
+
+Model warm-up is off for these runs (SPLITTER_WARMUP=0) so no weights are
+needed; --first-job measures it on its own.
+
+--ref REV measures a git worktree of REV as well, e.g. --ref HEAD~1 for
+before/after numbers. --first-job also times the first job in a fresh
+process (model load and a 10 s separation) with and without warm_up()
+beforehand; it needs the Demucs weights. Run from the repository root:
+
+    python -m benchmarks.cold_start --ref HEAD~1 --first-job
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+HEAVY_MODULES = ["torch", "demucs", "yt_dlp"]
+
+IMPORT_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app.processors.pipeline, app.processors.job_queue, app.processors.stem_cache, app.server.file_server
+print(json.dumps({"import_s": time.perf_counter() - start,
+                  "heavy": [m for m in HEAVY_MODULES if m in sys.modules]}))
+"""
+
+APP_CHILD = """
+import json, os, statistics, sys, threading, time
+sys.path.insert(0, os.getcwd())
+from streamlit.testing.v1 import AppTest
+runs = []
+heavy = None
+for _ in range(RUNS):
+    app_test = AppTest.from_file("app.py", default_timeout=600)
+    start = time.perf_counter()
+    app_test.run()
+    runs.append(time.perf_counter() - start)
+    if app_test.exception:
+        raise SystemExit(app_test.exception[0].message)
+    if heavy is None:
+        heavy = [m for m in HEAVY_MODULES if m in sys.modules]
+        # Reruns are timed once the job workers' startup has stopped competing for the CPU
+        for thread in threading.enumerate():
+            if thread.name == "separation-warmup":
+                thread.join()
+print(json.dumps({"cold_s": runs[0], "rerun_s": statistics.median(runs[1:]), "heavy": heavy}))
+"""
+
+FIRST_JOB_CHILD = """
+import json, time
+import numpy as np
+from app.config.presets import engine_options
+from app.processors.separation_engine import get_engine
+start = time.perf_counter()
+if WARM:
+    from app.processors.warmup import warm_up
+    warm_up(downloads=False)
+warm_s = time.perf_counter() - start
+wav = np.random.default_rng(0).normal(0, 0.1, (2, 441000)).astype(np.float32)
+start = time.perf_counter()
+get_engine(**engine_options()).separate(wav)
+print(json.dumps({"warm_s": warm_s, "first_job_s": time.perf_counter() - start}))
+"""
+
+
+def run_child(code, tree, env, **values):
+    for name, value in dict(values, HEAVY_MODULES=HEAVY_MODULES).items():
+        code = code.replace(name, repr(value))
+    process = subprocess.run(
+        [sys.executable, "-c", code], cwd=tree, env=env, capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Measurement in {tree} failed:\n{process.stderr[-2000:]}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def measure(tree, env, runs):
+    result = run_child(IMPORT_CHILD, tree, env)
+    app_result = run_child(APP_CHILD, tree, env, RUNS=runs)
+    app_result["app_heavy"] = app_result.pop("heavy")
+    result.update(app_result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ref", help="Also measure this git revision, e.g. HEAD~1")
+    parser.add_argument("--runs", type=int, default=5, help="app.py runs per process (first one is the cold start)")
+    parser.add_argument("--first-job", action="store_true", help="Time the first separation with and without warm-up")
+    args = parser.parse_args()
+
+    root = Path(__file__).resolve().parent.parent
+    with tempfile.TemporaryDirectory() as temp_dir:
+        env = dict(
+            os.environ, SPLITTER_DATA_DIR=str(Path(temp_dir) / "data"), SPLITTER_FILE_SERVER="0",
+            SPLITTER_WARMUP="0", PYTHONDONTWRITEBYTECODE="1"
+        )
+        trees = {"current": root}
+        if args.ref:
+            worktree = Path(temp_dir) / "ref"
+            subprocess.run(["git", "worktree", "add", "--detach", str(worktree), args.ref],
+                           cwd=root, check=True, capture_output=True)
+            trees[args.ref] = worktree
+        try:
+            rows = {name: measure(tree, env, args.runs) for name, tree in trees.items()}
+        finally:
+            if args.ref:
+                subprocess.run(["git", "worktree", "remove", "--force", str(worktree)], cwd=root, check=False)
+
+        print(f"{'tree':>10} {'import_s':>9} {'cold_s':>8} {'rerun_s':>8}  heavy after import / first run")
+        for name, row in rows.items():
+            print(f"{name:>10} {row['import_s']:9.3f} {row['cold_s']:8.3f} {row['rerun_s']:8.3f}  "
+                  f"{','.join(row['heavy']) or '-'} / {','.join(row['app_heavy']) or '-'}")
+
+        if args.first_job:
+            for warm in (False, True):
+                row = run_child(FIRST_JOB_CHILD, root, env, WARM=warm)
+                label = "with warm-up" if warm else "cold"
+                print(f"first job (model load and 10 s separation), {label}: {row['first_job_s']:.2f}s "
+                      f"(warm-up took {row['warm_s']:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Peak RSS of the upload and download paths must not grow with file size.
+
+Each scenario runs in a fresh process, so ru_maxrss is that scenario's own
+high-water mark. The upload scenarios copy a file on disk, i.e. they measure
+save_stream only: in the app, Streamlit has already buffered the whole
+upload in memory before save_uploaded_file runs. Exits non-zero if any streamed path grows RSS by more than
+--limit-mb. Run from the repository root:
+
+    python -m benchmarks.io_memory --sizes-mb 64 512
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import urllib.request
+from pathlib import Path
+
+from app.server.file_server import FileServer, save_stream
+
+READ_CHUNK = 1024 * 1024
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _make_file(path, size_mb):
+    with open(path, "wb") as f:
+        block = os.urandom(READ_CHUNK)
+        for _ in range(size_mb):
+            f.write(block)
+    return path
+
+
+def upload_streamed(source, temp_dir):
+    with open(source, "rb") as f:
+        save_stream(f, Path(temp_dir) / "upload_copy")
+
+
+def upload_buffered(source, temp_dir):
+    # The previous save_uploaded_file: read everything, then write
+    with open(source, "rb") as f, open(Path(temp_dir) / "upload_copy", "wb") as out:
+        out.write(f.read())
+
+
+def download_streamed(source, temp_dir):
+    server = FileServer("127.0.0.1", 0)
+    url = server.register(source, "result.bin", "application/octet-stream")
+    # The client runs in another process so only the server's memory is measured
+    client = multiprocessing.get_context("spawn").Process(target=_drain, args=(url,))
+    client.start()
+    client.join()
+    server.shutdown()
+
+
+def download_buffered(source, temp_dir):
+    # The previous download_file_button: data=f.read()
+    with open(source, "rb") as f:
+        data = f.read()
+    del data
+
+
+def _drain(url):
+    with urllib.request.urlopen(url) as response:
+        while response.read(READ_CHUNK):
+            pass
+
+
+def _measure(scenario, source, temp_dir, queue):
+    baseline = _peak_rss_mb()
+    scenario(source, temp_dir)
+    queue.put(_peak_rss_mb() - baseline)
+
+
+def measure(scenario, source, temp_dir):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_measure, args=(scenario, source, temp_dir, queue))
+    process.start()
+    growth = queue.get()
+    process.join()
+    return growth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[64, 512])
+    parser.add_argument("--limit-mb", type=float, default=32)
+    args = parser.parse_args()
+
+    scenarios = [
+        ("upload (streamed)", upload_streamed, True),
+        ("upload (buffered, before)", upload_buffered, False),
+        ("download (streamed)", download_streamed, True),
+        ("download (buffered, before)", download_buffered, False),
+    ]
+
+    failed = False
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for size_mb in args.sizes_mb:
+            source = _make_file(Path(temp_dir) / f"source_{size_mb}.bin", size_mb)
+            for name, scenario, checked in scenarios:
+                growth = measure(scenario, source, temp_dir)
+                verdict = ""
+                if checked:
+                    ok = growth <= args.limit_mb
+                    failed |= not ok
+                    verdict = "ok" if ok else "FAIL"
+                print(f"{size_mb:>6} MB  {name:<28} peak RSS +{growth:7.1f} MB  {verdict}")
+            source.unlink()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
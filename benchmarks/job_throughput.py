@@ -0,0 +1,95 @@
+"""Throughput under concurrent users: one demucs process per click vs the bounded job queue.
+
+Submits --jobs separations at once, as if that many sessions clicked at the
+same moment, and reports wall time and jobs per minute for both setups.
+Both sides produce vocals and no_vocals only: the CLI runs with
+--two-stems=vocals, so the queue runs with ALL_STEMS off.
+Run from the repository root:
+
+    python -m benchmarks.job_throughput --jobs 8 --workers 2 --seconds 20
+"""
+import argparse
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.config import settings
+from app.processors.audio_processor import AudioProcessor
+from app.processors.job_queue import JobQueue
+from app.processors.pipeline import run_audio_job
+from app.processors.separation_engine import get_engine, set_worker_threads
+from benchmarks.separation_latency import make_fixture
+
+
+def run_per_click(clips, temp_dir):
+    """Today's behaviour: every session spawns its own demucs process"""
+    def job(index_clip):
+        index, clip = index_clip
+        return AudioProcessor(clip, temp_dir / f"cli_{index}").run_demucs_cli()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clips)) as pool:
+        results = list(pool.map(job, enumerate(clips)))
+    if not all(results):
+        raise RuntimeError("Separation failed")
+    return time.perf_counter() - start
+
+
+def run_queued(clips, temp_dir, workers):
+    set_worker_threads(workers)
+    engine = get_engine()
+    jobs = JobQueue(temp_dir / "jobs", workers)
+
+    start = time.perf_counter()
+    job_ids = []
+    for index, clip in enumerate(clips):
+        staged = temp_dir / "staged" / str(index) / clip.name
+        staged.parent.mkdir(parents=True)
+        staged.write_bytes(clip.read_bytes())
+        job_ids.append(jobs.submit("audio", run_audio_job, staged, engine))
+    while any(jobs.get(job_id).active for job_id in job_ids):
+        time.sleep(0.1)
+    elapsed = time.perf_counter() - start
+
+    failed = [jobs.get(job_id).error for job_id in job_ids if jobs.get(job_id).error]
+    if failed:
+        raise RuntimeError(f"Separation failed: {failed[0]}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+    # The same two stems as the CLI's --two-stems=vocals, whatever SPLITTER_ALL_STEMS says
+    settings.ALL_STEMS = False
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        clips = [make_fixture(temp_dir / f"clip_{i}.wav", args.seconds) for i in range(args.jobs)]
+        per_click = run_per_click(clips, temp_dir)
+        queued = run_queued(clips, temp_dir, args.workers)
+
+    results = {
+        "jobs": args.jobs,
+        "workers": args.workers,
+        "clip_seconds": args.seconds,
+        "per_click_s": per_click,
+        "queued_s": queued,
+        "per_click_jobs_per_min": 60 * args.jobs / per_click,
+        "queued_jobs_per_min": 60 * args.jobs / queued,
+    }
+    print(f"{args.jobs} concurrent jobs of {args.seconds:.0f}s audio")
+    print(f"  process per click: {per_click:8.2f}s  ({results['per_click_jobs_per_min']:.1f} jobs/min)")
+    print(f"  job queue ({args.workers} workers): {queued:8.2f}s  ({results['queued_jobs_per_min']:.1f} jobs/min)")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Compare the verbose file mux, the fast file mux and vocals piped into ffmpeg.
+
+A simulated separation writes the vocals of a test video block by block at
+--rtf times real time (0.5: a 60 s clip takes 30 s to separate), so the mux
+modes see the same producer. For each mode the script reports:
+
+    total_s    from the first vocals block to a finished video
+    tail_s     from the last vocals block to a finished video
+    first_s    when the output could first be played or served (the piped
+               fragmented MP4 is playable from its first fragment; the file
+               modes only once they finish)
+    log_bytes  ffmpeg log text held in Python afterwards
+
+Exits non-zero if any output does not decode. Run from the repository root:
+
+    python -m benchmarks.mux_speed --duration 120 --rtf 0.25
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.processors.audio_io import FfmpegAudioReader, open_stem_writer
+from app.processors.video_processor import VideoProcessor
+from benchmarks.pipeline_stages import make_video_fixture
+
+BLOCK_SECONDS = 1.0
+
+
+def produce(wav, samplerate, rtf, writers, on_block=None):
+    """Write `wav` to every writer in 1 s blocks, paced like a separation at `rtf`"""
+    block = int(BLOCK_SECONDS * samplerate)
+    start = time.perf_counter()
+    for index, offset in enumerate(range(0, wav.shape[1], block)):
+        due = start + (index + 1) * BLOCK_SECONDS * rtf
+        time.sleep(max(0.0, due - time.perf_counter()))
+        for writer in writers:
+            writer.write(wav[:, offset:offset + block])
+        if on_block is not None:
+            on_block()
+
+
+def mux_from_file(video, wav, samplerate, rtf, work_dir, fast):
+    video_proc = VideoProcessor(video, work_dir)
+    start = time.perf_counter()
+    with open_stem_writer(work_dir, "vocals", samplerate, wav.shape[0]) as writer:
+        produce(wav, samplerate, rtf, [writer])
+    separated = time.perf_counter()
+    if not video_proc.combine_video_audio(str(writer.path), fast=fast):
+        raise RuntimeError(video_proc.last_error)
+    done = time.perf_counter()
+    return {
+        "total_s": done - start,
+        "tail_s": done - separated,
+        "first_s": done - start,
+        "log_bytes": len(video_proc.last_log or ""),
+        "path": video_proc.final_video,
+    }
+
+
+def mux_piped(video, wav, samplerate, rtf, work_dir):
+    video_proc = VideoProcessor(video, work_dir)
+    muxer = video_proc.open_muxer(samplerate)
+    first = []
+
+    def check_playable():
+        # The first fragment (moof) is written once ffmpeg has a keyframe's worth of both streams
+        if not first and video_proc.final_video.exists():
+            with open(video_proc.final_video, "rb") as f:
+                if b"moof" in f.read(1024 * 1024):
+                    first.append(time.perf_counter())
+
+    start = time.perf_counter()
+    produce(wav, samplerate, rtf, [muxer], check_playable)
+    separated = time.perf_counter()
+    if not muxer.close():
+        raise RuntimeError(video_proc.last_error)
+    done = time.perf_counter()
+    return {
+        "total_s": done - start,
+        "tail_s": done - separated,
+        "first_s": (first[0] if first else done) - start,
+        "log_bytes": len(muxer.encoder.stderr.text()),
+        "path": video_proc.final_video,
+    }
+
+
+def decodes(path):
+    return subprocess.run(["ffmpeg", "-v", "error", "-i", str(path), "-f", "null", "-"]).returncode == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=120, help="Test video length in seconds")
+    parser.add_argument("--rtf", type=float, default=0.25, help="Simulated separation real-time factor")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        video = make_video_fixture(temp_dir / "clip.mp4", args.duration)
+        with FfmpegAudioReader(video) as reader:
+            wav = reader.read_all()
+        samplerate = reader.samplerate
+
+        modes = {
+            "verbose_file": lambda work_dir: mux_from_file(video, wav, samplerate, args.rtf, work_dir, fast=False),
+            "fast_file": lambda work_dir: mux_from_file(video, wav, samplerate, args.rtf, work_dir, fast=True),
+            "piped": lambda work_dir: mux_piped(video, wav, samplerate, args.rtf, work_dir),
+        }
+        print(f"{args.duration:.0f}s video, separation simulated at {args.rtf}x real time")
+        print(f"{'mode':>14} {'total_s':>8} {'tail_s':>8} {'first_s':>8} {'log_bytes':>10}")
+        for name, run in modes.items():
+            result = run(temp_dir / name)
+            ok = decodes(result["path"])
+            failed |= not ok
+            print(f"{name:>14} {result['total_s']:8.2f} {result['tail_s']:8.2f} {result['first_s']:8.2f} "
+                  f"{result['log_bytes']:10d} {'ok' if ok else 'FAIL: output does not decode'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
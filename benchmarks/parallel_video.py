@@ -0,0 +1,141 @@
+"""Speedup of segmented separation against core count, and multi-track videos.
+
+A test video with keyframes every --keyframe-interval seconds is separated
+in-process as one piece, then with SegmentedSeparator on 1, 2, ... worker
+processes (by default up to the number of cores). Each pool separates a
+short clip untimed first, so model loading is not billed to it. The report
+gives wall time, speedup over the single piece, and parallel efficiency
+(speedup per core used). Every segmented run must stay within
+ChunkedSeparator.MAX_DEVIATION_DB of the single piece on every stem.
+
+Then a video with two audio tracks in different languages goes through
+process_video_file, segmented on the largest pool when that has more than
+one worker. The processed video must keep both tracks and their
+languages. The script exits non-zero if any check fails. shifts is forced
+to 0, as in the other accuracy checks. Run from the repository root:
+
+    python -m benchmarks.parallel_video --seconds 600 --segment 120
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import soundfile as sf
+
+from app.config import settings
+from app.config.presets import DEFAULT_PRESET, PRESETS, engine_options
+from app.processors.audio_io import probe_audio_tracks
+from app.processors.chunked_separator import ChunkedSeparator
+from app.processors.pipeline import process_video_file
+from app.processors.segmented import SegmentedSeparator
+from app.processors.separation_engine import get_engine
+from app.processors.video_processor import probe_keyframes
+from benchmarks.chunked_accuracy import deviation_db
+
+LANGUAGES = ("eng", "deu")
+
+
+def make_video(path, seconds, keyframe_interval, tracks=1):
+    """Small test picture with a tone over pink noise on each audio track, a different tone per track"""
+    command = ["ffmpeg", "-v", "error",
+               "-f", "lavfi", "-i", f"testsrc=size=160x120:rate=25:duration={seconds}"]
+    for track in range(tracks):
+        command += [
+            "-f", "lavfi", "-i", f"sine=frequency={330 + 110 * track}:beep_factor=4:duration={seconds}",
+            "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.1:duration={seconds}",
+        ]
+    mixes = ";".join(f"[{1 + 2 * track}:a][{2 + 2 * track}:a]amix=inputs=2[a{track}]" for track in range(tracks))
+    command += ["-filter_complex", mixes, "-map", "0:v"]
+    for track in range(tracks):
+        command += ["-map", f"[a{track}]", f"-metadata:s:a:{track}", f"language={LANGUAGES[track]}"]
+    command += ["-c:v", "libx264", "-g", str(int(25 * keyframe_interval)), "-c:a", "aac", "-ac", "2",
+                "-ar", "44100", "-shortest", "-y", str(path)]
+    subprocess.run(command, check=True)
+    return path
+
+
+def compare(reference, estimate):
+    """Worst deviation in dB over the stems"""
+    worst = -float("inf")
+    for name in reference:
+        expected, _ = sf.read(reference[name], dtype="float32")
+        actual, _ = sf.read(estimate[name], dtype="float32")
+        worst = max(worst, deviation_db(expected, actual))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=600)
+    parser.add_argument("--segment", type=float, default=120, help="Segment length in seconds")
+    parser.add_argument("--overlap", type=float, default=2)
+    parser.add_argument("--keyframe-interval", type=float, default=2)
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="Pool sizes to time (default: 1 up to the number of cores)")
+    parser.add_argument("--preset", default=DEFAULT_PRESET, choices=list(PRESETS))
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+    cores = os.cpu_count() or 1
+    workers = args.workers or list(range(1, cores + 1))
+
+    engine = get_engine(**dict(engine_options(args.preset), shifts=0))
+    failed = False
+    results = {"seconds": args.seconds, "segment": args.segment, "cores": cores, "preset": args.preset, "runs": []}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        video = make_video(temp_dir / "video.mp4", args.seconds, args.keyframe_interval)
+        warmup = make_video(temp_dir / "warmup.mp4", 2, args.keyframe_interval)
+        keyframes = probe_keyframes(video)
+
+        start = time.perf_counter()
+        reference = engine.separate_file(video, temp_dir / "whole", two_stems=None)
+        whole_s = time.perf_counter() - start
+        results["whole_s"] = whole_s
+        print(f"{args.seconds:.0f}s video, {len(keyframes)} keyframes, {cores} cores, preset {args.preset}")
+        print(f"  one piece, in-process: {whole_s:8.2f}s")
+
+        for count in workers:
+            separator = SegmentedSeparator(engine, args.segment, args.overlap, count)
+            separator.separate_file(warmup, temp_dir / f"warmup{count}", 2, two_stems=None)
+            start = time.perf_counter()
+            stems = separator.separate_file(video, temp_dir / f"segmented{count}", args.seconds,
+                                            two_stems=None, keyframes=keyframes)
+            seconds = time.perf_counter() - start
+            deviation = compare(reference, stems)
+            ok = deviation <= ChunkedSeparator.MAX_DEVIATION_DB
+            failed |= not ok
+            speedup = whole_s / seconds
+            efficiency = speedup / min(count, cores)
+            results["runs"].append({"workers": count, "seconds": seconds, "speedup": speedup,
+                                    "efficiency": efficiency, "deviation_db": deviation})
+            print(f"  {count:2d} worker(s), {len(separator.plan(args.seconds, keyframes))} segments: "
+                  f"{seconds:8.2f}s  {speedup:.2f}x, {efficiency:.0%} per core, "
+                  f"worst stem {deviation:.1f} dB (limit {ChunkedSeparator.MAX_DEVIATION_DB}) "
+                  f"{'ok' if ok else 'FAIL'}")
+
+        settings.ALL_AUDIO_TRACKS = True
+        settings.SEGMENT_WORKERS = max(workers)
+        settings.SEGMENT_SECONDS = args.segment
+        settings.SEGMENT_MIN_SECONDS = 0
+        multi = make_video(temp_dir / "tracks.mp4", min(args.seconds, 30), args.keyframe_interval, tracks=2)
+        start = time.perf_counter()
+        outputs = process_video_file(multi, temp_dir / "tracks", engine)
+        tracks_s = time.perf_counter() - start
+        languages = [track["language"] for track in probe_audio_tracks(outputs["video"])]
+        ok = languages == list(LANGUAGES) and "vocals_track1" in outputs
+        failed |= not ok
+        results["two_tracks_s"] = tracks_s
+        print(f"  two audio tracks: {tracks_s:.2f}s, processed video has tracks {languages} {'ok' if ok else 'FAIL'}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
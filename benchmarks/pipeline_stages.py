@@ -0,0 +1,305 @@
+"""Wall time, real-time factor and peak RSS of each pipeline stage and end to end.
+
+Fixtures are synthesized offline with ffmpeg, in several lengths and
+formats. Every (stage, fixture) pair runs in a fresh process, so its peak
+RSS is its own high-water mark and nothing warm leaks between stages.
+Separation is forced onto the CPU. The Demucs weights have to be in the
+local torch hub cache already; --stages without separate/end_to_end runs
+without them. model_load and separate run once per --presets entry, so
+the report gives each preset's real-time factor; end_to_end uses the
+default preset. Run from the repository root:
+
+    python -m benchmarks.pipeline_stages --durations 10 60 --json results.json
+    python -m benchmarks.pipeline_stages --compare results.json
+
+Results are written as JSON with a schema_version, so runs from different
+machines or commits can be compared row by row with --compare.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from queue import Empty
+
+from app.config.presets import PRESETS, DEFAULT_PRESET
+from benchmarks.separation_latency import make_fixture
+
+SCHEMA_VERSION = 2
+
+AUDIO_STAGES = ["decode", "separate", "end_to_end"]
+VIDEO_STAGES = ["extract_audio", "decode", "combine", "end_to_end"]
+ALL_STAGES = ["model_load", "extract_audio", "decode", "separate", "combine", "end_to_end"]
+PRESET_STAGES = ["model_load", "separate"]
+
+
+def make_video_fixture(path, seconds):
+    """Synthesize a small H.264/AAC test video with the same soundtrack as make_fixture"""
+    subprocess.run([
+        "ffmpeg", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=640x360:rate=25:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+        "-f", "lavfi", "-i", f"anoisesrc=amplitude=0.05:duration={seconds}",
+        "-filter_complex", "[1:a][2:a]amix=inputs=2,aformat=channel_layouts=stereo[a]",
+        "-map", "0:v", "-map", "[a]",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "128k", "-ar", "44100",
+        "-y", str(path)
+    ], check=True)
+    return path
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _engine(preset=None):
+    from app.config.presets import engine_options
+    from app.processors.separation_engine import get_engine
+
+    return get_engine(device="cpu", **engine_options(preset))
+
+
+# Each stage does its untimed setup and returns the callable that is timed
+
+def stage_model_load(fixture, work_dir):
+    from app.config.presets import engine_options
+    from app.processors.separation_engine import SeparationEngine
+
+    return lambda: SeparationEngine(device="cpu", **engine_options(fixture["preset"]))
+
+
+def stage_extract_audio(fixture, work_dir):
+    from app.processors.video_processor import VideoProcessor
+
+    video_proc = VideoProcessor(fixture["path"], work_dir)
+
+    def run():
+        if not video_proc.extract_audio():
+            raise RuntimeError(video_proc.last_error)
+    return run
+
+
+def stage_decode(fixture, work_dir):
+    from app.processors.audio_io import FfmpegAudioReader
+
+    def run():
+        with FfmpegAudioReader(fixture["path"]) as reader:
+            reader.read_all()
+    return run
+
+
+def stage_separate(fixture, work_dir):
+    from app.processors.audio_io import FfmpegAudioReader
+
+    engine = _engine(fixture["preset"])
+    with FfmpegAudioReader(fixture["path"], engine.samplerate, engine.audio_channels) as reader:
+        wav = reader.read_all()
+    return lambda: engine.separate_file(fixture["path"], work_dir, wav=wav)
+
+
+def stage_combine(fixture, work_dir):
+    from app.processors.video_processor import VideoProcessor
+
+    vocals = make_fixture(Path(work_dir) / "vocals.wav", fixture["duration_s"])
+    video_proc = VideoProcessor(fixture["path"], work_dir)
+
+    def run():
+        if not video_proc.combine_video_audio(str(vocals)):
+            raise RuntimeError(video_proc.last_error)
+    return run
+
+
+def stage_end_to_end(fixture, work_dir):
+    from app.processors.pipeline import process_video_file, separate_audio
+
+    engine = _engine(fixture["preset"])
+    if fixture["kind"] == "video":
+        return lambda: process_video_file(fixture["path"], work_dir, engine)
+    return lambda: separate_audio(fixture["path"], Path(work_dir) / "output", engine)
+
+
+STAGES = {
+    "model_load": stage_model_load,
+    "extract_audio": stage_extract_audio,
+    "decode": stage_decode,
+    "separate": stage_separate,
+    "combine": stage_combine,
+    "end_to_end": stage_end_to_end,
+}
+
+
+def _run_stage(stage, fixture, queue):
+    import logging
+
+    logging.basicConfig(level=logging.ERROR)
+    work_dir = tempfile.mkdtemp(prefix=f"{stage}-")
+    try:
+        run = STAGES[stage](fixture, work_dir)
+        setup_rss = _peak_rss_mb()
+        start = time.perf_counter()
+        run()
+        wall = time.perf_counter() - start
+        queue.put({"wall_s": wall, "peak_rss_mb": _peak_rss_mb(), "setup_rss_mb": setup_rss})
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def measure(stage, fixture):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_stage, args=(stage, fixture, queue))
+    process.start()
+    process.join()
+    try:
+        return queue.get(timeout=5)
+    except Empty:
+        return {"error": f"stage process exited with code {process.exitcode}"}
+
+
+def environment():
+    try:
+        import torch
+        torch_version = torch.__version__
+    except ImportError:
+        torch_version = None
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch_version,
+        "ffmpeg": subprocess.run(
+            ["ffmpeg", "-version"], capture_output=True, text=True
+        ).stdout.split("\n", 1)[0],
+    }
+
+
+def row_key(row):
+    return row["stage"], row["input"], row.get("preset")
+
+
+def print_header(compare):
+    print(f"{'stage':<14} {'preset':<9} {'input':<18} {'wall':>9} {'RTF':>7} {'peak RSS':>10}"
+          + (f" {'vs base':>8}" if compare else ""))
+
+
+def print_row(row, previous=None):
+    if "error" in row:
+        print(f"{row['stage']:<14} {row.get('preset') or '-':<9} {row['input']:<18} failed: {row['error']}")
+        return
+    rtf = f"{row['real_time_factor']:.3f}" if row.get("real_time_factor") is not None else "-"
+    line = (f"{row['stage']:<14} {row.get('preset') or '-':<9} {row['input']:<18} {row['wall_s']:>8.2f}s {rtf:>7} "
+            f"{row['peak_rss_mb']:>8.0f}MB")
+    if previous and "wall_s" in previous:
+        line += f" {row['wall_s'] / previous['wall_s']:>7.2f}x"
+    print(line)
+
+
+def make_fixtures(temp_dir, durations, audio_formats, video=True):
+    fixtures = []
+    for seconds in durations:
+        names = [("audio", f"audio_{seconds:g}s.{audio_format}") for audio_format in audio_formats]
+        if video:
+            names.append(("video", f"video_{seconds:g}s.mp4"))
+        for kind, name in names:
+            path = Path(temp_dir) / name
+            (make_fixture if kind == "audio" else make_video_fixture)(path, seconds)
+            fixtures.append({"kind": kind, "name": name, "path": str(path), "duration_s": seconds})
+    return fixtures
+
+
+def run_stage(stage, fixture, repeats):
+    runs = [measure(stage, fixture) for _ in range(repeats)]
+    ok = [run for run in runs if "error" not in run]
+    row = {"stage": stage, "input": fixture["name"], "kind": fixture["kind"],
+           "preset": fixture.get("preset"), "audio_seconds": fixture["duration_s"]}
+    if not ok:
+        row["error"] = runs[0]["error"]
+        return row
+    row.update(min(ok, key=lambda run: run["wall_s"]))
+    row["peak_rss_mb"] = max(run["peak_rss_mb"] for run in ok)
+    if fixture["duration_s"]:
+        row["real_time_factor"] = row["wall_s"] / fixture["duration_s"]
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--durations", type=float, nargs="+", default=[10, 60])
+    parser.add_argument("--audio-formats", nargs="+", default=["wav", "mp3"])
+    parser.add_argument("--no-video", action="store_true", help="Skip the video fixtures")
+    parser.add_argument("--stages", nargs="+", default=ALL_STAGES, choices=ALL_STAGES)
+    parser.add_argument("--presets", nargs="+", default=list(PRESETS), choices=list(PRESETS),
+                        help="Presets to run model_load and separate under")
+    parser.add_argument("--repeats", type=int, default=1,
+                        help="Runs per stage; the fastest is reported")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Earlier --json output to compare wall times against")
+    args = parser.parse_args()
+
+    # CPU only, also for the stage processes which inherit the environment
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline.get("schema_version") != SCHEMA_VERSION:
+            sys.exit(f"{args.compare} has schema_version {baseline.get('schema_version')}, "
+                     f"expected {SCHEMA_VERSION}")
+
+    previous = {row_key(row): row for row in (baseline or {}).get("results", [])}
+    rows = []
+    print_header(baseline)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        fixtures = make_fixtures(temp_dir, args.durations, args.audio_formats, video=not args.no_video)
+        for stage in args.stages:
+            if stage == "model_load":
+                # Not tied to an input: loading the weights once per worker process
+                stage_fixtures = [{"kind": "none", "name": "-", "path": None, "duration_s": None}]
+            else:
+                stage_fixtures = [
+                    fixture for fixture in fixtures
+                    if stage in (AUDIO_STAGES if fixture["kind"] == "audio" else VIDEO_STAGES)
+                ]
+            if stage in PRESET_STAGES:
+                stage_fixtures = [dict(fixture, preset=preset) for preset in args.presets for fixture in stage_fixtures]
+            elif stage == "end_to_end":
+                stage_fixtures = [dict(fixture, preset=DEFAULT_PRESET) for fixture in stage_fixtures]
+            for fixture in stage_fixtures:
+                row = run_stage(stage, fixture, args.repeats)
+                rows.append(row)
+                print_row(row, previous.get(row_key(row)))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    report = {
+        "schema_version": SCHEMA_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "parameters": {
+            "durations": args.durations,
+            "audio_formats": args.audio_formats,
+            "repeats": args.repeats,
+            "presets": {name: PRESETS[name] for name in args.presets},
+            "device": "cpu",
+        },
+        "results": rows,
+    }
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+    sys.exit(1 if any("error" in row for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
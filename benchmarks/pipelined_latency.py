@@ -0,0 +1,154 @@
+"""End-to-end latency of a URL job run stage after stage versus pipelined.
+
+A test video is served from a local HTTP server throttled to --mbps, so
+the download takes a realistic share of the job. Each mode runs the same
+URL through run_url_job in a fresh process with empty caches:
+
+    sequential  download, then decode, separate and mux (SPLITTER_PIPELINED_URLS=0)
+    pipelined   decode and separation start while yt-dlp is still downloading
+
+For each mode the script reports the time until the first separated audio
+is on disk (first_s), until all results exist (total_s), and the peak RSS.
+The end-to-end saving is largest when the download and the separation take
+about as long; the separator can never run ahead of the audio downloaded.
+Use --no-faststart to serve an MP4 with its index at the end, which cannot
+be decoded while it downloads and shows the fallback. Run from the
+repository root:
+
+    python -m benchmarks.pipelined_latency --duration 120 --mbps 8
+"""
+import argparse
+import functools
+import http.server
+import multiprocessing
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from queue import Empty
+
+from benchmarks.pipeline_stages import make_video_fixture
+
+THROTTLE_CHUNK = 64 * 1024
+
+
+class ThrottledHandler(http.server.SimpleHTTPRequestHandler):
+    bytes_per_second = None
+
+    def copyfile(self, source, outputfile):
+        start = time.perf_counter()
+        sent = 0
+        for chunk in iter(lambda: source.read(THROTTLE_CHUNK), b""):
+            try:
+                outputfile.write(chunk)
+            except ConnectionError:
+                # yt-dlp closes its probing request after the first bytes
+                return
+            sent += len(chunk)
+            time.sleep(max(0.0, start + sent / self.bytes_per_second - time.perf_counter()))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory, mbps):
+    handler = type("Handler", (ThrottledHandler,), {"bytes_per_second": mbps * 1e6 / 8})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=str(directory)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def first_audio_seconds(work_dir, start, stop):
+    """Poll the job directory until a separated vocals file holds audio"""
+    while not stop.is_set():
+        for path in Path(work_dir).glob("output/*/*/vocals.*"):
+            if path.stat().st_size > 64 * 1024:
+                return time.perf_counter() - start
+        time.sleep(0.05)
+    return None
+
+
+def run_mode(mode, url, temp_dir, results):
+    from app.config import settings
+    from app.processors.pipeline import run_url_job
+    from app.processors.separation_engine import get_engine
+
+    settings.PIPELINED_URLS = mode == "pipelined"
+    settings.DOWNLOAD_CACHE_DIR = Path(temp_dir) / "downloads"
+    engine = get_engine(device="cpu")
+    work_dir = Path(temp_dir) / "job"
+    work_dir.mkdir()
+
+    stop = threading.Event()
+    first = []
+    start = time.perf_counter()
+    watcher = threading.Thread(target=lambda: first.append(first_audio_seconds(work_dir, start, stop)))
+    watcher.start()
+    try:
+        run_url_job(work_dir, url, engine)
+        total = time.perf_counter() - start
+    finally:
+        stop.set()
+        watcher.join()
+    results.put({
+        "mode": mode,
+        "first_s": first[0],
+        "total_s": total,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=120, help="Test video length in seconds")
+    parser.add_argument("--mbps", type=float, default=8, help="Download bandwidth in Mbit/s")
+    parser.add_argument("--no-faststart", action="store_true", help="Serve an MP4 with its index at the end")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        fixture = make_video_fixture(temp_dir / "fixture.mp4", args.duration)
+        served = temp_dir / "www"
+        served.mkdir()
+        if args.no_faststart:
+            shutil.copyfile(fixture, served / "clip.mp4")
+        else:
+            subprocess.run(["ffmpeg", "-v", "error", "-i", str(fixture), "-c", "copy",
+                            "-movflags", "+faststart", "-y", str(served / "clip.mp4")], check=True)
+        size_mb = (served / "clip.mp4").stat().st_size / 1e6
+        server = serve(served, args.mbps)
+        url = f"http://127.0.0.1:{server.server_port}/clip.mp4"
+        print(f"{args.duration:.0f}s video, {size_mb:.1f} MB at {args.mbps} Mbit/s "
+              f"(download alone {size_mb * 8 / args.mbps:.1f}s)")
+
+        rows = []
+        for mode in ("sequential", "pipelined"):
+            results = context.Queue()
+            mode_dir = temp_dir / mode
+            mode_dir.mkdir()
+            process = context.Process(target=run_mode, args=(mode, url, mode_dir, results))
+            process.start()
+            process.join()
+            try:
+                rows.append(results.get(timeout=5))
+            except Empty:
+                print(f"{mode} failed with exit code {process.exitcode}")
+                server.shutdown()
+                sys.exit(1)
+        server.shutdown()
+
+    print(f"{'mode':>12} {'first_s':>8} {'total_s':>8} {'peak_rss_mb':>12}")
+    for row in rows:
+        first = f"{row['first_s']:8.2f}" if row["first_s"] is not None else f"{'-':>8}"
+        print(f"{row['mode']:>12} {first} {row['total_s']:8.2f} {row['peak_rss_mb']:12.0f}")
+    sequential, pipelined = rows
+    print(f"pipelined saves {sequential['total_s'] - pipelined['total_s']:.2f}s end to end")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Check that an interrupted windowed separation resumes from its checkpoint.
+
+The clip is separated once without interruption. It is then separated
+again with a ChunkCheckpoint, and the run is cut off by an exception
+after --interrupt-after chunks, as a crash or restart would. A third run
+resumes from the checkpoint. The resumed stems must be bit-identical to
+the uninterrupted ones, or the script exits non-zero. shifts is forced to
+0, because random shifts would differ between the runs anyway. Run from
+the repository root:
+
+    python -m benchmarks.resume --seconds 120 --window 20 --overlap 2 --interrupt-after 4
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from app.config.presets import DEFAULT_PRESET, PRESETS, engine_options
+from app.processors.checkpoints import ChunkCheckpoint
+from app.processors.chunked_separator import ChunkedSeparator
+from app.processors.separation_engine import SeparationEngine
+from benchmarks.chunked_accuracy import make_fixture
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CrashAfter:
+    """Tap writer that raises on the chunk after the first `chunks`"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def write(self, block):
+        if self.chunks == 0:
+            raise Interrupted()
+        self.chunks -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=120)
+    parser.add_argument("--window", type=float, default=20)
+    parser.add_argument("--overlap", type=float, default=2)
+    parser.add_argument("--interrupt-after", type=int, default=4, help="Chunks finished before the crash")
+    parser.add_argument("--preset", default=DEFAULT_PRESET, choices=list(PRESETS))
+    args = parser.parse_args()
+
+    engine = SeparationEngine(device="cpu", **dict(engine_options(args.preset), shifts=0))
+    separator = ChunkedSeparator(engine, args.window, args.overlap)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        clip = make_fixture(temp_dir / "clip.wav", args.seconds)
+
+        start = time.perf_counter()
+        reference = separator.separate_file(clip, temp_dir / "reference")
+        full_seconds = time.perf_counter() - start
+
+        checkpoint = ChunkCheckpoint(temp_dir / "checkpoints", "clip")
+        try:
+            separator.separate_file(clip, temp_dir / "interrupted", checkpoint=checkpoint,
+                                    taps={"vocals": CrashAfter(args.interrupt_after)})
+        except Interrupted:
+            # As the process exiting would, so the resumed run can take the checkpoint over
+            checkpoint.close()
+        else:
+            print(f"The clip has at most {args.interrupt_after} chunks; use a longer clip or fewer chunks")
+            sys.exit(1)
+
+        start = time.perf_counter()
+        resumed = separator.separate_file(clip, temp_dir / "resumed", checkpoint=ChunkCheckpoint(
+            temp_dir / "checkpoints", "clip"))
+        resume_seconds = time.perf_counter() - start
+
+        identical = True
+        for name in reference:
+            expected, _ = sf.read(reference[name], dtype="float32")
+            actual, _ = sf.read(resumed[name], dtype="float32")
+            same = expected.shape == actual.shape and np.array_equal(expected, actual)
+            identical &= same
+            print(f"{name:>10}: {'bit-identical' if same else 'DIFFERENT'}")
+
+    print(f"uninterrupted run: {full_seconds:.2f}s; resumed after {args.interrupt_after} chunks: "
+          f"{resume_seconds:.2f}s ({full_seconds - resume_seconds:.2f}s saved)")
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == "__main__":
+    main()
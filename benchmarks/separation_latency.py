@@ -0,0 +1,78 @@
+"""Per-job separation latency: demucs CLI subprocess vs the in-process engine.
+
+Run from the repository root:
+
+    python -m benchmarks.separation_latency --durations 10 30 --repeats 3
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from app.processors.audio_processor import AudioProcessor
+from app.processors.separation_engine import get_engine
+
+
+def make_fixture(path, seconds):
+    """Synthesize a stereo test clip offline with ffmpeg"""
+    subprocess.run([
+        "ffmpeg", "-v", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+        "-f", "lavfi", "-i", f"anoisesrc=amplitude=0.05:duration={seconds}",
+        "-filter_complex", "amix=inputs=2",
+        "-ac", "2", "-ar", "44100", "-y", str(path)
+    ], check=True)
+    return path
+
+
+def time_jobs(run_job, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        if not run_job():
+            raise RuntimeError("Separation failed")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--durations", type=float, nargs="+", default=[10, 30])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+
+        start = time.perf_counter()
+        engine = get_engine()
+        model_load = time.perf_counter() - start
+
+        for seconds in args.durations:
+            clip = make_fixture(temp_dir / f"clip_{int(seconds)}s.wav", seconds)
+            cli = time_jobs(lambda: AudioProcessor(clip, temp_dir / "cli").run_demucs_cli(), args.repeats)
+            warm = time_jobs(lambda: AudioProcessor(clip, temp_dir / "engine", engine=engine).run_demucs(), args.repeats)
+            results.append({
+                "duration_s": seconds,
+                "cli_median_s": statistics.median(cli),
+                "engine_median_s": statistics.median(warm),
+                "speedup": statistics.median(cli) / statistics.median(warm),
+            })
+
+    print(f"Model load (once per worker): {model_load:.2f}s")
+    print(f"{'clip':>8} {'cli':>10} {'engine':>10} {'speedup':>8}")
+    for row in results:
+        print(f"{row['duration_s']:>7.0f}s {row['cli_median_s']:>9.2f}s "
+              f"{row['engine_median_s']:>9.2f}s {row['speedup']:>7.2f}x")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"model_load_s": model_load, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Check that skipping near-silent regions matches full separation, and time both.
+
+The fixture alternates music with long near-silent gaps. Both runs use
+shifts=0 so the only difference is the skipping. Exits non-zero when any
+stem deviates by more than SilenceSkipper.MAX_DEVIATION_DB. Run from the
+repository root:
+
+    python -m benchmarks.silence_skip --music 20 --gap 30
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.processors.audio_io import FfmpegAudioReader
+from app.processors.separation_engine import get_engine
+from app.processors.silence import SilenceSkipper, DEFAULT_THRESHOLD_DB, find_active_regions
+from benchmarks.chunked_accuracy import deviation_db
+
+
+def make_fixture(path, music_seconds, gap_seconds):
+    """music, gap, music, gap: the gaps are a noise floor around -66 dBFS"""
+    music = (f"sine=frequency=330:beep_factor=4:duration={music_seconds}[s];"
+             f"anoisesrc=color=pink:amplitude=0.1:duration={music_seconds}[n];"
+             "[s][n]amix=inputs=2")
+    gap = f"anoisesrc=amplitude=0.0005:duration={gap_seconds}"
+    graph = (f"{music},asplit[m1][m2];{gap},asplit[g1][g2];"
+             "[m1][g1][m2][g2]concat=n=4:v=0:a=1")
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-filter_complex", graph,
+        "-ac", "2", "-ar", "44100", "-y", str(path)
+    ], check=True)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--music", type=float, default=20, help="Seconds per music section")
+    parser.add_argument("--gap", type=float, default=30, help="Seconds per near-silent gap")
+    parser.add_argument("--threshold-db", type=float, default=DEFAULT_THRESHOLD_DB)
+    args = parser.parse_args()
+
+    engine = get_engine(shifts=0)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        clip = make_fixture(Path(temp_dir) / "clip.wav", args.music, args.gap)
+        with FfmpegAudioReader(clip, engine.samplerate, engine.audio_channels) as reader:
+            wav = reader.read_all()
+
+    start = time.perf_counter()
+    full = engine.two_stems(engine.separate(wav), "vocals")
+    full = {name: source.cpu().numpy() for name, source in full.items()}
+    full_seconds = time.perf_counter() - start
+
+    skipper = SilenceSkipper(engine, threshold_db=args.threshold_db)
+    start = time.perf_counter()
+    skipped = skipper.separate(wav, "vocals")
+    skip_seconds = time.perf_counter() - start
+
+    print(f"skipped {skipper.skipped_fraction:.1%} of {wav.shape[1] / engine.samplerate:.0f}s; "
+          f"full {full_seconds:.2f}s, with skipping {skip_seconds:.2f}s "
+          f"({full_seconds / skip_seconds:.2f}x)")
+
+    # Active samples went through the model and should match to float precision;
+    # the total also includes the skipped near-silent parts
+    regions = find_active_regions(wav, engine.samplerate, args.threshold_db)
+    failed = False
+    for name in full:
+        active = deviation_db(
+            np.concatenate([full[name][:, start:end] for start, end in regions], axis=1).T,
+            np.concatenate([skipped[name][:, start:end] for start, end in regions], axis=1).T,
+        ) if regions else float("-inf")
+        deviation = deviation_db(full[name].T, skipped[name].T)
+        ok = deviation <= SilenceSkipper.MAX_DEVIATION_DB
+        failed |= not ok
+        print(f"{name:>10}: {deviation:7.1f} dB total, {active:7.1f} dB on active audio "
+              f"(limit {SilenceSkipper.MAX_DEVIATION_DB} dB) {'ok' if ok else 'FAIL'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
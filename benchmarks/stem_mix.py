@@ -0,0 +1,68 @@
+"""Time mixes summed from stored stems against separating the track again.
+
+The clip is separated once into every source and saved the way all-stem
+jobs save it. Every "no_<stem>" mix plus drums+bass is then derived from
+the stored files, and the derived no_vocals is compared with the two-stem
+no_vocals of the same separation, summed in memory. Every 16-bit file
+involved (three stems and the mix) rounds each sample by at most one LSB,
+so the script exits non-zero when any sample is off by more than that.
+Run from the repository root:
+
+    python -m benchmarks.stem_mix --seconds 60
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from app.processors.audio_io import FfmpegAudioReader
+from app.processors.separation_engine import get_engine
+from app.processors.stem_mixer import derive_mix, mix_stems
+from benchmarks.chunked_accuracy import deviation_db, make_fixture
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        clip = make_fixture(temp_dir / "clip.wav", args.seconds)
+        with FfmpegAudioReader(clip, engine.samplerate, engine.audio_channels) as reader:
+            wav = reader.read_all()
+
+        random.seed(0)
+        start = time.perf_counter()
+        sources = engine.separate(wav)
+        separate_seconds = time.perf_counter() - start
+        stems = engine.save_stems(sources, temp_dir / "all", shared_scale=True)
+        reference = engine.two_stems(sources, "vocals")["no_vocals"].cpu().numpy().T
+
+        print(f"separate: {separate_seconds:.2f}s ({separate_seconds / args.seconds:.3f} x real time)")
+        mixes = {}
+        for mix in [f"no_{name}" for name in engine.sources] + ["drums+bass"]:
+            start = time.perf_counter()
+            mixes[mix] = derive_mix(stems, mix, temp_dir / "mixes", samplerate=engine.samplerate,
+                                    channels=engine.audio_channels)
+            seconds = time.perf_counter() - start
+            print(f"{mix:>12}: {seconds:.2f}s ({separate_seconds / seconds:.0f}x faster than separating again)")
+
+        estimate, _ = sf.read(mixes["no_vocals"], dtype="float32")
+        limit = len(mix_stems("no_vocals", engine.sources)) + 1
+        error = np.abs(estimate - reference[:len(estimate)]).max() * 32768
+        ok = error <= limit and len(estimate) == len(reference)
+        print(f"derived no_vocals vs two-stem no_vocals: {deviation_db(reference, estimate):.1f} dB, "
+              f"peak error {error:.2f} LSB (limit {limit}) {'ok' if ok else 'FAIL'}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
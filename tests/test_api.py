@@ -0,0 +1,197 @@
+"""ApiServer over a real socket, with a stub job in place of separation"""
+import http.client
+import json
+import socket
+import threading
+import time
+from urllib.parse import quote, unquote
+
+import pytest
+
+from app.processors.job_queue import JobQueue
+from app.server import api
+from app.server.file_server import parse_range
+
+MAX_UPLOAD = 64 * 1024
+# Cleared by a test to keep its jobs running
+RELEASE = threading.Event()
+
+
+def copy_job(work_dir, job_fn, source, preset, cache=None, **options):
+    """Stands in for run_preset_job: the upload comes back as both stems"""
+    RELEASE.wait(10)
+    data = open(source, "rb").read()
+    result = {}
+    for name in ("vocals", "no_vocals"):
+        path = work_dir / f"{name}.wav"
+        path.write_bytes(data)
+        result[name] = str(path)
+    return result
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    RELEASE.set()
+    monkeypatch.setattr(api, "run_preset_job", copy_job)
+    server = api.ApiServer(JobQueue(tmp_path / "jobs"), host="127.0.0.1", port=0, max_upload_bytes=MAX_UPLOAD)
+    server.start()
+    yield server
+    RELEASE.set()
+    server.shutdown()
+
+
+def request(server, method, path, body=None, headers=None, encode_chunked=False):
+    connection = http.client.HTTPConnection("127.0.0.1", server.httpd.server_port, timeout=10)
+    try:
+        connection.request(method, path, body=body, headers=headers or {}, encode_chunked=encode_chunked)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def raw_status(server, data):
+    """Status code for hand-written request bytes, for requests http.client will not send"""
+    with socket.create_connection(("127.0.0.1", server.httpd.server_port), timeout=10) as sock:
+        sock.sendall(data)
+        return int(sock.recv(65536).split(b" ", 2)[1])
+
+
+def submit(server, body, name="song.wav", **kwargs):
+    status, _, response = request(server, "POST", f"/jobs?filename={quote(name)}", body, **kwargs)
+    assert status == 202, response
+    return json.loads(response)["id"]
+
+
+def wait_until_finished(server, job_id):
+    for _ in range(200):
+        status, _, body = request(server, "GET", f"/jobs/{job_id}")
+        job = json.loads(body)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("job did not finish")
+
+
+def test_content_length_upload(server):
+    job = wait_until_finished(server, submit(server, b"RIFF" * 1000))
+
+    assert job["status"] == "done" and job["label"] == "song.wav"
+    status, headers, body = request(server, "GET", job["files"]["vocals"])
+    assert status == 200 and body == b"RIFF" * 1000
+    assert headers["Content-Length"] == "4000" and headers["Accept-Ranges"] == "bytes"
+
+
+def test_chunked_upload(server):
+    parts = [b"a" * 5000, b"b" * 3, b"c" * 20000]
+    job = wait_until_finished(server, submit(server, iter(parts), encode_chunked=True))
+
+    status, _, body = request(server, "GET", job["files"]["no_vocals"])
+    assert status == 200 and body == b"".join(parts)
+
+
+def test_upload_without_length_is_411(server):
+    assert raw_status(server, b"POST /jobs?filename=a.wav HTTP/1.1\r\nHost: x\r\n\r\n") == 411
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_upload_over_the_limit_is_413(server, chunked):
+    body = b"x" * (MAX_UPLOAD + 1)
+    status, _, response = request(server, "POST", "/jobs?filename=a.wav", iter([body]) if chunked else body,
+                                  encode_chunked=chunked)
+
+    assert status == 413 and "limited" in json.loads(response)["error"]
+    # Nothing is left behind in the staging area
+    assert list(server.uploads_dir.glob("*/*")) == []
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/jobs", b"data"),                                 # no ?filename=
+    ("/jobs?filename=..", b"data"),
+    ("/jobs?filename=a.wav&preset=nope", b"data"),
+    ("/jobs?filename=a.wav&format=ogg", b"data"),
+    ("/jobs?filename=a.wav&kind=image", b"data"),
+    ("/jobs?filename=a.wav", b""),                      # empty upload
+])
+def test_bad_uploads_are_400(server, path, body):
+    status, _, response = request(server, "POST", path, body)
+
+    assert status == 400 and json.loads(response)["error"]
+
+
+def test_bad_content_length_is_400(server):
+    request_bytes = b"POST /jobs?filename=a.wav HTTP/1.1\r\nHost: x\r\nContent-Length: ten\r\n\r\n"
+    assert raw_status(server, request_bytes) == 400
+
+
+def test_url_job_needs_http_url(server):
+    for options in ({}, {"url": "file:///etc/passwd"}):
+        status, _, _ = request(server, "POST", "/jobs", json.dumps(options).encode(),
+                               {"Content-Type": "application/json"})
+        assert status == 400
+
+
+def test_results_of_unfinished_job_are_409(server):
+    RELEASE.clear()
+    job_id = submit(server, b"RIFF")
+
+    status, _, body = request(server, "GET", f"/jobs/{job_id}/files/vocals")
+
+    assert status == 409 and "Job is" in json.loads(body)["error"]
+    RELEASE.set()
+    assert wait_until_finished(server, job_id)["status"] == "done"
+
+
+def test_unknown_job_and_result_are_404(server):
+    job = wait_until_finished(server, submit(server, b"RIFF"))
+
+    assert request(server, "GET", "/jobs/nope")[0] == 404
+    assert request(server, "GET", f"/jobs/{job['id']}/files/drums")[0] == 404
+
+
+def test_range_requests(server):
+    data = bytes(range(256)) * 40
+    job = wait_until_finished(server, submit(server, data))
+    url = job["files"]["vocals"]
+
+    status, headers, body = request(server, "GET", url, headers={"Range": "bytes=100-199"})
+    assert status == 206 and body == data[100:200]
+    assert headers["Content-Range"] == f"bytes 100-199/{len(data)}"
+
+    status, headers, body = request(server, "GET", url, headers={"Range": "bytes=-10"})
+    assert status == 206 and body == data[-10:]
+
+    status, headers, body = request(server, "GET", url, headers={"Range": f"bytes={len(data)}-"})
+    assert status == 416 and body == b""
+    assert headers["Content-Range"] == f"bytes */{len(data)}"
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=990-2000", 1000) == (990, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=-5000", 1000) == (0, 999)
+    for header in ("bytes=1000-", "bytes=5-1", "bytes=-", "items=0-1", "bytes=0-1,5-6"):
+        assert parse_range(header, 1000) is None
+
+
+def test_download_name_from_any_filename(server):
+    name = 'Björk – Jóga\r\nSet-Cookie: x="1".wav'
+    job = wait_until_finished(server, submit(server, b"RIFF" * 100, name=name))
+    assert job["status"] == "done"
+
+    status, headers, body = request(server, "GET", job["files"]["vocals"])
+
+    assert status == 200 and body == b"RIFF" * 100
+    disposition = headers["Content-Disposition"]
+    assert "\r" not in disposition and "\n" not in disposition
+    assert 'filename="vocals_Bjork JogaSet-Cookie: x=1.wav"' in disposition
+    assert unquote(disposition.split("filename*=UTF-8''", 1)[1]) == "vocals_Björk – JógaSet-Cookie: x=1.wav"
+
+
+def test_percent_sign_in_filename_is_decoded_once(server):
+    status, _, body = request(server, "POST", "/jobs?filename=100%2525.wav", b"RIFF")
+    assert status == 202
+
+    assert wait_until_finished(server, json.loads(body)["id"])["label"] == "100%25.wav"
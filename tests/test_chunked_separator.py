@@ -0,0 +1,216 @@
+"""ChunkedSeparator's windowing, cross-fade and resume, with a stand-in engine instead of Demucs"""
+import shutil
+
+import numpy as np
+import pytest
+import soundfile as sf
+import torch
+
+from app.processors.checkpoints import ChunkCheckpoint
+from app.processors.chunked_separator import ChunkedSeparator
+
+SAMPLERATE = 8000
+WINDOW_SECONDS = 0.5
+OVERLAP_SECONDS = 0.1
+WINDOW = int(WINDOW_SECONDS * SAMPLERATE)
+OVERLAP = int(OVERLAP_SECONDS * SAMPLERATE)
+STEP = WINDOW - OVERLAP
+
+
+class LinearEngine:
+    """Every source is a fixed fraction of the mix, so stitched windows must equal the whole input scaled"""
+
+    samplerate = SAMPLERATE
+    audio_channels = 2
+    sources = ["drums", "bass", "other", "vocals"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def separate(self, wav):
+        self.calls += 1
+        mix = torch.as_tensor(np.asarray(wav))
+        return {name: mix * (index + 1) / 10 for index, name in enumerate(self.sources)}
+
+    def two_stems(self, sources, stem="vocals"):
+        return {stem: sources[stem], f"no_{stem}": sum(wav for name, wav in sources.items() if name != stem)}
+
+
+class WindowIndexEngine(LinearEngine):
+    """Every source of window i is the constant i, so the cross-fades can be read off the output"""
+
+    def separate(self, wav):
+        index = self.calls
+        self.calls += 1
+        return {name: torch.full(np.shape(wav), float(index)) for name in self.sources}
+
+
+def make_mix(frames, seed=0):
+    return np.random.default_rng(seed).uniform(-0.5, 0.5, (2, frames)).astype(np.float32)
+
+
+def blocks_of(wav, size):
+    return (wav[:, start:start + size] for start in range(0, wav.shape[1], size))
+
+
+def stitch(chunks):
+    chunks = list(chunks)
+    return {name: np.concatenate([chunk[name] for chunk in chunks], axis=1) for name in chunks[0]}
+
+
+@pytest.mark.parametrize("frames", [
+    OVERLAP // 2,                   # shorter than the overlap
+    WINDOW - 1,                     # a single short window
+    WINDOW,
+    WINDOW + 3 * STEP,              # ends exactly on a window
+    WINDOW + 3 * STEP + OVERLAP // 2,  # tail shorter than the overlap
+    5 * WINDOW + 123,
+])
+@pytest.mark.parametrize("block_frames", [STEP, 1000, 64])
+def test_windows_add_up_to_whole_input(frames, block_frames):
+    mix = make_mix(frames)
+    separator = ChunkedSeparator(LinearEngine(), WINDOW_SECONDS, OVERLAP_SECONDS)
+
+    stems = stitch(separator.iter_separated(blocks_of(mix, block_frames), two_stems=None))
+
+    assert sorted(stems) == sorted(LinearEngine.sources)
+    for index, name in enumerate(LinearEngine.sources):
+        np.testing.assert_allclose(stems[name], mix * (index + 1) / 10, atol=1e-6)
+
+
+def test_two_stems():
+    mix = make_mix(3 * WINDOW)
+    separator = ChunkedSeparator(LinearEngine(), WINDOW_SECONDS, OVERLAP_SECONDS)
+
+    stems = stitch(separator.iter_separated(blocks_of(mix, STEP), two_stems="vocals"))
+
+    assert sorted(stems) == ["no_vocals", "vocals"]
+    np.testing.assert_allclose(stems["vocals"], mix * 0.4, atol=1e-6)
+    np.testing.assert_allclose(stems["no_vocals"], mix * 0.6, atol=1e-6)
+
+
+def test_overlap_is_cross_faded_linearly():
+    engine = WindowIndexEngine()
+    separator = ChunkedSeparator(engine, WINDOW_SECONDS, OVERLAP_SECONDS)
+
+    vocals = stitch(separator.iter_separated(blocks_of(make_mix(WINDOW + 2 * STEP), STEP), two_stems=None))["vocals"]
+
+    assert engine.calls == 3
+    fade_in = np.linspace(0.0, 1.0, OVERLAP, dtype=np.float32)
+    for window in range(3):
+        start = window * STEP
+        # Window i alone between the overlaps, then a linear ramp from i to i + 1
+        np.testing.assert_array_equal(vocals[:, start + (OVERLAP if window else 0):start + STEP], window)
+        if window < 2:
+            np.testing.assert_allclose(vocals[0, start + STEP:start + WINDOW], window + fade_in, atol=1e-6)
+
+
+def test_resume_from_state_continues_the_stream():
+    mix = make_mix(6 * WINDOW + 77)
+    separator = ChunkedSeparator(LinearEngine(), WINDOW_SECONDS, OVERLAP_SECONDS)
+    whole = list(separator.iter_separated(blocks_of(mix, STEP), two_stems=None))
+
+    state = {}
+    done = []
+    for chunk in separator.iter_separated(blocks_of(mix, STEP), two_stems=None, state=state):
+        done.append(chunk)
+        if len(done) == 3:
+            break
+    # As after a restart: the saved tail, and the input from where the next window starts
+    resumed_state = {"pending": state["pending"]}
+    rest = separator.iter_separated(blocks_of(mix[:, len(done) * STEP:], STEP), two_stems=None,
+                                    state=resumed_state)
+    resumed = done + list(rest)
+
+    assert len(resumed) == len(whole)
+    for expected, actual in zip(whole, resumed):
+        for name in expected:
+            np.testing.assert_array_equal(expected[name], actual[name])
+
+
+def test_overlap_longer_than_half_window_is_rejected():
+    with pytest.raises(ValueError):
+        ChunkedSeparator(LinearEngine(), 1.0, 0.6)
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CrashAfter:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def write(self, block):
+        if self.chunks == 0:
+            raise Interrupted()
+        self.chunks -= 1
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg to decode the input")
+def test_interrupted_file_resumes_from_checkpoint(tmp_path):
+    clip = tmp_path / "clip.wav"
+    sf.write(clip, make_mix(8 * WINDOW + 500).T, SAMPLERATE, subtype="FLOAT")
+    engine = LinearEngine()
+    separator = ChunkedSeparator(engine, WINDOW_SECONDS, OVERLAP_SECONDS)
+    reference = separator.separate_file(clip, tmp_path / "reference")
+    windows = engine.calls
+
+    checkpoint = ChunkCheckpoint(tmp_path / "ckpt", "clip")
+    with pytest.raises(Interrupted):
+        separator.separate_file(clip, tmp_path / "interrupted", checkpoint=checkpoint, taps={"vocals": CrashAfter(3)})
+    # As the process exiting would, so the next run can take the checkpoint over
+    checkpoint.close()
+    engine.calls = 0
+    resumed = separator.separate_file(clip, tmp_path / "resumed", checkpoint=ChunkCheckpoint(tmp_path / "ckpt", "clip"))
+
+    # The three saved chunks are not separated again
+    assert engine.calls == windows - 3
+    for name in reference:
+        expected, _ = sf.read(reference[name], dtype="float32")
+        actual, _ = sf.read(resumed[name], dtype="float32")
+        np.testing.assert_array_equal(expected, actual)
+
+
+def test_concurrent_runs_on_one_key_leave_each_other_alone(tmp_path):
+    settings = {"window": WINDOW}
+    chunk = {"vocals": np.zeros((2, STEP), np.float32)}
+    pending = {"vocals": np.zeros((2, OVERLAP), np.float32)}
+    first = ChunkCheckpoint(tmp_path, "clip")
+    second = ChunkCheckpoint(tmp_path, "clip")
+    assert list(first.load(settings)) == []
+    first.save(chunk, pending)
+
+    # The second job finds the checkpoint in use and runs without it
+    assert list(second.load(settings)) == []
+    assert first.owned and not second.owned
+    second.save(chunk, pending)
+    second.discard()
+    assert (tmp_path / "clip" / "chunk_00000.npz").exists()
+    first.save(chunk, None)
+
+    # The first finishes and deletes its chunks; the second carries on without FileNotFoundError
+    first.discard()
+    second.save(chunk, pending)
+    assert not (tmp_path / "clip").exists()
+
+    # Gone with its owner, the checkpoint is free for the next run
+    third = ChunkCheckpoint(tmp_path, "clip")
+    assert list(third.load(settings)) == [] and third.owned
+    third.close()
+
+
+def test_chunks_of_a_dead_owner_are_taken_over(tmp_path):
+    settings = {"window": WINDOW}
+    chunk = {"vocals": np.ones((2, STEP), np.float32)}
+    first = ChunkCheckpoint(tmp_path, "clip")
+    list(first.load(settings))
+    first.save(chunk, {"vocals": np.ones((2, OVERLAP), np.float32)})
+    first.close()
+
+    second = ChunkCheckpoint(tmp_path, "clip")
+    saved = list(second.load(settings))
+
+    assert second.owned and len(saved) == 1
+    np.testing.assert_array_equal(saved[0][0]["vocals"], chunk["vocals"])
+    second.discard()
@@ -0,0 +1,89 @@
+"""FileServer: download headers for awkward file names, and memory that does not grow with file size"""
+import multiprocessing
+import os
+import urllib.request
+from urllib.parse import unquote
+
+import pytest
+
+from app.processors.metrics import _peak_rss_bytes
+from app.server.file_server import FileServer, content_disposition, save_stream
+
+SIZE_MB = 48
+# Streaming uses a few MB at most; reading the file whole would take SIZE_MB
+LIMIT_MB = 16
+
+
+def test_non_latin1_name_gets_ascii_fallback_and_utf8_name():
+    header = content_disposition("Björk – Jóga (vocals).mp3")
+
+    header.encode("latin-1")  # http.server writes headers as Latin-1
+    assert 'filename="Bjork Joga (vocals).mp3"' in header
+    assert unquote(header.split("filename*=UTF-8''", 1)[1]) == "Björk – Jóga (vocals).mp3"
+
+
+def test_name_in_another_script_keeps_its_extension():
+    assert 'filename="download.wav"' in content_disposition("日本語.wav")
+
+
+def test_control_characters_and_quotes_cannot_break_out_of_the_header():
+    header = content_disposition('a"\r\nSet-Cookie: x=1\\.wav')
+
+    assert "\r" not in header and "\n" not in header
+    assert header.count('"') == 2
+    assert 'filename="aSet-Cookie: x=1.wav"' in header
+
+
+def _peak_rss_mb():
+    return _peak_rss_bytes() / (1024 * 1024)
+
+
+def _save(source, target):
+    with open(source, "rb") as f:
+        save_stream(f, target)
+
+
+def _serve(source, target):
+    server = FileServer("127.0.0.1", 0)
+    url = server.register(source, "result.bin", "application/octet-stream")
+    # The client runs in another process so only the server's memory is measured
+    client = multiprocessing.get_context("spawn").Process(target=_fetch, args=(url, target))
+    client.start()
+    client.join()
+    server.shutdown()
+
+
+def _fetch(url, target):
+    with urllib.request.urlopen(url) as response, open(target, "wb") as f:
+        while True:
+            data = response.read(1024 * 1024)
+            if not data:
+                break
+            f.write(data)
+
+
+def _measure(scenario, source, target, queue):
+    baseline = _peak_rss_mb()
+    scenario(source, target)
+    queue.put(_peak_rss_mb() - baseline)
+
+
+@pytest.mark.parametrize("scenario", [_save, _serve], ids=["upload", "download"])
+def test_memory_does_not_grow_with_file_size(tmp_path, scenario):
+    source = tmp_path / "source.bin"
+    with open(source, "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(SIZE_MB):
+            f.write(block)
+    target = tmp_path / "copy.bin"
+
+    # A fresh process, so ru_maxrss is this scenario's own high-water mark
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(scenario, source, target, queue))
+    process.start()
+    growth = queue.get(timeout=120)
+    process.join()
+
+    assert growth <= LIMIT_MB
+    assert target.stat().st_size == source.stat().st_size
@@ -0,0 +1,113 @@
+"""LinkDownloader against a local HTTP server and file: URLs: what is fetched, cached and evicted"""
+import functools
+import http.server
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from app.processors.link_processor import LinkDownloader, check_url
+
+
+class CountingHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        self.server.requests.append(self.path)
+
+
+@pytest.fixture
+def media(tmp_path):
+    directory = tmp_path / "media"
+    directory.mkdir()
+    for seed, name in enumerate(("a", "b")):
+        wav = np.random.default_rng(seed).uniform(-0.5, 0.5, (8000 * (seed + 1), 2)).astype(np.float32)
+        sf.write(directory / f"{name}.wav", wav, 8000)
+    return directory
+
+
+@pytest.fixture
+def server(media):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(CountingHandler, directory=media))
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url_of(server, name):
+    return f"http://127.0.0.1:{server.server_port}/{name}"
+
+
+def test_check_url_rejects_file_urls_by_default(tmp_path, media):
+    for url in ("file:///etc/passwd", "ftp://example.com/a.mp4", "/etc/passwd"):
+        with pytest.raises(ValueError):
+            check_url(url)
+    assert check_url(media.joinpath("a.wav").as_uri(), allow_file_urls=True)
+
+    downloader = LinkDownloader(tmp_path / "job")
+    assert downloader.download_from_url(media.joinpath("a.wav").as_uri(), want_video=False) is None
+    assert "Unsupported URL scheme 'file'" in downloader.last_error
+
+
+def test_repeat_is_served_from_cache(tmp_path, server):
+    first = LinkDownloader(tmp_path / "job1", cache_dir=tmp_path / "cache")
+    path = first.download_from_url(url_of(server, "a.wav"), want_video=False)
+    assert path.startswith(str(tmp_path / "job1")) and not first.last_cached
+    fetched = list(server.requests)
+    assert fetched and set(fetched) == {"/a.wav"}
+
+    second = LinkDownloader(tmp_path / "job2", cache_dir=tmp_path / "cache")
+    repeat = second.download_from_url(url_of(server, "a.wav"), want_video=False)
+
+    # No second fetch, and the job gets a file of its own
+    assert second.last_cached and server.requests == fetched
+    assert repeat.startswith(str(tmp_path / "job2"))
+    assert open(repeat, "rb").read() == open(path, "rb").read()
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg to make the test video")
+def test_audio_is_served_from_cached_video(tmp_path, server, media):
+    subprocess.run(["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=d=1:s=64x48:r=10", "-f", "lavfi",
+                    "-i", "sine=d=1", "-c:v", "libx264", "-c:a", "aac", "-shortest", str(media / "clip.mp4")],
+                   check=True)
+    LinkDownloader(tmp_path / "job1", cache_dir=tmp_path / "cache").download_from_url(url_of(server, "clip.mp4"))
+    fetched = list(server.requests)
+
+    audio_only = LinkDownloader(tmp_path / "job2", cache_dir=tmp_path / "cache")
+    path = audio_only.download_from_url(url_of(server, "clip.mp4"), want_video=False)
+
+    assert audio_only.last_cached and server.requests == fetched
+    assert path.endswith(".mp4")
+
+
+def test_file_urls_with_allow_file_urls(tmp_path, media):
+    url = media.joinpath("a.wav").as_uri()
+    first = LinkDownloader(tmp_path / "job1", cache_dir=tmp_path / "cache", allow_file_urls=True)
+    second = LinkDownloader(tmp_path / "job2", cache_dir=tmp_path / "cache", allow_file_urls=True)
+
+    path = first.download_from_url(url, want_video=False)
+    repeat = second.download_from_url(url, want_video=False)
+
+    assert not first.last_cached and second.last_cached
+    assert open(path, "rb").read() == open(repeat, "rb").read() == media.joinpath("a.wav").read_bytes()
+
+
+def test_least_recently_used_download_is_evicted(tmp_path, server, media):
+    limit = media.joinpath("b.wav").stat().st_size + 100
+    first = LinkDownloader(tmp_path / "job1", cache_dir=tmp_path / "cache", cache_max_bytes=limit)
+    kept = first.download_from_url(url_of(server, "a.wav"), want_video=False)
+    LinkDownloader(tmp_path / "job2", cache_dir=tmp_path / "cache", cache_max_bytes=limit).download_from_url(
+        url_of(server, "b.wav"), want_video=False)
+
+    # "a" made room for "b", its record went with it, and the first job still has its file
+    assert [path.name for path in (tmp_path / "cache" / "media").iterdir()] == [
+        f"{first._cache_name(first.media_key(url_of(server, 'b.wav')))}.audio.wav"]
+    assert len(list((tmp_path / "cache" / "records").iterdir())) == 1
+    assert open(kept, "rb").read() == media.joinpath("a.wav").read_bytes()
+    again = LinkDownloader(tmp_path / "job3", cache_dir=tmp_path / "cache", cache_max_bytes=limit)
+    again.download_from_url(url_of(server, "a.wav"), want_video=False)
+    assert not again.last_cached
@@ -0,0 +1,123 @@
+"""SilenceSkipper with a stand-in engine that segments its input the way apply_model does"""
+import numpy as np
+import pytest
+import torch
+
+from app.processors.silence import SilenceSkipper, find_active_regions
+
+SAMPLERATE = 8000
+SEGMENT = SAMPLERATE // 2
+STRIDE = SEGMENT * 3 // 4
+
+
+class SegmentGridEngine:
+    """Runs a model on SEGMENT-long pieces every STRIDE samples and blends them with triangular weights.
+
+    The model scales each piece by a gain taken from the piece's own level,
+    so, as with Demucs, a sample's output depends on which pieces it falls
+    in and separating a slice only matches whole-file output on the grid.
+    """
+
+    samplerate = SAMPLERATE
+    audio_channels = 2
+    sources = ["drums", "bass", "other", "vocals"]
+    chunk_grid = (SEGMENT, STRIDE)
+
+    def __init__(self):
+        self.frames = 0
+        half = SEGMENT // 2
+        self.weight = np.concatenate([np.arange(1, half + 1), np.arange(SEGMENT - half, 0, -1)]).astype(np.float64)
+
+    def model(self, piece):
+        gain = 0.1 / (0.01 + np.sqrt(np.mean(piece ** 2)))
+        return {name: piece * gain * (index + 1) / 10 for index, name in enumerate(self.sources)}
+
+    def separate(self, wav):
+        wav = np.asarray(wav, dtype=np.float64)
+        length = wav.shape[1]
+        self.frames += length
+        out = {name: np.zeros_like(wav) for name in self.sources}
+        total = np.zeros(length)
+        for offset in range(0, length, STRIDE):
+            piece = wav[:, offset:offset + SEGMENT]
+            count = piece.shape[1]
+            # Zero-padded to a whole segment past the end, like apply_model's TensorChunk
+            sources = self.model(np.pad(piece, ((0, 0), (0, SEGMENT - count))))
+            for name, source in sources.items():
+                out[name][:, offset:offset + count] += source[:, :count] * self.weight[:count]
+            total[offset:offset + count] += self.weight[:count]
+        return {name: torch.from_numpy((source / total).astype(np.float32)) for name, source in out.items()}
+
+    def two_stems(self, sources, stem="vocals"):
+        return {stem: sources[stem], f"no_{stem}": sum(wav for name, wav in sources.items() if name != stem)}
+
+
+def make_mix(seed=0):
+    """Music and near-silent gaps (about -86 dBFS) of uneven lengths, so regions land off the grid"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for music, gap in ((1.3, 3.1), (0.7, 2.6), (1.9, 0.0)):
+        frames = int(music * SAMPLERATE)
+        # A changing level, so the stand-in's gain differs from piece to piece
+        envelope = 0.05 + 0.3 * np.abs(np.sin(np.arange(frames) * 2 * np.pi * 1.7 / SAMPLERATE))
+        parts.append(rng.uniform(-1, 1, (2, frames)) * envelope)
+        parts.append(rng.uniform(-1e-4, 1e-4, (2, int(gap * SAMPLERATE))))
+    return np.concatenate(parts, axis=1).astype(np.float32)
+
+
+def active_mask(mix):
+    mask = np.zeros(mix.shape[1], dtype=bool)
+    for start, end in find_active_regions(mix, SAMPLERATE):
+        mask[start:end] = True
+    return mask
+
+
+@pytest.mark.parametrize("two_stems", ["vocals", None])
+def test_active_regions_equal_whole_file_output(two_stems):
+    mix = make_mix()
+    engine = SegmentGridEngine()
+    whole = engine.separate(mix)
+    if two_stems:
+        whole = engine.two_stems(whole, two_stems)
+    engine.frames = 0
+    skipper = SilenceSkipper(engine)
+
+    skipped = skipper.separate(mix, two_stems)
+
+    active = active_mask(mix)
+    assert 0 < active.sum() < mix.shape[1]
+    assert sorted(skipped) == sorted(whole)
+    for name in whole:
+        np.testing.assert_allclose(skipped[name][:, active], whole[name].numpy()[:, active], atol=1e-6)
+    # The gaps never went through the model
+    assert engine.frames < mix.shape[1] and skipper.frames_skipped == mix.shape[1] - engine.frames
+
+
+@pytest.mark.parametrize("two_stems, silent", [("vocals", "no_vocals"), (None, "other")])
+def test_skipped_samples_land_only_in_the_accompaniment(two_stems, silent):
+    mix = make_mix(1)
+    skipped = SilenceSkipper(SegmentGridEngine()).separate(mix, two_stems)
+
+    quiet = ~active_mask(mix)
+    assert quiet.any()
+    np.testing.assert_array_equal(skipped[silent][:, quiet], mix[:, quiet])
+    for name, stem in skipped.items():
+        if name != silent:
+            assert not stem[:, quiet].any()
+
+
+def test_stand_in_only_matches_on_the_grid():
+    # Otherwise the equality above would hold for any slicing and prove nothing
+    mix = make_mix()
+    engine = SegmentGridEngine()
+    whole = engine.separate(mix)["vocals"].numpy()
+    # On the grid, inside the last stretch of music
+    start = 21 * STRIDE
+
+    on_grid = engine.separate(mix[:, start:start + 3 * SEGMENT])["vocals"].numpy()
+    off_grid = engine.separate(mix[:, start + 100:start + 3 * SEGMENT])["vocals"].numpy()
+
+    np.testing.assert_allclose(on_grid[:, SEGMENT:2 * SEGMENT], whole[:, start + SEGMENT:start + 2 * SEGMENT],
+                               atol=1e-6)
+    shifted = whole[:, start + 100 + SEGMENT:start + 100 + 2 * SEGMENT]
+    assert np.abs(off_grid[:, SEGMENT:2 * SEGMENT] - shifted).max() > 1e-3
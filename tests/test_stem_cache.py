@@ -0,0 +1,115 @@
+"""StemCache keys, LRU eviction and publishing, and job results that outlive their cache entry"""
+import os
+import shutil
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from app.processors.stem_cache import MANIFEST_NAME, StemCache
+
+SETTINGS = {"shifts": 1, "overlap": 0.25}
+
+
+def make_stems(directory, size=1000, seed=0):
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    stems = {}
+    for name in ("vocals", "no_vocals"):
+        path = directory / f"{name}.bin"
+        path.write_bytes(rng.bytes(size))
+        stems[name] = str(path)
+    return stems
+
+
+def age(cache, key, seconds_ago):
+    entry = cache.root / key
+    stamp = entry.stat().st_mtime - seconds_ago
+    os.utime(entry, (stamp, stamp))
+
+
+def test_key_depends_on_pcm_model_and_settings():
+    wav = np.random.default_rng(0).uniform(-1, 1, (2, 5000)).astype(np.float32)
+    key = StemCache.make_key(wav, "htdemucs", SETTINGS)
+
+    assert StemCache.make_key(wav.copy(), "htdemucs", dict(SETTINGS)) == key
+    assert StemCache.make_key(wav, "htdemucs_ft", SETTINGS) != key
+    assert StemCache.make_key(wav, "htdemucs", dict(SETTINGS, shifts=2)) != key
+    changed = wav.copy()
+    changed[1, 4999] += 1e-3
+    assert StemCache.make_key(changed, "htdemucs", SETTINGS) != key
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg to decode the input")
+def test_file_key_matches_key_of_decoded_track(tmp_path):
+    wav = np.random.default_rng(1).uniform(-0.5, 0.5, (2, 44100)).astype(np.float32)
+    path = tmp_path / "clip.wav"
+    sf.write(path, wav.T, 44100, subtype="FLOAT")
+
+    assert StemCache.make_file_key(path, "htdemucs", SETTINGS, 44100, 2) == \
+        StemCache.make_key(wav, "htdemucs", SETTINGS)
+
+
+def test_miss_then_hit(tmp_path):
+    cache = StemCache(tmp_path / "cache", 1 << 20)
+    assert cache.lookup("a" * 64) is None
+    assert cache.restore("a" * 64, tmp_path / "job") is None
+
+    stems = make_stems(tmp_path / "job1")
+    cache.store("a" * 64, stems)
+    restored = cache.restore("a" * 64, tmp_path / "job2")
+
+    assert sorted(restored) == ["no_vocals", "vocals"]
+    for name, path in restored.items():
+        assert path.startswith(str(tmp_path / "job2"))
+        assert open(path, "rb").read() == open(stems[name], "rb").read()
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    # Room for three entries of 2000 bytes
+    cache = StemCache(tmp_path / "cache", 6500)
+    for index, key in enumerate("abc"):
+        cache.store(key * 64, make_stems(tmp_path / f"job{key}", seed=index))
+        age(cache, key * 64, 100 - index * 10)
+    # Reading "a" makes it the most recent, so "b" is the oldest now
+    assert cache.lookup("a" * 64)
+
+    cache.store("d" * 64, make_stems(tmp_path / "jobd", seed=3))
+
+    assert cache.lookup("b" * 64) is None
+    assert cache.lookup("a" * 64) and cache.lookup("c" * 64) and cache.lookup("d" * 64)
+
+
+def test_entries_are_published_whole(tmp_path):
+    cache = StemCache(tmp_path / "cache", 1 << 20)
+    # An entry without a manifest, as a crashed writer would leave in place, is never served
+    half = cache.root / ("e" * 64)
+    half.mkdir()
+    (half / "vocals.bin").write_bytes(b"partial")
+    assert cache.lookup("e" * 64) is None
+
+    first = make_stems(tmp_path / "job1", seed=1)
+    cache.store("f" * 64, first)
+    cache.store("f" * 64, make_stems(tmp_path / "job2", seed=2))
+
+    # The first publisher wins, and no staging directories are left behind
+    restored = cache.restore("f" * 64, tmp_path / "job3")
+    assert open(restored["vocals"], "rb").read() == open(first["vocals"], "rb").read()
+    assert list(cache.tmp_dir.iterdir()) == []
+    assert (cache.root / ("f" * 64) / MANIFEST_NAME).exists()
+
+
+def test_results_survive_eviction(tmp_path):
+    cache = StemCache(tmp_path / "cache", 2500)
+    separated = make_stems(tmp_path / "jobA", seed=1)
+    cache.store("a" * 64, separated)
+    restored = cache.restore("a" * 64, tmp_path / "jobB")
+    expected = {name: open(path, "rb").read() for name, path in restored.items()}
+
+    # One more entry over the limit evicts "a"
+    cache.store("b" * 64, make_stems(tmp_path / "jobC", seed=2))
+    assert cache.lookup("a" * 64) is None
+
+    for name in ("vocals", "no_vocals"):
+        assert open(separated[name], "rb").read() == expected[name]
+        assert open(restored[name], "rb").read() == expected[name]